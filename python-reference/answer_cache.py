@@ -0,0 +1,380 @@
+"""
+Answer Cache
+Stale-while-revalidate cache of full RAG answers in front of rag_query.
+
+Answers are keyed by canonical query (canonicalize.answer_key, which
+keeps question words and comparison order). A fresh entry is returned
+directly. Once it is older than the TTL it turns stale: it is still
+served instantly, and the key is queued for regeneration in the
+background. Only entries past the stale window are recomputed while the
+user waits, and concurrent misses for one key share a single computation.
+
+Background regeneration must never compete with foreground traffic for
+the Groq/Ollama quota:
+
+- one worker, limited by a token bucket (ANSWER_REFRESH_PER_MINUTE)
+- it waits until no foreground computation is running and none started
+  for ANSWER_REFRESH_IDLE seconds, and until can_refresh() allows it
+  (rag_system passes "the Groq breaker is closed")
+- the most popular stale keys are regenerated first; popularity is an
+  exponentially decayed hit count, and keys below
+  ANSWER_REFRESH_MIN_HITS are left to expire instead
+
+Cached answers of any age also back the circuit-breaker fallback chain
+(see fallback.py).
+
+Usage:
+    python answer_cache.py     # simulated Zipf traffic with short TTLs
+
+Configuration (environment):
+    ANSWER_CACHE                "0" disables the cache (default on)
+    ANSWER_CACHE_TTL            seconds an answer is fresh (default 3600)
+    ANSWER_CACHE_STALE          further seconds a stale answer is served (default 86400)
+    ANSWER_CACHE_SIZE           maximum entries (default 10000)
+    ANSWER_CACHE_HALF_LIFE      popularity half-life in seconds (default 3600)
+    ANSWER_REFRESH_PER_MINUTE   background regenerations per minute (default 6)
+    ANSWER_REFRESH_IDLE         foreground quiet time before a regeneration (default 2)
+    ANSWER_REFRESH_MIN_HITS     decayed hits a key needs to be regenerated (default 2)
+"""
+
+import heapq
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from canonicalize import answer_key
+
+# Stale keys waiting for regeneration at most (further ones are dropped until the queue drains)
+MAX_QUEUED_REFRESHES = 256
+
+
+@dataclass
+class CacheEntry:
+    query: str                   # most recent raw question for this key (regenerated as asked)
+    result: dict
+    created: float
+    popularity: float = 0.0      # exponentially decayed hit count
+    touched: float = 0.0         # time popularity was last decayed
+    queued: bool = False
+
+
+@dataclass
+class AnswerCacheStats:
+    hits: int = 0
+    stale_hits: int = 0
+    misses: int = 0
+    shared_misses: int = 0       # misses that waited for another caller's computation
+    uncacheable: int = 0         # degraded/unavailable answers that were not stored
+    evictions: int = 0
+    refreshes: int = 0
+    refresh_failures: int = 0
+    refreshes_dropped: int = 0   # keys below the popularity threshold or behind a full queue
+
+    def summary(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "lookups": lookups,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+            "shared_misses": self.shared_misses,
+            "uncacheable": self.uncacheable,
+            "evictions": self.evictions,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "refreshes_dropped": self.refreshes_dropped,
+        }
+
+
+def cacheable(result: dict) -> bool:
+    """Degraded answers (backend outage) are served but never stored"""
+    metrics = result.get("metrics", {})
+    return not metrics.get("degraded") and metrics.get("gate_action") != "unavailable"
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (0 if one is available now)"""
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+
+class AnswerCache:
+    """Stale-while-revalidate answer cache with a rate-limited background refresher"""
+
+    def __init__(self, compute: Callable[[str, str], dict], ttl_s: float = 3600.0, stale_s: float = 86400.0,
+                 max_entries: int = 10000, half_life_s: float = 3600.0, refresh_per_minute: float = 6.0,
+                 refresh_idle_s: float = 2.0, min_refresh_hits: float = 2.0,
+                 can_refresh: Callable[[], bool] = lambda: True, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            compute: Function(query, category) -> rag_query-shaped result (the uncached pipeline).
+                Background refreshes call it too, so it must not touch per-caller state
+                such as a typing session's prefetch
+            ttl_s: Age after which an answer is stale
+            stale_s: Further age during which a stale answer is still served
+            max_entries: Maximum cached answers (least recently used evicted first)
+            half_life_s: Half-life of the popularity score
+            refresh_per_minute: Background regenerations allowed per minute
+            refresh_idle_s: Foreground quiet time required before a regeneration
+            min_refresh_hits: Popularity a stale key needs to be regenerated
+            can_refresh: Extra condition for background work (e.g. the LLM breaker is closed)
+        """
+        self.compute = compute
+        self.ttl_s = ttl_s
+        self.stale_s = stale_s
+        self.max_entries = max_entries
+        self.half_life_s = half_life_s
+        self.refresh_idle_s = refresh_idle_s
+        self.min_refresh_hits = min_refresh_hits
+        self.can_refresh = can_refresh
+        self.clock = clock
+        self.bucket = TokenBucket(refresh_per_minute / 60.0, clock=clock)
+        self.stats = AnswerCacheStats()
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._inflight: dict[str, Future] = {}
+        self._queue: list = []                 # (-popularity, sequence, key)
+        self._sequence = 0
+        self._foreground = 0                   # foreground computations running
+        self._last_foreground = float("-inf")
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._worker: Optional[threading.Thread] = None
+        self._closed = False
+
+    @classmethod
+    def from_env(cls, compute: Callable[[str, str], dict],
+                 can_refresh: Callable[[], bool] = lambda: True) -> "AnswerCache":
+        return cls(
+            compute,
+            ttl_s=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+            stale_s=float(os.getenv("ANSWER_CACHE_STALE", "86400")),
+            max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "10000")),
+            half_life_s=float(os.getenv("ANSWER_CACHE_HALF_LIFE", "3600")),
+            refresh_per_minute=float(os.getenv("ANSWER_REFRESH_PER_MINUTE", "6")),
+            refresh_idle_s=float(os.getenv("ANSWER_REFRESH_IDLE", "2")),
+            min_refresh_hits=float(os.getenv("ANSWER_REFRESH_MIN_HITS", "2")),
+            can_refresh=can_refresh,
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _touch(self, entry: CacheEntry, now: float) -> None:
+        entry.popularity = entry.popularity * 0.5 ** ((now - entry.touched) / self.half_life_s) + 1
+        entry.touched = now
+
+    def _served(self, entry: CacheEntry, status: str, start: float) -> dict:
+        now = self.clock()
+        return {**entry.result, "metrics": {
+            **entry.result.get("metrics", {}),
+            "total_response_time": now - start,
+            "cache": status,
+            "cache_age_s": round(now - entry.created, 3),
+        }}
+
+    def get(self, query: str, category: str = "all", compute: Optional[Callable[[], dict]] = None) -> dict:
+        """
+        Answer a question from the cache, computing it on a miss.
+
+        Args:
+            query: The user's question
+            category: Query category passed to compute
+            compute: This caller's computation for a miss (default compute(query, category)),
+                e.g. one that reuses the caller's prefetched retrieval
+
+        Returns:
+            The rag_query result; metrics["cache"] is "hit", "stale", "miss" (computed
+            by this call) or "shared" (a miss that waited for another caller's computation)
+        """
+        start = self.clock()
+        key = answer_key(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = start - entry.created
+                if age < self.ttl_s + self.stale_s:
+                    self._entries.move_to_end(key)
+                    entry.query = query
+                    self._touch(entry, start)
+                    if age < self.ttl_s:
+                        self.stats.hits += 1
+                        return self._served(entry, "hit", start)
+                    self.stats.stale_hits += 1
+                    self._schedule(key, entry)
+                    return self._served(entry, "stale", start)
+            self.stats.misses += 1
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+                self._foreground += 1
+                self._last_foreground = start
+            else:
+                self.stats.shared_misses += 1
+
+        if not owner:
+            result = future.result()
+            return {**result, "metrics": {**result.get("metrics", {}), "cache": "shared"}}
+        try:
+            result = compute() if compute is not None else self.compute(query, category)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                self._foreground -= 1
+                self._last_foreground = self.clock()
+                self._wakeup.notify_all()
+        with self._lock:
+            self._store(key, query, result, popularity=entry.popularity if entry is not None else 0.0)
+        future.set_result(result)
+        return {**result, "metrics": {**result.get("metrics", {}), "cache": "miss"}}
+
+    def _store(self, key: str, query: str, result: dict, popularity: float) -> bool:
+        if not cacheable(result):
+            self.stats.uncacheable += 1
+            return False
+        now = self.clock()
+        entry = CacheEntry(query, result, now, popularity, now)
+        self._touch(entry, now)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+        return True
+
+    def lookup(self, query: str) -> Optional[str]:
+        """
+        Cached answer of any age, or None (an answer fallback for outages).
+
+        Register with rag_system.fallbacks.register(cache.lookup).
+        """
+        with self._lock:
+            entry = self._entries.get(answer_key(query))
+            return entry.result.get("answer") if entry is not None else None
+
+    # ============================================
+    # Background refresh
+    # ============================================
+
+    def _schedule(self, key: str, entry: CacheEntry) -> None:
+        """Queue a stale key for regeneration (called with the lock held)"""
+        if entry.queued:
+            return
+        if entry.popularity < self.min_refresh_hits or len(self._queue) >= MAX_QUEUED_REFRESHES:
+            self.stats.refreshes_dropped += 1
+            return
+        entry.queued = True
+        self._sequence += 1
+        heapq.heappush(self._queue, (-entry.popularity, self._sequence, key))
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._refresh_loop, name="answer-refresh", daemon=True)
+            self._worker.start()
+        self._wakeup.notify_all()
+
+    def _refresh_delay(self) -> float:
+        """Seconds the worker must still wait before regenerating (called with the lock held)"""
+        if self._foreground:
+            return self.refresh_idle_s
+        idle_wait = self._last_foreground + self.refresh_idle_s - self.clock()
+        return max(idle_wait, self.bucket.wait_time(), 0.0)
+
+    def _refresh_loop(self) -> None:
+        while True:
+            with self._lock:
+                while not self._closed and (not self._queue or self._refresh_delay() > 0):
+                    self._wakeup.wait(timeout=self._refresh_delay() if self._queue else None)
+                if self._closed:
+                    return
+                if not self.can_refresh():
+                    # The backend is degraded: try again after a full idle period
+                    self._wakeup.wait(timeout=max(self.refresh_idle_s, 1.0))
+                    continue
+                _, _, key = heapq.heappop(self._queue)
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                entry.queued = False
+                if self.clock() - entry.created < self.ttl_s:
+                    continue  # already regenerated by a foreground miss
+                self.bucket.take()
+                query = entry.query
+
+            try:
+                result = self.compute(query, "refresh")
+            except Exception:
+                with self._lock:
+                    self.stats.refresh_failures += 1
+                continue
+            with self._lock:
+                current = self._entries.get(key)
+                popularity = current.popularity if current is not None else entry.popularity
+                if self._store(key, query, result, popularity):
+                    self.stats.refreshes += 1
+                    self._entries[key].popularity = popularity
+                else:
+                    self.stats.refresh_failures += 1
+
+    def close(self) -> None:
+        """Stop the background worker (queued refreshes are dropped)"""
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify_all()
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "queued_refreshes": len(self._queue),
+                    **self.stats.summary()}
+
+
+def simulate(seconds: float = 6.0, keys: int = 50, compute_ms: float = 50.0) -> dict:
+    """Zipf traffic against a cache with second-scale TTLs and a fake pipeline"""
+    def compute(query: str, category: str) -> dict:
+        time.sleep(compute_ms / 1000)
+        return {"answer": f"answer to {query}", "sources": [], "metrics": {"gate_action": "generate"}}
+
+    cache = AnswerCache(compute, ttl_s=1.0, stale_s=10.0, refresh_per_minute=120, refresh_idle_s=0.02,
+                        min_refresh_hits=2)
+    weights = [1 / (rank + 1) for rank in range(keys)]
+    latencies = []
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        query = f"dish number {random.choices(range(keys), weights)[0]}"
+        start = time.perf_counter()
+        cache.get(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.005)
+    cache.close()
+    latencies.sort()
+    return {**cache.summary(),
+            "p50_ms": round(latencies[len(latencies) // 2], 2),
+            "p99_ms": round(latencies[int(len(latencies) * 0.99)], 2)}
+
+
+if __name__ == "__main__":
+    print(f"🗄️ {simulate()}")
@@ -0,0 +1,274 @@
+"""
+Structured Attribute Index
+Typed facet columns for attribute-heavy questions ("high-protein low-carb foods").
+
+Questions like these are answered today by fuzzy semantic matching over
+free text, which needs a large top_k and long prompts. At index time
+this module extracts facets from each item's text and type into typed
+NumPy columns:
+
+    protein      int8   0-3  protein sources (meat, fish, egg, tofu, lentils, ...) or "protein-rich"
+    carbs        int8   0-3  starch/sugar sources (rice, noodles, bread, pastry, ...); 0 if "low-carb"
+    vegetarian   bool        stated vegetarian/vegan/meatless/plant-based, and no meat or fish
+    vegan        bool        stated vegan/plant-based, and no meat, fish, dairy, egg or honey
+    spicy        bool        spicy, chili, fiery, ...
+    sweet        bool        dessert type, syrup, sugar, ...
+    healthy      bool        healthy, nutritious, nutrient-dense, ...
+    methods      uint16      bitmask of cooking methods (fry, grill, bake, steam, ...)
+    type         int16       food type code ("dessert", "main_course", ...)
+
+At query time the canonical terms of the question (see canonicalize.py:
+"high-protein" -> high_protein, "without meat" -> no_meat) are mapped to
+constraints and evaluated as one vectorized mask over the columns. The
+mask filters the vector search results (rag_query over-fetches for such
+questions), so retrieval still decides relevance and order.
+
+Dietary flags are only set from positive evidence: an item that merely
+lacks meat words is not assumed to be vegetarian.
+
+Usage:
+    python attributes.py                           # constraints and match counts for TEST_QUERIES
+    python attributes.py "spicy vegetarian dishes"
+    python attributes.py --bench 1000000           # filter latency over N rows
+
+Configuration (environment):
+    FOODS_FILE          corpus the columns are extracted from (default data/foods.json)
+    ATTRIBUTE_FILTER    "0" disables attribute filtering in rag_query (default on)
+"""
+
+import argparse
+import re
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+import numpy as np
+
+from canonicalize import FOODS_FILE, default_canonicalizer, fold, lemmatize
+
+MAX_LEVEL = 3
+
+MEAT = frozenset("bacon beef chicken crab duck fish goat gosht ham hamburger hilsa keema lamb meat mutton "
+                 "pork prawn salmon sausage seafood shrimp spam squid trotter tuna turkey".split())
+DAIRY = frozenset("butter cheese chhena cream curd ghee milk paneer yogurt".split())
+PROTEIN = MEAT | frozenset("bean chickpea dal egg lentil paneer peanut quinoa tofu yogurt cheese".split())
+CARBS = frozenset("bhature bread bun cake cookie corn crepe dough dumpling flatbread flour macaroni naan "
+                  "noodle oat pancake paratha pasta pastry pie potato rice roti sugar syrup tortilla wheat".split())
+SPICY = frozenset("chili chilli fiery gochujang harissa jalapeno peppery spicy sriracha".split())
+SWEET = frozenset("caramel chocolate dessert honey sugar sweet syrup".split())
+HEALTHY = frozenset("healthy lean nutrient nutritious superfood wholesome".split())
+VEGETARIAN = frozenset("meatless vegan vegetarian veggie".split())
+ANIMAL = MEAT | DAIRY | frozenset(("egg", "honey"))
+
+# Cooking method lemmas -> method
+METHOD_WORDS = {
+    "fry": "fry", "grill": "grill", "barbecue": "grill", "bake": "bake", "tandoor": "bake",
+    "roast": "roast", "steam": "steam", "boil": "boil", "stew": "stew", "slow": "stew",
+    "braise": "braise", "ferment": "ferment", "raw": "raw", "smoke": "smoke", "poach": "poach",
+}
+METHODS = tuple(sorted(set(METHOD_WORDS.values())))
+METHOD_BITS = {method: 1 << i for i, method in enumerate(METHODS)}
+
+_WORD_RE = re.compile(r"\w+")
+
+
+@dataclass(frozen=True)
+class Constraint:
+    column: str
+    op: str          # "eq", "ge", "le", "bits" (any bit set) or "in"
+    value: object
+
+    def mask(self, column: np.ndarray) -> np.ndarray:
+        if self.op == "eq":
+            return column == self.value
+        if self.op == "ge":
+            return column >= self.value
+        if self.op == "le":
+            return column <= self.value
+        if self.op == "bits":
+            return (column & self.value) != 0
+        return np.isin(column, self.value)
+
+
+# Canonical query terms -> constraints
+TERM_CONSTRAINTS = {
+    "high_protein": Constraint("protein", "ge", 2),
+    "protein": Constraint("protein", "ge", 2),
+    "low_protein": Constraint("protein", "le", 0),
+    "low_carb": Constraint("carbs", "le", 1),
+    "no_carb": Constraint("carbs", "le", 0),
+    "high_carb": Constraint("carbs", "ge", 2),
+    "vegetarian": Constraint("vegetarian", "eq", True),
+    "no_meat": Constraint("vegetarian", "eq", True),
+    "meatless": Constraint("vegetarian", "eq", True),
+    "vegan": Constraint("vegan", "eq", True),
+    "no_dairy": Constraint("vegan", "eq", True),
+    "spicy": Constraint("spicy", "eq", True),
+    "no_spicy": Constraint("spicy", "eq", False),
+    "mild": Constraint("spicy", "eq", False),
+    "sweet": Constraint("sweet", "eq", True),
+    "no_sugar": Constraint("sweet", "eq", False),
+    "healthy": Constraint("healthy", "eq", True),
+    **{word: Constraint("methods", "bits", METHOD_BITS[method])
+       for word, method in METHOD_WORDS.items() if word != "tandoor"},
+}
+# Query terms that neither constrain nor count as unexplained content ("slow-cooked" -> slow, cook)
+NEUTRAL_TERMS = frozenset("cook cooked dish food make made prepared preparation".split())
+
+
+def _words(text: str) -> list[str]:
+    return [lemmatize(w) for w in _WORD_RE.findall(fold(text))]
+
+
+def extract_facets(item: dict) -> dict:
+    """Facet values of one food item (see module docstring)"""
+    words = _words(item.get("text", ""))
+    present = set(words)
+    folded = fold(item.get("text", ""))
+    type_terms = default_canonicalizer().terms(item.get("type") or "")
+    plant_based = re.search(r"plant[\s-]+based", folded) is not None
+    vegetarian = bool(present & VEGETARIAN or plant_based) and not present & MEAT
+    methods = 0
+    for word in present:
+        if word in METHOD_WORDS:
+            methods |= METHOD_BITS[METHOD_WORDS[word]]
+
+    protein = len(present & PROTEIN)
+    if re.search(r"protein[\s-]+rich|high[\s-]+protein|lean protein", folded):
+        protein = MAX_LEVEL
+    carbs = len(present & CARBS)
+    if re.search(r"low[\s-]+carb", folded):
+        carbs = 0
+    return {
+        "protein": min(protein, MAX_LEVEL),
+        "carbs": min(carbs, MAX_LEVEL),
+        "vegetarian": vegetarian,
+        "vegan": ("vegan" in present or plant_based) and not present & ANIMAL,
+        "spicy": bool(present & SPICY) and "mildly" not in present,
+        "sweet": bool(present & SWEET) or "dessert" in type_terms,
+        "healthy": bool(present & HEALTHY),
+        "methods": methods,
+        "type": type_terms[0] if type_terms else "",
+    }
+
+
+@dataclass
+class AttributeQuery:
+    constraints: list           # Constraint per recognised term
+    rest: list                  # canonical terms no constraint accounts for
+
+
+class AttributeIndex:
+    """Columnar facet table over the food items"""
+
+    COLUMN_TYPES = {"protein": np.int8, "carbs": np.int8, "vegetarian": np.bool_, "vegan": np.bool_,
+                    "spicy": np.bool_, "sweet": np.bool_, "healthy": np.bool_, "methods": np.uint16,
+                    "type": np.int16}
+
+    def __init__(self, items: Iterable[dict]):
+        """
+        Args:
+            items: Food items ({"id", "text", "region", "type"})
+        """
+        self.items: list[dict] = []
+        values = {name: [] for name in self.COLUMN_TYPES}
+        self.types: dict[str, int] = {}
+        for item in items:
+            facets = extract_facets(item)
+            facets["type"] = self.types.setdefault(facets["type"], len(self.types))
+            for name, value in facets.items():
+                values[name].append(value)
+            self.items.append(item)
+        self.columns = {name: np.array(values[name], dtype=dtype) for name, dtype in self.COLUMN_TYPES.items()}
+        self.positions = {str(item["id"]): i for i, item in enumerate(self.items)}
+
+    @classmethod
+    def from_foods(cls, path: Union[str, Path] = FOODS_FILE) -> "AttributeIndex":
+        from corpus_loader import iter_food_items
+
+        return cls(iter_food_items(path))
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def parse(self, query: str) -> AttributeQuery:
+        """Constraints stated in a question"""
+        constraints, rest, types = [], [], []
+        for term in default_canonicalizer().terms(query):
+            if term in TERM_CONSTRAINTS:
+                constraints.append(TERM_CONSTRAINTS[term])
+            elif term in self.types and term:
+                types.append(self.types[term])
+            elif term not in NEUTRAL_TERMS:
+                rest.append(term)
+        if types:
+            constraints.append(Constraint("type", "in", tuple(types)))
+        return AttributeQuery(list(dict.fromkeys(constraints)), rest)
+
+    def mask(self, constraints: list) -> np.ndarray:
+        """Rows satisfying every constraint (one vectorized comparison per constraint)"""
+        if not constraints:
+            return np.ones(len(self.items), dtype=bool)
+        selected = constraints[0].mask(self.columns[constraints[0].column])
+        for constraint in constraints[1:]:
+            selected &= constraint.mask(self.columns[constraint.column])
+        return selected
+
+    def filter_results(self, results: list[dict], attribute_query: AttributeQuery) -> list[dict]:
+        """
+        Drop search results that violate a constraint, keeping vector order.
+
+        Results of unknown items are kept; if nothing would remain the
+        results are returned unchanged.
+        """
+        if not attribute_query.constraints:
+            return results
+        selected = self.mask(attribute_query.constraints)
+        kept = [r for r in results
+                if str(r.get("id")) not in self.positions or selected[self.positions[str(r.get("id"))]]]
+        return kept or results
+
+    def facets(self, item_id: str) -> Optional[dict]:
+        row = self.positions.get(str(item_id))
+        if row is None:
+            return None
+        names = {code: name for name, code in self.types.items()}
+        facets = {name: column[row].item() for name, column in self.columns.items()}
+        facets["methods"] = [m for m in METHODS if facets["methods"] & METHOD_BITS[m]]
+        facets["type"] = names[facets["type"]]
+        return facets
+
+
+def benchmark(index: AttributeIndex, rows: int, constraints: list, repeat: int = 20) -> dict:
+    """Filter latency with the columns tiled to `rows` rows"""
+    tiled = AttributeIndex([])
+    tiled.items = [None] * rows
+    tiled.columns = {name: np.resize(column, rows) for name, column in index.columns.items()}
+    start = time.perf_counter()
+    for _ in range(repeat):
+        matched = int(tiled.mask(constraints).sum())
+    elapsed_ms = (time.perf_counter() - start) / repeat * 1000
+    return {"rows": rows, "constraints": len(constraints), "matched": matched, "ms": round(elapsed_ms, 3)}
+
+
+if __name__ == "__main__":
+    from query_sets import all_test_queries
+
+    parser = argparse.ArgumentParser(description="Extract and query structured food attributes")
+    parser.add_argument("queries", nargs="*", help="Questions to parse (default: TEST_QUERIES)")
+    parser.add_argument("--bench", type=int, metavar="N", help="Time the filter over N rows")
+    args = parser.parse_args()
+
+    attribute_index = AttributeIndex.from_foods()
+    print(f"🏷️ {len(attribute_index)} items, facets: {', '.join(AttributeIndex.COLUMN_TYPES)}")
+    queries = args.queries or [q for q, _ in all_test_queries()]
+    if args.bench:
+        parsed = attribute_index.parse(queries[0] if args.queries else "high-protein low-carb foods")
+        print(f"⏱️ {benchmark(attribute_index, args.bench, parsed.constraints)}")
+    else:
+        for query in queries:
+            parsed = attribute_index.parse(query)
+            matches = int(attribute_index.mask(parsed.constraints).sum()) if parsed.constraints else None
+            print(f"   {query!r}: {[(c.column, c.op, c.value) for c in parsed.constraints]} "
+                  f"rest={parsed.rest} matches={matches}")
@@ -0,0 +1,304 @@
+"""
+Benchmark History
+Append-only store of benchmark runs with statistical regression checks.
+
+Every benchmark run (cloud test suite, local performance test) appends
+one JSON line to the history file, keyed by git commit and a hash of the
+run configuration, holding the per-stage latency samples and a
+histogram. The compare command tests two runs stage by stage with a
+Mann-Whitney U test and a bootstrap confidence interval of the median
+ratio, and flags regressions beyond a threshold.
+
+Usage:
+    python bench_history.py list --system cloud
+    python bench_history.py compare --system cloud                # previous vs latest
+    python bench_history.py compare --baseline 1a2b3c --candidate latest --threshold 0.1
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import subprocess
+import sys
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+HISTORY_FILE = Path(os.getenv("BENCH_HISTORY", Path(__file__).parent / "bench_history.jsonl"))
+FORMAT_VERSION = 1
+
+# Log-spaced histogram buckets from 0.1 ms to ~100 s (shared so runs are comparable)
+HISTOGRAM_EDGES_MS = np.logspace(-1, 5, 25)
+# Raw samples kept per stage (a deterministic subsample beyond this)
+MAX_SAMPLES = 5000
+
+DEFAULT_THRESHOLD = 0.05   # relative slowdown of the median that counts as a regression
+DEFAULT_ALPHA = 0.05
+BOOTSTRAP_ROUNDS = 2000
+
+
+def git_commit(cwd: Optional[Union[str, Path]] = None) -> dict:
+    """Current commit hash and whether the work tree has uncommitted changes"""
+    cwd = cwd or Path(__file__).parent
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=cwd, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=cwd,
+                                    capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": "unknown", "dirty": False}
+    return {"commit": commit, "dirty": dirty}
+
+
+def config_key(config: dict) -> str:
+    """Stable short hash of a run configuration"""
+    return hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:12]
+
+
+def env_config(names: list[str]) -> dict:
+    """Values of the given environment variables that are set (tuning knobs of a run)"""
+    return {name: os.environ[name] for name in names if name in os.environ}
+
+
+def stage_summary(samples: list[float]) -> dict:
+    """Percentiles, histogram and (bounded) raw samples of one stage"""
+    values = np.asarray(samples, dtype=np.float64)
+    if len(values) > MAX_SAMPLES:
+        values = values[np.linspace(0, len(values) - 1, MAX_SAMPLES).astype(np.int64)]
+    counts, _ = np.histogram(values, bins=np.concatenate(([0.0], HISTOGRAM_EDGES_MS, [np.inf])))
+    return {
+        "count": int(len(samples)),
+        "mean": round(float(values.mean()), 3) if len(values) else 0.0,
+        "p50": round(float(np.percentile(values, 50)), 3) if len(values) else 0.0,
+        "p95": round(float(np.percentile(values, 95)), 3) if len(values) else 0.0,
+        "histogram": counts.tolist(),
+        "samples": [round(float(v), 3) for v in values],
+    }
+
+
+def record_run(system: str, config: dict, stages: dict, path: Union[str, Path] = HISTORY_FILE) -> dict:
+    """
+    Append a benchmark run to the history.
+
+    Args:
+        system: Which benchmark produced the run (e.g. "cloud", "local")
+        config: Settings that affect performance (models, batch mode, env knobs)
+        stages: {stage name: latency samples in ms}
+        path: History file (JSONL, append-only)
+
+    Returns:
+        The stored record
+    """
+    record = {
+        "version": FORMAT_VERSION,
+        "run_id": uuid.uuid4().hex[:12],
+        "timestamp": datetime.now().isoformat(),
+        "system": system,
+        **git_commit(),
+        "config": config,
+        "config_key": config_key(config),
+        "stages": {name: stage_summary(samples) for name, samples in stages.items() if samples},
+    }
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return record
+
+
+def load_runs(path: Union[str, Path] = HISTORY_FILE, system: Optional[str] = None,
+              key: Optional[str] = None) -> list[dict]:
+    """Runs in the history, oldest first, optionally filtered by system and config key"""
+    if not Path(path).exists():
+        return []
+    runs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                run = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a partially written last line must not break the history
+            if (system is None or run.get("system") == system) and (key is None or run.get("config_key") == key):
+                runs.append(run)
+    return runs
+
+
+def find_run(runs: list[dict], ref: str, before: Optional[dict] = None) -> Optional[dict]:
+    """
+    Resolve a run reference.
+
+    Args:
+        runs: Runs, oldest first
+        ref: "latest", "previous" (the run before `before`, or before the latest),
+            a run id prefix or a commit prefix
+    """
+    if not runs:
+        return None
+    if ref == "latest":
+        return runs[-1]
+    if ref == "previous":
+        end = runs.index(before) if before in runs else len(runs) - 1
+        return runs[end - 1] if end > 0 else None
+    for run in reversed(runs):
+        if run["run_id"].startswith(ref) or run.get("commit", "").startswith(ref):
+            return run
+    return None
+
+
+def latest_stage_means(system: str, config: Optional[dict] = None,
+                       path: Union[str, Path] = HISTORY_FILE) -> Optional[dict]:
+    """
+    {stage: mean ms} of the most recent matching run of a system, or None without one.
+
+    Args:
+        system: Benchmark that produced the runs (e.g. "local")
+        config: Settings the run must have recorded, e.g. {"mode": "sequential"} so
+            amortised per-query times of a batch run never become a per-query baseline
+    """
+    runs = [run for run in load_runs(path, system)
+            if all(run.get("config", {}).get(name) == value for name, value in (config or {}).items())]
+    if not runs:
+        return None
+    return {stage: data["mean"] for stage, data in runs[-1]["stages"].items()}
+
+
+# ============================================
+# Statistics
+# ============================================
+
+def mann_whitney_u(a: np.ndarray, b: np.ndarray) -> tuple:
+    """
+    Two-sided Mann-Whitney U test (normal approximation with tie correction).
+
+    Returns:
+        (U statistic of a, p-value)
+    """
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    n1, n2 = len(a), len(b)
+    if n1 == 0 or n2 == 0:
+        return 0.0, 1.0
+    combined = np.concatenate([a, b])
+    order = combined.argsort(kind="mergesort")
+    sorted_values = combined[order]
+    # Average ranks for ties
+    _, first, counts = np.unique(sorted_values, return_index=True, return_counts=True)
+    avg_rank = first + (counts + 1) / 2.0
+    ranks = np.empty(len(combined))
+    ranks[order] = np.repeat(avg_rank, counts)
+    u = ranks[:n1].sum() - n1 * (n1 + 1) / 2.0
+    n = n1 + n2
+    tie_term = ((counts ** 3 - counts).sum()) / (n * (n - 1)) if n > 1 else 0.0
+    sigma = math.sqrt(n1 * n2 / 12.0 * ((n + 1) - tie_term))
+    if sigma == 0:
+        return float(u), 1.0
+    z = (u - n1 * n2 / 2.0) / sigma
+    return float(u), float(math.erfc(abs(z) / math.sqrt(2)))
+
+
+def bootstrap_median_ratio(baseline: np.ndarray, candidate: np.ndarray, rounds: int = BOOTSTRAP_ROUNDS,
+                           confidence: float = 0.95, seed: int = 0) -> tuple:
+    """Confidence interval of median(candidate) / median(baseline) by resampling both runs"""
+    rng = np.random.default_rng(seed)
+    baseline, candidate = np.asarray(baseline, dtype=np.float64), np.asarray(candidate, dtype=np.float64)
+    base_medians = np.median(rng.choice(baseline, (rounds, len(baseline))), axis=1)
+    cand_medians = np.median(rng.choice(candidate, (rounds, len(candidate))), axis=1)
+    ratios = cand_medians / np.maximum(base_medians, 1e-9)
+    tail = (1 - confidence) / 2 * 100
+    return float(np.percentile(ratios, tail)), float(np.percentile(ratios, 100 - tail))
+
+
+def compare_runs(baseline: dict, candidate: dict, threshold: float = DEFAULT_THRESHOLD,
+                 alpha: float = DEFAULT_ALPHA) -> list[dict]:
+    """
+    Stage-by-stage comparison of two runs.
+
+    A stage regresses when the difference is significant (Mann-Whitney
+    p < alpha) and the whole bootstrap CI of the median ratio lies above
+    1 + threshold. Improvements are reported symmetrically.
+
+    Returns:
+        One row per stage present in both runs
+    """
+    rows = []
+    for stage, base in baseline["stages"].items():
+        cand = candidate["stages"].get(stage)
+        if cand is None or not base["samples"] or not cand["samples"]:
+            continue
+        _, p_value = mann_whitney_u(base["samples"], cand["samples"])
+        low, high = bootstrap_median_ratio(base["samples"], cand["samples"])
+        change = cand["p50"] / base["p50"] - 1 if base["p50"] else 0.0
+        if p_value < alpha and low > 1 + threshold:
+            verdict = "regression"
+        elif p_value < alpha and high < 1 - threshold:
+            verdict = "improvement"
+        else:
+            verdict = "no change"
+        rows.append({
+            "stage": stage,
+            "baseline_p50": base["p50"],
+            "candidate_p50": cand["p50"],
+            "change_percent": round(change * 100, 1),
+            "ci_low": round(low, 3),
+            "ci_high": round(high, 3),
+            "p_value": round(p_value, 4),
+            "verdict": verdict,
+        })
+    return rows
+
+
+def describe(run: dict) -> str:
+    dirty = "+dirty" if run.get("dirty") else ""
+    return f"{run['run_id']} @ {run.get('commit', 'unknown')[:8]}{dirty} ({run['timestamp'][:19]}, config {run['config_key']})"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark history and regression checks")
+    parser.add_argument("--history", default=str(HISTORY_FILE))
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_cmd = commands.add_parser("list", help="List recorded runs")
+    list_cmd.add_argument("--system")
+
+    compare_cmd = commands.add_parser("compare", help="Compare two runs")
+    compare_cmd.add_argument("--system", default="cloud")
+    compare_cmd.add_argument("--baseline", default="previous", help="latest, previous, run id or commit prefix")
+    compare_cmd.add_argument("--candidate", default="latest")
+    compare_cmd.add_argument("--same-config", action="store_true",
+                             help="Only consider runs with the candidate's configuration")
+    compare_cmd.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    compare_cmd.add_argument("--alpha", type=float, default=DEFAULT_ALPHA)
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for run in load_runs(args.history, args.system):
+            stages = ", ".join(f"{name} p50={data['p50']}ms" for name, data in run["stages"].items())
+            print(f"{run['system']:<6} {describe(run)}: {stages}")
+        sys.exit(0)
+
+    runs = load_runs(args.history, args.system)
+    candidate = find_run(runs, args.candidate)
+    if candidate is not None and args.same_config:
+        runs = [r for r in runs if r["config_key"] == candidate["config_key"]]
+        candidate = find_run(runs, args.candidate)
+    baseline = find_run(runs, args.baseline, before=candidate)
+    if baseline is None or candidate is None:
+        print("❌ Need two recorded runs to compare")
+        sys.exit(2)
+
+    print(f"📉 Baseline:  {describe(baseline)}")
+    print(f"📈 Candidate: {describe(candidate)}")
+    if baseline["config_key"] != candidate["config_key"]:
+        print("⚠️ Runs use different configurations")
+    rows = compare_runs(baseline, candidate, args.threshold, args.alpha)
+    print(f"\n{'Stage':<16} {'Base p50':>10} {'Cand p50':>10} {'Change':>8} {'95% CI ratio':>15} {'p':>7}  Verdict")
+    for row in rows:
+        icon = {"regression": "❌", "improvement": "✅"}.get(row["verdict"], "➖")
+        interval = f"[{row['ci_low']}, {row['ci_high']}]"
+        print(f"{row['stage']:<16} {row['baseline_p50']:>10} {row['candidate_p50']:>10} "
+              f"{row['change_percent']:>7}% {interval:>15} {row['p_value']:>7}  {icon} {row['verdict']}")
+    sys.exit(1 if any(row["verdict"] == "regression" for row in rows) else 0)
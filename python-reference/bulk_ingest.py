@@ -0,0 +1,259 @@
+"""
+Bulk Upsert
+Parallel, retrying batch uploads to Upstash Vector with a reconciliation report.
+
+Records are streamed into batches sized by payload bytes (not a fixed
+count), so short and long documents both make full use of each request
+without exceeding the request size limit. Batches are uploaded on a
+bounded worker pool; only a few batches are in flight at once, so huge
+catalogs stream through with constant memory. Upserts are idempotent
+(same id, same vector), so a failed batch is simply retried with
+exponential backoff; a batch that keeps failing is split in half to
+isolate oversized payloads or bad records. Every id ends up either
+acknowledged or listed as failed in the report, nothing is skipped
+silently.
+
+Usage:
+    upserter = BulkUpserter.from_env(lambda batch: index.upsert(vectors=batch))
+    report = upserter.run(records)
+    report.save("ingest_report.json")
+
+Configuration (environment):
+    UPSERT_CONCURRENCY      parallel batch uploads (default 4)
+    UPSERT_BATCH_BYTES      target JSON payload per request (default 512 KB)
+    UPSERT_BATCH_MAX_ITEMS  hard cap on vectors per request (default 1000)
+    UPSERT_RETRIES          attempts per batch before splitting it (default 4)
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional, Union
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_BATCH_BYTES = 512 * 1024
+DEFAULT_BATCH_MAX_ITEMS = 1000
+DEFAULT_RETRIES = 4
+BACKOFF_SECONDS = 0.5
+# Batches queued per worker (bounds memory while keeping workers busy)
+QUEUE_DEPTH = 2
+# Halvings of a failing batch before its records are reported as failed
+# (bounds the extra requests when the backend itself is down)
+MAX_SPLIT_DEPTH = 3
+
+
+def record_bytes(record: dict) -> int:
+    """Size of a record in the JSON request body"""
+    return len(json.dumps(record, ensure_ascii=False).encode("utf-8")) + 1
+
+
+def byte_batches(records: Iterable[dict], max_bytes: int = DEFAULT_BATCH_BYTES,
+                 max_items: int = DEFAULT_BATCH_MAX_ITEMS) -> Iterator[tuple]:
+    """
+    Group records into batches of at most max_bytes payload and max_items records.
+
+    A single record larger than max_bytes forms its own batch.
+
+    Yields:
+        (batch, payload bytes)
+    """
+    batch, size = [], 0
+    for record in records:
+        n = record_bytes(record)
+        if batch and (size + n > max_bytes or len(batch) >= max_items):
+            yield batch, size
+            batch, size = [], 0
+        batch.append(record)
+        size += n
+    if batch:
+        yield batch, size
+
+
+@dataclass
+class IngestReport:
+    """Reconciliation of submitted ids against acknowledged uploads"""
+
+    submitted: int = 0
+    upserted: int = 0
+    duplicates: int = 0               # ids submitted more than once (later record wins)
+    batches: int = 0
+    retries: int = 0                  # failed attempts that were retried
+    splits: int = 0                   # batches split after exhausting retries
+    bytes_sent: int = 0
+    elapsed_s: float = 0.0
+    failed: dict = field(default_factory=dict)     # id -> last error
+    missing: Optional[list] = None                 # ids not found by verify(), if run
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed and not self.missing
+
+    def summary(self) -> dict:
+        return {
+            "submitted": self.submitted,
+            "upserted": self.upserted,
+            "failed": len(self.failed),
+            "duplicates": self.duplicates,
+            "batches": self.batches,
+            "retries": self.retries,
+            "splits": self.splits,
+            "megabytes_sent": round(self.bytes_sent / 1e6, 2),
+            "elapsed_s": round(self.elapsed_s, 2),
+            "vectors_per_second": round(self.upserted / self.elapsed_s, 1) if self.elapsed_s else 0.0,
+            "verified_missing": None if self.missing is None else len(self.missing),
+        }
+
+    def save(self, path: Union[str, Path]) -> Path:
+        path = Path(path)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "created": datetime.now().isoformat(),
+                "ok": self.ok,
+                "summary": self.summary(),
+                "failed": self.failed,
+                "missing": self.missing,
+            }, f, indent=2, ensure_ascii=False)
+        return path
+
+
+class BulkUpserter:
+    """Streams records into byte-sized batches and uploads them in parallel"""
+
+    def __init__(self, upsert: Callable[[list], object], concurrency: int = DEFAULT_CONCURRENCY,
+                 max_batch_bytes: int = DEFAULT_BATCH_BYTES, max_batch_items: int = DEFAULT_BATCH_MAX_ITEMS,
+                 retries: int = DEFAULT_RETRIES, backoff_s: float = BACKOFF_SECONDS,
+                 sleep: Callable[[float], None] = time.sleep):
+        """
+        Args:
+            upsert: Function(list of records) uploading one batch, e.g. index.upsert(vectors=batch)
+            concurrency: Batches uploaded in parallel
+            max_batch_bytes: Target JSON payload per batch
+            max_batch_items: Maximum records per batch
+            retries: Attempts per batch before it is split
+            backoff_s: First retry delay (doubles per attempt, with jitter)
+        """
+        self.upsert = upsert
+        self.concurrency = max(1, concurrency)
+        self.max_batch_bytes = max_batch_bytes
+        self.max_batch_items = max_batch_items
+        self.retries = max(1, retries)
+        self.backoff_s = backoff_s
+        self.sleep = sleep
+        self.acknowledged: set = set()   # ids confirmed by the last run
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, upsert: Callable[[list], object]) -> "BulkUpserter":
+        return cls(
+            upsert,
+            concurrency=int(os.getenv("UPSERT_CONCURRENCY", str(DEFAULT_CONCURRENCY))),
+            max_batch_bytes=int(os.getenv("UPSERT_BATCH_BYTES", str(DEFAULT_BATCH_BYTES))),
+            max_batch_items=int(os.getenv("UPSERT_BATCH_MAX_ITEMS", str(DEFAULT_BATCH_MAX_ITEMS))),
+            retries=int(os.getenv("UPSERT_RETRIES", str(DEFAULT_RETRIES))),
+        )
+
+    def _upload(self, batch: list, size: int, report: IngestReport, depth: int = 0) -> int:
+        """Upload one batch with retries; split it when it keeps failing. Returns records upserted."""
+        error = None
+        for attempt in range(self.retries):
+            try:
+                self.upsert(batch)
+            except Exception as e:
+                error = e
+                if attempt < self.retries - 1:
+                    with self._lock:
+                        report.retries += 1
+                    self.sleep(self.backoff_s * 2 ** attempt * (0.5 + random.random()))
+                continue
+            with self._lock:
+                report.bytes_sent += size
+                self.acknowledged.update(record["id"] for record in batch)
+            return len(batch)
+
+        if len(batch) > 1 and depth < MAX_SPLIT_DEPTH:
+            # Isolate oversized payloads or bad records instead of failing the whole batch
+            with self._lock:
+                report.splits += 1
+            mid = len(batch) // 2
+            return sum(self._upload(half, sum(record_bytes(r) for r in half), report, depth + 1)
+                       for half in (batch[:mid], batch[mid:]))
+        with self._lock:
+            for record in batch:
+                report.failed[str(record["id"])] = str(error)
+        return 0
+
+    def run(self, records: Iterable[dict], on_batch: Optional[Callable[[int, int], None]] = None) -> IngestReport:
+        """
+        Upload every record.
+
+        Args:
+            records: Upstash vector records ({"id", "data" or "vector", "metadata"}), streamed
+            on_batch: Progress callback(batches done, records upserted so far)
+
+        Returns:
+            The reconciliation report
+        """
+        report = IngestReport()
+        self.acknowledged = set()
+        seen = set()
+        start = time.perf_counter()
+
+        def counted(stream):
+            for record in stream:
+                report.submitted += 1
+                if record["id"] in seen:
+                    report.duplicates += 1
+                seen.add(record["id"])
+                yield record
+
+        in_flight: set[Future] = set()
+
+        def collect(done) -> None:
+            for future in done:
+                upserted = future.result()
+                with self._lock:
+                    report.upserted += upserted
+                    report.batches += 1
+                    progress = (report.batches, report.upserted)
+                if on_batch is not None:
+                    on_batch(*progress)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="upsert") as pool:
+            for batch, size in byte_batches(counted(records), self.max_batch_bytes, self.max_batch_items):
+                if len(in_flight) >= self.concurrency * QUEUE_DEPTH:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                in_flight.add(pool.submit(self._upload, batch, size, report))
+            collect(wait(in_flight).done)
+
+        # Distinct ids (a later duplicate overwrites the earlier record)
+        report.upserted = len(self.acknowledged)
+        report.elapsed_s = time.perf_counter() - start
+        return report
+
+    def verify(self, report: IngestReport, fetch: Callable[[list], list], chunk: int = 100) -> list:
+        """
+        Check that every acknowledged id can be fetched back.
+
+        Args:
+            report: The report of run(); its `missing` list is filled in
+            fetch: Function(ids) -> records in the same order, None for missing ids
+                (e.g. lambda ids: index.fetch(ids=ids))
+            chunk: Ids per fetch request
+
+        Returns:
+            Ids that were acknowledged but are not in the index
+        """
+        ids = sorted(self.acknowledged)
+        missing = []
+        for i in range(0, len(ids), chunk):
+            part = ids[i:i + chunk]
+            missing += [doc_id for doc_id, found in zip(part, fetch(part)) if found is None]
+        report.missing = missing
+        return missing
@@ -0,0 +1,352 @@
+"""
+Query Canonicalization
+Map surface variants of a question to one canonical key.
+
+"healthy Mediterranean options", "Healthy mediterranean options?" and
+"mediterranean healthy options" are the same request. The canonical key
+folds case, accents and punctuation, drops stopwords and generic nouns
+("options", "dishes", "foods"), lemmatizes with a small local lexicon
+plus suffix rules, maps food-domain synonyms (demonyms to places, type
+aliases) from a table built from the foods.json types and regions,
+binds modifiers to their term ("high-protein" and "high in protein" ->
+high_protein, "gluten-free" -> no_gluten) and sorts the remaining terms.
+Everything is precompiled and table-driven; repeated queries hit an LRU
+cache.
+
+The key drives the retrieval caches and dedup structures (precomputed
+lookups, prefetch), where two phrasings only need the same documents.
+Full answers need a stricter key: answer_key() also keeps the question
+word (how/why/when/where/who) and, in comparisons ("than", "vs"), the
+order of the terms; numbers are terms in both keys ("recipes for 2" and
+"recipes for 4" differ), so "Is pizza healthier than sushi?" and "How is
+sushi made?" never receive the answer to a different question. The text
+sent to the embedding model is left as typed, because word order and
+function words still carry meaning there.
+
+Usage:
+    python canonicalize.py                    # TEST_QUERIES and generated surface variants
+    python canonicalize.py query_log.jsonl    # hit rate of real traffic, basic vs canonical keys
+
+Configuration (environment):
+    FOODS_FILE   corpus the synonym table is built from (default data/foods.json)
+"""
+
+import argparse
+import os
+import re
+import time
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Iterable, Union
+
+from rerank import STOPWORDS
+
+FOODS_FILE = Path(os.getenv("FOODS_FILE", Path(__file__).parent / "data" / "foods.json"))
+CACHE_SIZE = 65536
+
+# Function words and generic nouns that don't change what is being asked for
+QUERY_STOPWORDS = STOPWORDS | frozenset(
+    "about also any anything are could did do does dish eat food give good idea im item kind know like "
+    "list meal my option please recipe recommend should show something sort stuff suggest tell thing "
+    "type want was we were would really very super extra too quite".split()
+)
+
+# Question words that change the expected answer ("what"/"which" just ask for items)
+INTERROGATIVES = frozenset("how why when where who whose".split())
+# Words that make term order part of the question ("X healthier than Y")
+ORDER_MARKERS = frozenset("than vs versus compared compare instead".split())
+
+# Modifiers bound to the next content term ("high in protein" -> high_protein)
+MODIFIERS = {
+    "no": "no", "not": "no", "without": "no", "non": "no",
+    "high": "high", "rich": "high",
+    "low": "low",
+}
+
+# Rewrites applied to the folded text before tokenization
+PATTERN_REWRITES = [
+    (re.compile(r"\b([a-z]+)[\s-]+free\b"), r"without \1"),     # gluten-free, dairy free
+    (re.compile(r"\b([a-z]+)-rich\b"), r"rich \1"),             # protein-rich
+]
+
+# Irregular forms and derived words the suffix rules get wrong or can't see
+LEMMAS = {
+    "pies": "pie", "leaves": "leaf", "loaves": "loaf", "knives": "knife",
+    "potatoes": "potato", "tomatoes": "tomato", "mangoes": "mango",
+    "fried": "fry", "frying": "fry", "grilled": "grill", "grilling": "grill",
+    "roasted": "roast", "roasting": "roast", "baked": "bake", "baking": "bake",
+    "steamed": "steam", "steaming": "steam", "boiled": "boil", "boiling": "boil",
+    "smoked": "smoke", "smoking": "smoke", "stewed": "stew", "braised": "braise",
+    "braising": "braise", "sauteed": "saute", "fermented": "ferment", "pickled": "pickle",
+    "marinated": "marinate", "barbecued": "barbecue", "barbeque": "barbecue", "bbq": "barbecue",
+    "cooked": "cook", "cooking": "cook", "comforting": "comfort",
+    "healthier": "healthy", "healthiest": "healthy", "spicier": "spicy", "spiciest": "spicy",
+    "sweeter": "sweet", "tastier": "tasty", "tastiest": "tasty", "easier": "easy", "easiest": "easy",
+    "quicker": "quick", "quickest": "quick", "cheaper": "cheap", "lighter": "light",
+    "veggies": "vegetable", "veggie": "vegetarian", "carbs": "carb", "carbohydrate": "carb",
+    "carbohydrates": "carb", "proteins": "protein", "vitamins": "vitamin",
+    # -ies plurals of words that don't end in -y
+    "calories": "calorie", "cookies": "cookie", "brownies": "brownie", "smoothies": "smoothie",
+    "chilies": "chili", "chillies": "chilli", "series": "series", "species": "species",
+}
+
+# Type aliases (canonical type -> other names); groups of types that mean the same
+TYPE_ALIASES = {
+    "main course": ["main", "mains", "entree", "entrees", "main dish", "main dishes"],
+    "appetizer": ["starter", "starters", "appetiser", "appetisers"],
+    "side dish": ["side", "sides"],
+    "drink": ["drinks", "beverage", "beverages"],
+}
+EQUIVALENT_TYPES = [("drink", "beverage")]
+
+# Demonyms and alternate names -> the place name used in the corpus regions
+PLACE_ALIASES = {
+    "indian": "india", "chinese": "china", "japanese": "japan", "korean": "korea",
+    "south korea": "korea", "south korean": "korea", "thai": "thailand", "vietnamese": "vietnam",
+    "mexican": "mexico", "italian": "italy", "french": "france", "greek": "greece",
+    "spanish": "spain", "moroccan": "morocco", "turkish": "turkey", "pakistani": "pakistan",
+    "nepali": "nepal", "nepalese": "nepal", "bangladeshi": "bangladesh", "indonesian": "indonesia",
+    "malaysian": "malaysia", "filipino": "philippines", "brazilian": "brazil", "taiwanese": "taiwan",
+    "mongolian": "mongolia", "hawaiian": "hawaii", "punjabi": "punjab", "bengali": "bengal",
+    "gujarati": "gujarat", "australian": "australia", "samoan": "samoa", "fijian": "fiji",
+    "tunisian": "tunisia", "israeli": "israel", "american": "united states", "usa": "united states",
+    "hyderabadi": "hyderabad", "szechuan": "sichuan", "szechwan": "sichuan",
+    "middle eastern": "middle east", "north indian": "north india", "south indian": "south india",
+    "north african": "north africa", "new zealander": "new zealand",
+}
+
+# Words allowed in lower case inside a place name ("Rio de Janeiro")
+_PLACE_CONNECTORS = {"de", "del", "da", "la", "of"}
+_PLACE_PREFIX_RE = re.compile(r"^(also popular in|originated in|popularized in|popular in)\s+", re.IGNORECASE)
+_PAREN_RE = re.compile(r"\(([^)]*)\)")
+_WORD_RE = re.compile(r"\w+")
+_NON_WORD_RE = re.compile(r"[^\w\s-]+")
+
+
+def basic_normalize(query: str) -> str:
+    """Case fold, strip punctuation and collapse whitespace (the key before canonicalization)"""
+    return " ".join(_WORD_RE.findall(query.casefold()))
+
+
+def fold(text: str) -> str:
+    """Case- and accent-folded text"""
+    text = text.casefold()
+    if not text.isascii():
+        text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return text
+
+
+def lemmatize(word: str) -> str:
+    """Lexicon lookup, then plural suffix rules"""
+    lemma = LEMMAS.get(word)
+    if lemma is not None:
+        return lemma
+    if len(word) <= 3 or not word.endswith("s") or word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("ches", "shes", "sses", "xes", "zes")):
+        return word[:-2]
+    return word[:-1]
+
+
+def region_places(region: str) -> list[str]:
+    """Place names in a free-form region string ("Greece (also popular in Turkey, Middle East)")"""
+    parts = [_PAREN_RE.sub("", region)] + _PAREN_RE.findall(region)
+    places = []
+    for part in parts:
+        for piece in part.split(","):
+            words = _PLACE_PREFIX_RE.sub("", piece.strip()).split()
+            # Proper nouns only; descriptions ("health food movement") are skipped
+            if 0 < len(words) <= 3 and all(w[0].isupper() or w in _PLACE_CONNECTORS for w in words):
+                places.append(fold(" ".join(words)))
+    return places
+
+
+def _token(phrase: str) -> str:
+    return "_".join(phrase.split())
+
+
+class Canonicalizer:
+    """Precompiled tables mapping a query to its canonical key"""
+
+    def __init__(self, types: Iterable[str] = (), regions: Iterable[str] = ()):
+        """
+        Args:
+            types: Food types in the corpus (e.g. "Main Course")
+            regions: Region strings in the corpus (place names are extracted)
+        """
+        # phrase (folded, single-spaced) -> canonical term
+        synonyms: dict[str, str] = {}
+        type_names = {fold(t) for t in types if t}
+        for group in EQUIVALENT_TYPES:
+            present = [t for t in group if t in type_names]
+            for name in group:
+                if present:
+                    synonyms[name] = _token(present[0])
+        for name in type_names:
+            canonical = synonyms.get(name, _token(name))
+            synonyms.setdefault(name, canonical)
+            for alias in TYPE_ALIASES.get(name, []):
+                synonyms.setdefault(alias, canonical)
+
+        places = {place for region in regions if region for place in region_places(region)}
+        for place in places:
+            synonyms[place] = _token(place)
+        for alias, place in PLACE_ALIASES.items():
+            if place in places:
+                synonyms[alias] = _token(place)
+            elif " " in alias:
+                synonyms[alias] = _token(place)
+
+        # Single words go through the token table, phrases through one alternation regex
+        self.token_map = {word: target for word, target in synonyms.items() if " " not in word}
+        phrases = sorted((p for p in synonyms if " " in p), key=len, reverse=True)
+        self.phrase_map = {p: synonyms[p] for p in phrases}
+        self.phrase_re = (re.compile(r"\b(" + "|".join(re.escape(p) for p in phrases) + r")\b")
+                          if phrases else None)
+        self.key = lru_cache(maxsize=CACHE_SIZE)(self._key)
+        self.answer_key = lru_cache(maxsize=CACHE_SIZE)(self._answer_key)
+
+    @classmethod
+    def from_foods(cls, path: Union[str, Path] = FOODS_FILE) -> "Canonicalizer":
+        """Build the synonym table from a corpus file (lexicon only if it doesn't exist)"""
+        if not Path(path).exists():
+            return cls()
+        from corpus_loader import iter_food_items
+
+        types, regions = set(), set()
+        for item in iter_food_items(path):
+            types.add(item.get("type"))
+            regions.add(item.get("region"))
+        return cls(types, regions)
+
+    def terms(self, query: str) -> list[str]:
+        """Canonical terms of a query in their original order"""
+        text = " ".join(_NON_WORD_RE.sub(" ", fold(query)).split())
+        for pattern, replacement in PATTERN_REWRITES:
+            text = pattern.sub(replacement, text)
+        if self.phrase_re is not None:
+            text = self.phrase_re.sub(lambda m: self.phrase_map[m.group(1)], text)
+
+        terms, modifier = [], None
+        for word in text.replace("-", " ").split():
+            if word.isdigit():
+                # Quantities change the answer: never dropped, lemmatized or mapped
+                terms.append(f"{modifier}_{word}" if modifier else word)
+                modifier = None
+                continue
+            if word in MODIFIERS:
+                modifier = MODIFIERS[word]
+                continue
+            if word in QUERY_STOPWORDS:
+                continue
+            lemma = lemmatize(word)
+            term = self.token_map.get(lemma, self.token_map.get(word, lemma))
+            if term in QUERY_STOPWORDS:
+                continue
+            terms.append(f"{modifier}_{term}" if modifier else term)
+            modifier = None
+        # A query made only of stopwords keeps its words rather than becoming empty
+        return terms or text.replace("-", " ").split()
+
+    def _key(self, query: str) -> str:
+        return " ".join(sorted(set(self.terms(query))))
+
+    def _answer_key(self, query: str) -> str:
+        words = set(_NON_WORD_RE.sub(" ", fold(query)).split())
+        terms = self.terms(query)
+        if words & ORDER_MARKERS:
+            body = " ".join(dict.fromkeys(terms))
+        else:
+            body = " ".join(sorted(set(terms)))
+        asked = words & INTERROGATIVES
+        return f"{' '.join(sorted(asked))}: {body}" if asked else body
+
+
+@lru_cache(maxsize=1)
+def default_canonicalizer() -> Canonicalizer:
+    return Canonicalizer.from_foods(FOODS_FILE)
+
+
+def canonicalize(query: str) -> str:
+    """Canonical key of a query for retrieval caches (see module docstring)"""
+    return default_canonicalizer().key(query)
+
+
+def answer_key(query: str) -> str:
+    """Stricter canonical key for caching full answers (see module docstring)"""
+    return default_canonicalizer().answer_key(query)
+
+
+# ============================================
+# Measurement
+# ============================================
+
+def cache_hit_rate(queries: list[str], key: Callable[[str], str]) -> dict:
+    """Hit rate of an unbounded cache keyed by `key` over a query stream, and the key cost"""
+    start = time.perf_counter()
+    keys = [key(q) for q in queries]
+    elapsed = time.perf_counter() - start
+    distinct = len(set(keys))
+    return {
+        "queries": len(queries),
+        "distinct_keys": distinct,
+        "hit_rate": round(1 - distinct / len(queries), 4) if queries else 0.0,
+        "us_per_query": round(elapsed / max(1, len(queries)) * 1e6, 2),
+    }
+
+
+def false_merges(queries: Iterable[str], key: Callable[[str], str]) -> list[list[str]]:
+    """Groups of different basic-normalized queries that share a key (should be empty for distinct questions)"""
+    groups: dict[str, set] = {}
+    for query in queries:
+        groups.setdefault(key(query), set()).add(basic_normalize(query))
+    return [sorted(g) for g in groups.values() if len(g) > 1]
+
+
+def surface_variants(query: str) -> list[str]:
+    """Typical rewrites of the same question (case, punctuation, word order, filler, number)"""
+    words = query.split()
+    swapped = words[1:2] + words[:1] + words[2:] if len(words) > 2 else words
+    return [
+        query,
+        query.capitalize() + "?",
+        query.upper(),
+        " ".join(swapped),
+        f"please suggest some {query}",
+        f"what are good {query}",
+        " ".join(w + "s" if len(w) > 3 and not w.endswith("s") else w for w in words),
+    ]
+
+
+if __name__ == "__main__":
+    from query_precompute import read_query_log
+    from query_sets import all_test_queries
+
+    parser = argparse.ArgumentParser(description="Measure query canonicalization on cache hit rate")
+    parser.add_argument("logs", nargs="*", help="Query logs (plain text or JSONL); default: TEST_QUERIES variants")
+    parser.add_argument("--show", type=int, default=10, help="Example keys to print")
+    args = parser.parse_args()
+
+    if args.logs:
+        queries = [q for log in args.logs for q in read_query_log(log)]
+    else:
+        queries = [v for q, _ in all_test_queries() for v in surface_variants(q)]
+    canonical = default_canonicalizer()
+
+    print(f"🔤 {len(queries)} queries")
+    for name, key in (("raw", lambda q: q), ("basic", basic_normalize), ("canonical", canonical.key),
+                      ("answer", canonical.answer_key)):
+        stats = cache_hit_rate(queries, key)
+        print(f"   {name:<10} {stats['distinct_keys']:>7} keys  hit rate {stats['hit_rate']:.1%}  "
+              f"({stats['us_per_query']} µs/query)")
+
+    for name, key in (("canonical", canonical.key), ("answer", canonical.answer_key)):
+        merges = false_merges([q for q, _ in all_test_queries()], key)
+        print(f"⚠️ Distinct TEST_QUERIES merged by {name} keys: {merges}" if merges
+              else f"✅ No distinct TEST_QUERIES merged by {name} keys")
+    for query, count in Counter(queries).most_common(args.show):
+        print(f"   {query!r} -> {canonical.key(query)!r}")
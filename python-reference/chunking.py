@@ -0,0 +1,200 @@
+"""
+Document Chunking
+Split long documents into overlapping windows that are indexed separately.
+
+Embedding a whole recipe as one vector dilutes its relevance to any one
+question and puts the entire recipe in the prompt. Long documents are
+split into sentence-packed (or plain token) windows with overlap; each
+chunk is indexed with the id of its parent document. At query time the
+best chunks are kept (at most a few per parent) and can optionally be
+expanded back to the full parent text.
+
+Documents that fit in a single window keep their original id, so
+existing indexes of short items stay valid.
+
+Configuration (environment):
+    CHUNK_MAX_TOKENS  window size in tokens (0 disables chunking, default 128)
+    CHUNK_OVERLAP     tokens shared by consecutive windows (default 32)
+    CHUNK_MODE        "sentence" (default) or "token"
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, Optional
+
+CHUNK_SEPARATOR = "#chunk-"
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+_TOKEN_RE = re.compile(r"\S+")
+
+
+@dataclass(frozen=True)
+class ChunkConfig:
+    """Chunking parameters (tokens are whitespace-separated words)"""
+
+    max_tokens: int = 128
+    overlap: int = 32
+    mode: str = "sentence"
+
+    def __post_init__(self):
+        if self.mode not in ("sentence", "token"):
+            raise ValueError(f"Unknown chunk mode {self.mode!r}, expected 'sentence' or 'token'")
+        if self.max_tokens and not 0 <= self.overlap < self.max_tokens:
+            raise ValueError("Chunk overlap must be smaller than the window size")
+
+    @classmethod
+    def from_env(cls) -> "ChunkConfig":
+        return cls(
+            max_tokens=int(os.getenv("CHUNK_MAX_TOKENS", "128")),
+            overlap=int(os.getenv("CHUNK_OVERLAP", "32")),
+            mode=os.getenv("CHUNK_MODE", "sentence"),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_tokens > 0
+
+
+def split_sentences(text: str) -> list[str]:
+    return [s for s in _SENTENCE_RE.split(text.strip()) if s]
+
+
+def _token_windows(tokens: list[str], max_tokens: int, overlap: int) -> Iterator[list[str]]:
+    step = max_tokens - overlap
+    for start in range(0, max(1, len(tokens) - overlap), step):
+        yield tokens[start:start + max_tokens]
+
+
+def chunk_text(text: str, config: ChunkConfig) -> list[str]:
+    """
+    Split text into windows of at most `config.max_tokens` tokens.
+
+    Sentence mode packs whole sentences into each window and starts the
+    next window with the trailing sentences that fit in `overlap` tokens;
+    a sentence longer than a window falls back to token windows.
+
+    Returns:
+        The chunks in document order ([text] when it fits in one window)
+    """
+    tokens = _TOKEN_RE.findall(text)
+    if not config.enabled or len(tokens) <= config.max_tokens:
+        return [text]
+    if config.mode == "token":
+        return [" ".join(window) for window in _token_windows(tokens, config.max_tokens, config.overlap)]
+
+    chunks = []
+    window: list[list[str]] = []  # sentences (as token lists) in the current window
+    size = 0
+    for sentence in split_sentences(text):
+        words = _TOKEN_RE.findall(sentence)
+        if len(words) > config.max_tokens:
+            if window:
+                chunks.append(" ".join(w for s in window for w in s))
+            chunks.extend(" ".join(piece) for piece in _token_windows(words, config.max_tokens, config.overlap))
+            window, size = [], 0
+            continue
+        if size + len(words) > config.max_tokens and window:
+            chunks.append(" ".join(w for s in window for w in s))
+            # Carry trailing sentences forward as overlap
+            carried, carried_size = [], 0
+            for prev in reversed(window):
+                if carried_size + len(prev) > config.overlap or carried_size + len(prev) + len(words) > config.max_tokens:
+                    break
+                carried.insert(0, prev)
+                carried_size += len(prev)
+            window, size = carried, carried_size
+        window.append(words)
+        size += len(words)
+    if window:
+        chunks.append(" ".join(w for s in window for w in s))
+    return chunks
+
+
+def chunk_id(parent_id: str, number: int) -> str:
+    return f"{parent_id}{CHUNK_SEPARATOR}{number}"
+
+
+def parent_of(doc_id: str) -> str:
+    """Parent document id of a chunk id (ids of unchunked documents map to themselves)"""
+    return str(doc_id).split(CHUNK_SEPARATOR, 1)[0]
+
+
+def chunk_item(item: dict, config: ChunkConfig, text_field: str = "text") -> list[dict]:
+    """
+    Chunks of one food item, each a copy of the item with its own id and text.
+
+    Chunks carry "parent_id" and "chunk" (position) fields; a single-chunk
+    item is returned unchanged.
+    """
+    pieces = chunk_text(item[text_field], config)
+    if len(pieces) == 1:
+        return [item]
+    return [
+        dict(item, id=chunk_id(item["id"], n), parent_id=str(item["id"]), chunk=n, **{text_field: piece})
+        for n, piece in enumerate(pieces)
+    ]
+
+
+def chunk_items(items: Iterable[dict], config: ChunkConfig, text_field: str = "text") -> Iterator[dict]:
+    """Stream chunks of a stream of items"""
+    for item in items:
+        yield from chunk_item(item, config, text_field)
+
+
+def best_chunks(results: list[dict], k: int, per_parent: int = 1) -> list[dict]:
+    """
+    Keep the best-scoring chunks, at most `per_parent` from any one document.
+
+    Args:
+        results: Chunk-level search results, best first
+        k: Number of results to keep
+
+    Returns:
+        Up to k results, each with a "parent_id" field
+    """
+    kept = []
+    per_parent_count = {}
+    for result in results:
+        parent = parent_of(result["id"])
+        if per_parent_count.get(parent, 0) >= per_parent:
+            continue
+        per_parent_count[parent] = per_parent_count.get(parent, 0) + 1
+        kept.append(dict(result, parent_id=parent))
+        if len(kept) == k:
+            break
+    return kept
+
+
+def expand_parents(results: list[dict], fetch_parent: Callable[[str], Optional[dict]]) -> list[dict]:
+    """
+    Replace chunk text with the full parent document text.
+
+    Args:
+        results: Output of best_chunks
+        fetch_parent: Function(parent id) -> result-shaped dict or None
+            (e.g. DocStore.get); chunks whose parent is missing are kept as is
+
+    Returns:
+        One result per parent, keeping the best chunk's score
+    """
+    expanded = []
+    seen = set()
+    for result in results:
+        parent = result.get("parent_id") or parent_of(result["id"])
+        if parent in seen:
+            continue
+        seen.add(parent)
+        doc = fetch_parent(parent) if parent != result["id"] else None
+        if doc is None:
+            expanded.append(result)
+            continue
+        expanded.append({
+            "id": parent,
+            "score": result["score"],
+            "data": doc["text"],
+            "metadata": {"text": doc["text"], "region": doc.get("region"), "type": doc.get("type")},
+            "parent_id": parent,
+            "chunk": result["id"],
+        })
+    return expanded
@@ -0,0 +1,248 @@
+"""
+Circuit Breakers
+Fail fast when a backend (Upstash, Groq, Ollama) is degraded.
+
+Each backend gets one breaker that watches a rolling window of its most
+recent calls. When the error rate or the share of slow calls in the
+window crosses a threshold, the breaker opens: calls are rejected in
+microseconds and a fallback answers instead (a local index, a cached
+answer or a retrieval-only response). After a cool-down the breaker lets
+a few probe calls through (half-open); if they succeed it closes again,
+otherwise it re-opens for another cool-down.
+
+Usage:
+    groq_breaker = breaker("groq")
+    answer = groq_breaker.call(generate, question, context,
+                               fallback=lambda: retrieval_only_answer(question, texts))
+
+Configuration (environment; BREAKER_<NAME>_<SETTING> overrides per backend):
+    BREAKER_WINDOW          calls in the rolling window (default 20)
+    BREAKER_MIN_CALLS       calls needed before the breaker may open (default 5)
+    BREAKER_FAILURE_RATE    error share that opens the breaker (default 0.5)
+    BREAKER_SLOW_MS         latency that counts a call as slow (default 10000)
+    BREAKER_SLOW_RATE       slow-call share that opens the breaker (default 0.8)
+    BREAKER_OPEN_SECONDS    cool-down before half-open probing (default 30)
+    BREAKER_PROBES          probe calls allowed while half-open (default 1)
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence, TypeVar
+
+from gating import extract_answer
+
+T = TypeVar("T")
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+UNAVAILABLE_ANSWER = ("The food knowledge base is temporarily unavailable. "
+                      "Please try again in a moment.")
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the backend's breaker is open"""
+
+    def __init__(self, name: str):
+        super().__init__(f"Circuit breaker '{name}' is open")
+        self.name = name
+
+
+@dataclass
+class BreakerStats:
+    calls: int = 0         # calls let through to the backend
+    failures: int = 0
+    slow_calls: int = 0
+    rejected: int = 0      # calls failed fast while open
+    fallbacks: int = 0     # calls answered by a fallback
+    opened: int = 0        # closed/half-open -> open transitions
+
+    def summary(self) -> dict:
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "slow_calls": self.slow_calls,
+            "rejected": self.rejected,
+            "fallbacks": self.fallbacks,
+            "opened": self.opened,
+        }
+
+
+class CircuitBreaker:
+    """Rolling-window circuit breaker with half-open probing"""
+
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5, failure_rate: float = 0.5,
+                 slow_ms: float = 10000.0, slow_rate: float = 0.8, open_seconds: float = 30.0,
+                 probes: int = 1, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            name: Backend name (for stats and errors)
+            window: Number of recent calls the rates are computed over
+            min_calls: Calls required in the window before the breaker may open
+            failure_rate: Error share of the window that opens the breaker
+            slow_ms: Latency above which a successful call counts as slow
+            slow_rate: Slow-call share of the window that opens the breaker
+            open_seconds: Time spent open before probing
+            probes: Concurrent probe calls allowed while half-open
+            clock: Time source (seconds)
+        """
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_ms = slow_ms
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self.clock = clock
+        self.stats = BreakerStats()
+        self._lock = threading.Lock()
+        # (failed, slow) per recent call
+        self._window: deque = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+
+    @classmethod
+    def from_env(cls, name: str) -> "CircuitBreaker":
+        def setting(key: str, default: str) -> str:
+            return os.getenv(f"BREAKER_{name.upper()}_{key}", os.getenv(f"BREAKER_{key}", default))
+
+        return cls(
+            name,
+            window=int(setting("WINDOW", "20")),
+            min_calls=int(setting("MIN_CALLS", "5")),
+            failure_rate=float(setting("FAILURE_RATE", "0.5")),
+            slow_ms=float(setting("SLOW_MS", "10000")),
+            slow_rate=float(setting("SLOW_RATE", "0.8")),
+            open_seconds=float(setting("OPEN_SECONDS", "30")),
+            probes=int(setting("PROBES", "1")),
+        )
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and self.clock() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+        return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go to the backend now (reserves a probe slot when half-open)"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._probes_in_flight < self.probes:
+                self._probes_in_flight += 1
+                return True
+            self.stats.rejected += 1
+            return False
+
+    def record(self, failed: bool, elapsed_ms: float) -> None:
+        """Outcome of a call that allow() let through"""
+        slow = not failed and elapsed_ms > self.slow_ms
+        with self._lock:
+            self.stats.calls += 1
+            self.stats.failures += failed
+            self.stats.slow_calls += slow
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if failed or slow:
+                    self._trip()
+                else:
+                    # Probe succeeded: start over with a clean window
+                    self._state = CLOSED
+                    self._window.clear()
+                return
+            if self._state == OPEN:
+                return  # a call that started before the breaker opened
+            self._window.append((failed, slow))
+            if len(self._window) >= self.min_calls:
+                failures = sum(f for f, _ in self._window)
+                slow_calls = sum(s for _, s in self._window)
+                if (failures / len(self._window) >= self.failure_rate
+                        or slow_calls / len(self._window) >= self.slow_rate):
+                    self._trip()
+
+    def _trip(self) -> None:
+        self._state = OPEN
+        self._opened_at = self.clock()
+        self._window.clear()
+        self.stats.opened += 1
+
+    def call(self, fn: Callable[..., T], *args, fallback: Optional[Callable[[], T]] = None, **kwargs) -> T:
+        """
+        Call fn through the breaker.
+
+        Args:
+            fn: The backend call
+            fallback: Answer used when the breaker is open or the call fails;
+                without one, CircuitOpenError or the call's exception is raised
+
+        Returns:
+            fn's result, or the fallback's
+        """
+        if not self.allow():
+            if fallback is None:
+                raise CircuitOpenError(self.name)
+            return self._fallback(fallback)
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record(True, (time.perf_counter() - start) * 1000)
+            if fallback is None:
+                raise
+            return self._fallback(fallback)
+        self.record(False, (time.perf_counter() - start) * 1000)
+        return result
+
+    def _fallback(self, fallback: Callable[[], T]) -> T:
+        with self._lock:
+            self.stats.fallbacks += 1
+        return fallback()
+
+    def summary(self) -> dict:
+        return {"state": self.state, **self.stats.summary()}
+
+
+# One breaker per backend, shared by every caller in the process
+_breakers: dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def breaker(name: str) -> CircuitBreaker:
+    """The process-wide breaker for a backend (created from the environment on first use)"""
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker.from_env(name)
+        return _breakers[name]
+
+
+def breaker_summary() -> dict:
+    with _registry_lock:
+        return {name: b.summary() for name, b in _breakers.items()}
+
+
+def first_answer(*fallbacks: Callable[[], Optional[T]]) -> Optional[T]:
+    """Result of the first fallback that produces one (None results pass to the next)"""
+    for fallback in fallbacks:
+        result = fallback()
+        if result is not None:
+            return result
+    return None
+
+
+def retrieval_only_answer(question: str, texts: Sequence[str], max_sources: int = 3) -> str:
+    """Answer built from the retrieved sources alone, for when generation is unavailable"""
+    if not texts:
+        return UNAVAILABLE_ANSWER
+    lines = ["The answer service is busy right now; here is what the knowledge base says:"]
+    for text in texts[:max_sources]:
+        lines.append(f"- {extract_answer(question, text) or text}")
+    return "\n".join(lines)
@@ -4,7 +4,7 @@ Migrated from ChromaDB + Ollama to cloud-based services
 """
 
 import os
-import json
+import sys
 import time
 from pathlib import Path
 from dotenv import load_dotenv
@@ -20,10 +20,54 @@ if not os.getenv("GROQ_API_KEY"):
     print(f"⚠️ Warning: GROQ_API_KEY not found. Checking .env at: {env_path}")
     print(f"   .env exists: {env_path.exists()}")
 
-# Constants - Use foods.json in same directory
-JSON_FILE = Path(__file__).parent / "foods.json"
+# Shared helpers (corpus loader, ...) live one level up in python-reference/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bulk_ingest import BulkUpserter
+from chunking import ChunkConfig, best_chunks, chunk_item, expand_parents
+from circuit_breaker import OPEN, CircuitOpenError, breaker
+from conversation import ConversationMemory, summary_prompt
+from corpus_loader import LoadStats, count_food_items, iter_food_items
+from doc_store import DocStoreWriter, open_doc_store
+from fallback import FallbackChain
+from gating import ConfidenceGate
+from query_precompute import PrecomputedLookup, log_query
+from rerank import DEFAULT_BUDGET_MS, rerank
+from token_usage import UsageLedger, estimated_embedding, from_groq
+from warmup import WARMUP_ENABLED, groq_task, print_report, upstash_task, warm_up
+
+# Constants - Use foods.json in same directory (FOODS_FILE may point at a .jsonl/.gz catalog)
+JSON_FILE = Path(os.getenv("FOODS_FILE", Path(__file__).parent / "foods.json"))
+# Local columnar copy of the documents (Upstash then only returns ids + scores)
+DOC_STORE_DIR = Path(os.getenv("DOC_STORE_DIR", Path(__file__).parent / "doc_store"))
 TOP_K = 3
 MAX_RETRIES = 3
+# Optional re-ranking: fetch this many candidates and keep the best TOP_K (0 = off)
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "0"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", str(DEFAULT_BUDGET_MS)))
+# Popular-query lookup table (query_precompute.py) and optional JSONL log that feeds it
+PRECOMPUTED_FILE = os.getenv("PRECOMPUTED_QUERIES", Path(__file__).parent / "precomputed_queries.json")
+QUERY_LOG = os.getenv("QUERY_LOG")
+# Long documents are indexed as overlapping chunks (CHUNK_MAX_TOKENS / CHUNK_OVERLAP / CHUNK_MODE)
+CHUNKING = ChunkConfig.from_env()
+# Reconciliation report of the last indexing run (see bulk_ingest.py)
+INGEST_REPORT = os.getenv("INGEST_REPORT", Path(__file__).parent / "ingest_report.json")
+# Chunks fetched per requested result, so several chunks of one document don't crowd others out
+CHUNK_CANDIDATE_FACTOR = 3
+# Replace the best chunk with its full parent document in the prompt
+CHUNK_EXPAND_PARENTS = os.getenv("CHUNK_EXPAND_PARENTS", "0") == "1"
+# Score-based gate that skips Groq for irrelevant results (GATE_MIN_SCORE, GATE_EXTRACTIVE, ...)
+gate = ConfidenceGate.from_env(scale="upstash")
+# Tokens of conversation history (summary + recent turns) sent with each question
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "1024"))
+LLM_MODEL = "llama-3.1-8b-instant"
+# Token counts and estimated cost of the session's embedding and generation calls
+usage_ledger = UsageLedger()
+# Fail fast (instead of retrying with sleeps) while Upstash or Groq is degraded
+upstash_breaker = breaker("upstash")
+groq_breaker = breaker("groq")
+# Same fallback chain as rag_system.py: local index (FALLBACK_SNAPSHOT) while Upstash is
+# down, registered answer sources, then a retrieval-only answer while Groq is
+fallbacks = FallbackChain.from_env()
 
 # ============================================
 # Initialize Cloud Clients
@@ -56,58 +100,109 @@ index = init_upstash_client()
 groq_client = init_groq_client()
 print("✅ Connected to Upstash Vector and Groq Cloud")
 
-# Load data
-with open(JSON_FILE, "r", encoding="utf-8") as f:
-    food_data = json.load(f)
+# Open the local doc store if it has been built (None falls back to Upstash metadata)
+doc_store = open_doc_store(DOC_STORE_DIR)
+
+# Precomputed results for popular queries - checked before calling Upstash
+precomputed = PrecomputedLookup.load(PRECOMPUTED_FILE)
+if precomputed is not None:
+    print(f"⚡ Loaded {len(precomputed)} precomputed popular queries")
 
 # ============================================
 # Document Indexing (Upstash auto-embeds text)
 # ============================================
 
-def index_documents(food_data, force_reindex=False):
+def to_upstash_vector(item):
+    """Convert a food item into an Upstash vector record"""
+    # Enrich text with metadata (same as before)
+    enriched_text = item["text"]
+    if "region" in item:
+        enriched_text += f" This food is popular in {item['region']}."
+    if "type" in item:
+        enriched_text += f" It is a type of {item['type']}."
+    
+    metadata = {
+        "text": item["text"],
+        "region": item.get("region", "Unknown"),
+        "type": item.get("type", "Unknown")
+    }
+    if "parent_id" in item:
+        metadata["parent_id"] = item["parent_id"]
+    
+    return {
+        "id": str(item["id"]),
+        "data": enriched_text,  # Raw text - Upstash handles embedding automatically!
+        # Text stays in metadata for the web app; Python queries skip it when the doc store is built
+        "metadata": metadata
+    }
+
+def chunk_to_doc_store(items, writer):
+    """
+    Split items into chunks while copying them into the local doc store.
+    Both parents and chunks are stored: chunks for hydration, parents for expansion.
+    """
+    for item in items:
+        writer.add_item(item)
+        for chunk in chunk_item(item, CHUNKING):
+            if chunk is not item:
+                writer.add_item(chunk)
+            yield chunk
+
+def index_documents(source=JSON_FILE, force_reindex=False, verify=False):
     """
     Index documents in Upstash Vector.
     Upstash automatically generates embeddings using mixedbread-ai/mxbai-embed-large-v1
     No manual embedding generation required!
+    
+    `source` is a corpus file path (streamed, never fully loaded) or a list of items.
+    The local doc store is (re)built from the same stream.
+    With verify=True every uploaded id is fetched back for the ingest report.
     """
+    global doc_store
+    
+    def items(stats=None):
+        if isinstance(source, (str, Path)):
+            return iter_food_items(source, stats)
+        return iter(source)
+    
     try:
         # Check current index stats
         info = index.info()
         current_count = info.vector_count
         
-        if current_count >= len(food_data) and not force_reindex:
-            print(f"✅ All {current_count} documents already indexed in Upstash Vector.")
-            return
+        if current_count > 0 and not force_reindex:
+            # Streaming count pass - cheap on memory even for huge catalogs
+            total = count_food_items(source) if isinstance(source, (str, Path)) else len(source)
+            if current_count >= total:
+                print(f"✅ All {current_count} documents already indexed in Upstash Vector.")
+                if doc_store is None:
+                    with DocStoreWriter(DOC_STORE_DIR) as writer:
+                        for _ in chunk_to_doc_store(items(), writer):
+                            pass
+                    doc_store = open_doc_store(DOC_STORE_DIR)
+                    print(f"🗃️ Built local doc store at {DOC_STORE_DIR}")
+                return
         
-        print(f"📦 Indexing {len(food_data)} documents to Upstash Vector...")
+        print(f"📦 Streaming documents from {source if isinstance(source, (str, Path)) else 'memory'} to Upstash Vector...")
         
-        vectors = []
-        for item in food_data:
-            # Enrich text with metadata (same as before)
-            enriched_text = item["text"]
-            if "region" in item:
-                enriched_text += f" This food is popular in {item['region']}."
-            if "type" in item:
-                enriched_text += f" It is a type of {item['type']}."
-            
-            vectors.append({
-                "id": str(item["id"]),
-                "data": enriched_text,  # Raw text - Upstash handles embedding automatically!
-                "metadata": {
-                    "text": item["text"],
-                    "region": item.get("region", "Unknown"),
-                    "type": item.get("type", "Unknown")
-                }
-            })
+        # Parallel batch upserts sized by payload bytes, failed batches retried
+        stats = LoadStats()
+        upserter = BulkUpserter.from_env(lambda batch: index.upsert(vectors=batch))
+        with DocStoreWriter(DOC_STORE_DIR) as writer:
+            vectors = map(to_upstash_vector, chunk_to_doc_store(items(stats), writer))
+            report = upserter.run(vectors, on_batch=lambda batches, uploaded: print(
+                f"  ✅ Uploaded batch {batches} ({uploaded} documents so far)"))
+        doc_store = open_doc_store(DOC_STORE_DIR)
+        if verify:
+            upserter.verify(report, lambda ids: index.fetch(ids=ids))
+        report.save(INGEST_REPORT)
         
-        # Batch upsert (more efficient than individual inserts)
-        batch_size = 100
-        for i in range(0, len(vectors), batch_size):
-            batch = vectors[i:i + batch_size]
-            index.upsert(vectors=batch)
-            print(f"  ✅ Uploaded batch {i//batch_size + 1}/{(len(vectors)-1)//batch_size + 1}")
-        
-        print(f"🎉 Successfully indexed {len(vectors)} documents!")
+        if stats.skipped:
+            print(f"⚠️ Skipped invalid rows: {stats.summary()}")
+        if not report.ok:
+            print(f"⚠️ {len(report.failed)} documents failed, {len(report.missing or [])} missing "
+                  f"after upload - see {INGEST_REPORT}")
+        print(f"🎉 Successfully indexed {report.upserted} documents in {report.elapsed_s:.1f}s!")
         
     except Exception as e:
         print(f"❌ Error indexing documents: {e}")
@@ -117,10 +212,13 @@ def index_documents(food_data, force_reindex=False):
 # LLM Generation with Groq (with retry logic)
 # ============================================
 
-def generate_with_groq(prompt, context, retries=MAX_RETRIES):
+def generate_with_groq(prompt, context, retries=MAX_RETRIES, history="", fallback=None):
     """
     Generate answer using Groq Cloud API with retry logic and error handling.
     Uses llama-3.1-8b-instant model for fast inference.
+    `history` is the bounded conversation memory, if any.
+    Every attempt goes through the Groq circuit breaker: once it is open,
+    `fallback()` answers immediately instead of retrying with backoff.
     """
     system_prompt = """You are a knowledgeable food expert assistant. 
 Answer questions based on the provided context accurately and helpfully.
@@ -133,11 +231,19 @@ Context:
 
 Question: {prompt}
 Answer:"""
+    if history:
+        full_prompt = f"""{history}
+
+{full_prompt}"""
 
     for attempt in range(retries):
+        if not groq_breaker.allow():
+            print("⚡ Groq is unavailable (circuit open), answering from the retrieved sources")
+            return fallback() if fallback is not None else "⚠️ The answer service is temporarily unavailable."
         try:
+            start = time.time()
             completion = groq_client.chat.completions.create(
-                model="llama-3.1-8b-instant",
+                model=LLM_MODEL,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": full_prompt}
@@ -146,10 +252,17 @@ Answer:"""
                 max_tokens=1024,
                 top_p=1
             )
+            groq_breaker.record(False, (time.time() - start) * 1000)
+            usage_ledger.record(from_groq(completion, LLM_MODEL, time.time() - start, system_prompt + full_prompt))
             return completion.choices[0].message.content.strip()
         
         except Exception as e:
+            groq_breaker.record(True, (time.time() - start) * 1000)
             error_msg = str(e).lower()
+            # No more attempts once this failure has opened the breaker
+            if groq_breaker.state == OPEN:
+                print("⚡ Groq is unavailable (circuit open), answering from the retrieved sources")
+                return fallback() if fallback is not None else "⚠️ The answer service is temporarily unavailable."
             
             # Handle rate limiting with exponential backoff
             if "rate" in error_msg or "limit" in error_msg:
@@ -174,37 +287,107 @@ Answer:"""
     
     return "❌ Failed to generate response after multiple attempts."
 
+def summarize_with_groq(previous, turns):
+    """Conversation summarizer run by ConversationMemory in the background"""
+    prompt = summary_prompt(previous, turns)
+    start = time.time()
+    completion = groq_client.chat.completions.create(
+        model=LLM_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.2,
+        max_tokens=256
+    )
+    usage_ledger.record(from_groq(completion, LLM_MODEL, time.time() - start, prompt), "summary")
+    return completion.choices[0].message.content
+
+# ============================================
+# Retrieval
+# ============================================
+
+def retrieve(question, top_k=TOP_K):
+    """
+    Query Upstash Vector (auto-embeds the question).
+    With a local doc store only ids and scores come back over the wire and
+    the documents are hydrated locally; otherwise metadata/data are fetched.
+    Popular queries are answered from the precomputed table without any request.
+    With chunking, the best chunk of each document is kept (optionally expanded).
+    """
+    if precomputed is not None:
+        results = precomputed.get(question, top_k)
+        if results is not None:
+            return results
+    
+    fetch_k = top_k * CHUNK_CANDIDATE_FACTOR if CHUNKING.enabled else top_k
+    start = time.time()
+    if doc_store is not None:
+        results = upstash_breaker.call(
+            lambda: doc_store.hydrate((r.id, r.score) for r in index.query(data=question, top_k=fetch_k)),
+            fallback=fallbacks.searcher(question, fetch_k)
+        )
+    else:
+        results = upstash_breaker.call(
+            lambda: [
+                {"id": r.id, "score": r.score, "data": r.data, "metadata": r.metadata or {}}
+                for r in index.query(
+                    data=question,  # Raw text - Upstash handles embedding automatically!
+                    top_k=fetch_k,
+                    include_metadata=True,
+                    include_data=True
+                )
+            ],
+            fallback=fallbacks.searcher(question, fetch_k)
+        )
+    # Upstash reports no usage for its server-side query embedding
+    usage_ledger.record(estimated_embedding([question], time.time() - start))
+    
+    if not CHUNKING.enabled:
+        return results
+    results = best_chunks(results, top_k)
+    if CHUNK_EXPAND_PARENTS and doc_store is not None:
+        results = expand_parents(results, doc_store.get)
+    return results
+
+def document_text(result):
+    """Original document text of a retrieval result"""
+    return result["metadata"].get("text") or result.get("data") or ""
+
 # ============================================
 # RAG Query Function
 # ============================================
 
-def rag_query(question):
+def rag_query(question, memory=None):
     """
     RAG query using Upstash Vector for retrieval and Groq for generation.
     - Upstash automatically embeds the question text
     - No manual embedding generation needed!
+    - With a ConversationMemory, follow-ups are retrieved as standalone
+      queries, the bounded history is added to the prompt and the turn is recorded
     """
     # Validate input
     if not question or len(question.strip()) < 2:
         return "Please enter a valid question."
     
+    search_query = memory.standalone_query(question) if memory is not None else question
+    log_query(QUERY_LOG, search_query)
+    usage_ledger.count_query()
+    
     try:
         # Step 1: Query Upstash Vector (auto-embeds the question)
-        results = index.query(
-            data=question,  # Raw text - Upstash handles embedding automatically!
-            top_k=TOP_K,
-            include_metadata=True,
-            include_data=True
-        )
+        if RERANK_CANDIDATES > TOP_K:
+            # Over-fetch cheaply, then keep only the best TOP_K for the prompt
+            results = rerank(search_query, retrieve(search_query, top_k=RERANK_CANDIDATES),
+                             k=TOP_K, budget_ms=RERANK_BUDGET_MS)
+        else:
+            results = retrieve(search_query)
         
         # Handle no results
         if not results:
             return "No relevant documents found for your question."
         
         # Step 2: Extract documents and IDs
-        top_docs = [r.metadata.get("text", "") for r in results]
-        top_ids = [r.id for r in results]
-        scores = [r.score for r in results]
+        top_docs = [document_text(r) for r in results]
+        top_ids = [r["id"] for r in results]
+        scores = [r["score"] for r in results]
         
         # Step 3: Show friendly explanation of retrieved documents
         print("\n🧠 Retrieving relevant information to reason through your question...\n")
@@ -215,12 +398,28 @@ def rag_query(question):
         
         print("📚 These seem to be the most relevant pieces of information to answer your question.\n")
         
-        # Step 4: Build context from retrieved documents
+        # Step 4: Skip generation when the scores already decide the answer
+        decision = gate.decide(search_query, scores, top_docs)
+        if not decision.call_llm:
+            print(f"⚡ Answered without the LLM ({decision.reason}, top score {decision.top_score:.3f})\n")
+            if memory is not None:
+                memory.add_turn(question, decision.answer, search_query)
+            return decision.answer
+        
+        # Step 5: Build context from retrieved documents
         context = "\n".join(top_docs)
         
-        # Step 5: Generate answer with Groq
-        return generate_with_groq(question, context)
+        # Step 6: Generate answer with Groq (retrieval-only answer while Groq is down)
+        fallback = lambda: fallbacks.answer(question, top_docs)
+        if memory is None:
+            return generate_with_groq(question, context, fallback=fallback)
+        answer = generate_with_groq(question, context, history=memory.context(), fallback=fallback)
+        memory.add_turn(question, answer, search_query)
+        return answer
         
+    except CircuitOpenError:
+        # Upstash is down and there is no local index: registered answers or "unavailable"
+        return fallbacks.answer(question)
     except Exception as e:
         error_msg = str(e).lower()
         
@@ -240,17 +439,35 @@ def rag_query(question):
 
 if __name__ == "__main__":
     # Index documents (Upstash auto-embeds, skips if already indexed)
-    index_documents(food_data)
+    index_documents(JSON_FILE)
+    
+    # Warm-up: open the pooled Upstash and Groq connections concurrently so the
+    # first question doesn't pay the TLS handshakes
+    if WARMUP_ENABLED:
+        print("🔥 Warming up...")
+        print_report(warm_up({
+            "upstash": upstash_task(index),
+            "groq": groq_task(groq_client, LLM_MODEL),
+        }))
     
-    # Interactive loop
+    # Interactive loop (bounded memory; older turns are summarized in the background)
+    memory = ConversationMemory(summarize=summarize_with_groq, token_budget=CONVERSATION_TOKEN_BUDGET)
     print("\n🧠 RAG is ready. Ask a question (type 'exit' to quit):\n")
     while True:
         try:
             question = input("You: ")
             if question.lower() in ["exit", "quit"]:
+                if gate.stats.total:
+                    print(f"📊 LLM calls avoided: {gate.stats.llm_calls_avoided}/{gate.stats.total}")
+                usage = usage_ledger.summary()
+                if usage["queries"]:
+                    generation = usage.get("generation", {})
+                    print(f"🪙 Tokens: {generation.get('prompt_tokens', 0)} in / "
+                          f"{generation.get('completion_tokens', 0)} out, "
+                          f"est. cost ${usage['cost_usd']:.6f} (${usage['cost_per_query_usd']:.8f}/query)")
                 print("👋 Goodbye!")
                 break
-            answer = rag_query(question)
+            answer = rag_query(question, memory)
             print("🤖:", answer, "\n")
         except KeyboardInterrupt:
             print("\n👋 Goodbye!")
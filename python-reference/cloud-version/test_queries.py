@@ -12,14 +12,23 @@ Plus performance comparison vs local system.
 """
 
 import os
+import sys
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from dotenv import load_dotenv
 from upstash_vector import Index
 from groq import Groq
 
+# Shared helpers live one level up in python-reference/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bench_history import env_config, latest_stage_means, record_run
+from doc_store import open_doc_store
+from gating import ConfidenceGate
+from token_usage import UsageLedger, estimated_embedding, from_groq
+
 # Load environment variables from same directory
 env_path = Path(__file__).parent / ".env"
 load_dotenv(dotenv_path=env_path)
@@ -31,59 +40,66 @@ index = Index(
 )
 groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
 
+# Local doc store built by rag_run.index_documents (None = read text from Upstash metadata)
+doc_store = open_doc_store(os.getenv("DOC_STORE_DIR", Path(__file__).parent / "doc_store"))
+FETCH_PAYLOAD = doc_store is None
+
+# Same score gate as rag_run.py: irrelevant results skip the Groq call
+gate = ConfidenceGate.from_env(scale="upstash")
+
+# Bounded concurrency for batched generation (keeps us under Groq rate limits)
+BATCH_MAX_WORKERS = 4
+
+LLM_MODEL = "llama-3.1-8b-instant"
+
 # ============================================
 # Test Query Categories
 # ============================================
 
-TEST_QUERIES = {
-    "semantic_similarity": [
-        "healthy Mediterranean options",
-        "light and refreshing summer dishes",
-        "warm comforting winter meals",
-    ],
-    "multi_criteria": [
-        "spicy vegetarian Asian dishes",
-        "quick easy breakfast options",
-        "creamy pasta dishes from Italy",
-    ],
-    "nutritional": [
-        "high-protein low-carb foods",
-        "foods rich in vitamins and antioxidants",
-        "heart-healthy meal options",
-    ],
-    "cultural_exploration": [
-        "traditional comfort foods",
-        "authentic street food dishes",
-        "festive celebration meals",
-    ],
-    "cooking_method": [
-        "dishes that can be grilled",
-        "slow-cooked tender meals",
-        "fresh raw preparations",
-    ],
-}
+# The same 15 queries are shared by every test and benchmark script
+from query_sets import TEST_QUERIES
 
 # ============================================
 # Performance Tracking
 # ============================================
 
+# REAL baseline times from local system (ChromaDB + Ollama), measured on
+# 2025-12-10 from Week 2 repository - used only until the benchmark history
+# (bench_history.py) holds a run of local_performance_test.py
+MEASURED_LOCAL_BASELINE = {
+    "avg_embedding_ms": 2192.06,   # Ollama mxbai-embed-large
+    "avg_retrieval_ms": 4.04,      # ChromaDB vector search
+    "avg_generation_ms": 21493.33, # Ollama llama3.2 generation
+    "avg_total_ms": 23690.74       # Total local response time
+}
+
+# Env knobs recorded with each run, so history compares like with like
+TUNING_ENV_VARS = ["RERANK_CANDIDATES", "GATE_MIN_SCORE", "GATE_EXTRACTIVE",
+                   "CHUNK_MAX_TOKENS", "PRECOMPUTED_QUERIES"]
+
+def load_local_baseline():
+    """Stage means of the latest sequential local run (falls back to the 2025-12-10 numbers)"""
+    means = latest_stage_means("local", {"mode": "sequential"})
+    if not means:
+        return dict(MEASURED_LOCAL_BASELINE)
+    return {f"avg_{stage}": means.get(stage, MEASURED_LOCAL_BASELINE[f"avg_{stage}"])
+            for stage in ("embedding_ms", "retrieval_ms", "generation_ms", "total_ms")}
+
 class PerformanceTracker:
     """Track and compare query performance metrics"""
     
     def __init__(self):
         self.results = []
-        self.local_baseline = {
-            # REAL baseline times from local system (ChromaDB + Ollama)
-            # Measured on 2025-12-10 from Week 2 repository
-            "avg_embedding_ms": 2192.06,   # Ollama mxbai-embed-large
-            "avg_retrieval_ms": 4.04,      # ChromaDB vector search
-            "avg_generation_ms": 21493.33, # Ollama llama3.2 generation
-            "avg_total_ms": 23690.74       # Total local response time
-        }
+        self.local_baseline = load_local_baseline()
+        self.usage = UsageLedger()
     
     def record(self, query, category, retrieval_time, generation_time, total_time, 
-               num_results, answer_preview):
-        """Record a single query's performance"""
+               num_results, answer_preview, gate_action="generate", usage=()):
+        """Record a single query's performance (usage: TokenUsage records of its model calls)"""
+        self.usage.count_query(category)
+        for call in usage:
+            self.usage.record(call, category)
+        generation = next((u for u in usage if u.kind == "generation"), None)
         self.results.append({
             "timestamp": datetime.now().isoformat(),
             "query": query,
@@ -92,6 +108,11 @@ class PerformanceTracker:
             "generation_ms": round(generation_time * 1000, 2),
             "total_ms": round(total_time * 1000, 2),
             "num_results": num_results,
+            "gate_action": gate_action,
+            "prompt_tokens": generation.prompt_tokens if generation else 0,
+            "completion_tokens": generation.completion_tokens if generation else 0,
+            "tokens_per_second": round(generation.tokens_per_second, 1) if generation else 0.0,
+            "cost_usd": round(sum(u.cost_usd for u in usage), 8),
             "answer_preview": answer_preview[:100] + "..." if len(answer_preview) > 100 else answer_preview
         })
     
@@ -117,6 +138,9 @@ class PerformanceTracker:
         total_improvement = ((self.local_baseline["avg_total_ms"] - avg_total) 
                               / self.local_baseline["avg_total_ms"] * 100)
         
+        # Questions answered without an LLM call (confidence gate)
+        avoided = sum(1 for r in self.results if r.get("gate_action", "generate") != "generate")
+        
         return {
             "total_queries": len(self.results),
             "cloud_performance": {
@@ -132,9 +156,21 @@ class PerformanceTracker:
                 "generation_percent": round(generation_improvement, 1),
                 "total_percent": round(total_improvement, 1)
             },
+            "gating": {
+                "llm_calls_avoided": avoided,
+                "avoided_percent": round(avoided / len(self.results) * 100, 1)
+            },
+            "tokens": self.usage.summary(),
             "by_category": self._get_category_breakdown()
         }
     
+    def stage_samples(self):
+        """Per-stage latency samples (ms) for the benchmark history"""
+        return {
+            stage: [r[stage] for r in self.results]
+            for stage in ("retrieval_ms", "generation_ms", "total_ms")
+        }
+    
     def _get_category_breakdown(self):
         """Get performance breakdown by query category"""
         categories = {}
@@ -144,37 +180,25 @@ class PerformanceTracker:
                 categories[cat] = []
             categories[cat].append(r["total_ms"])
         
-        return {cat: {"avg_ms": round(sum(times)/len(times), 2), "count": len(times)} 
+        usage = self.usage.by_category()
+        return {cat: {"avg_ms": round(sum(times)/len(times), 2), "count": len(times),
+                      "tokens": usage.get(cat, {})}
                 for cat, times in categories.items()}
 
 # ============================================
 # Query Execution with Timing
 # ============================================
 
-def execute_query_with_timing(question, category, tracker):
-    """Execute a RAG query and record performance metrics"""
-    
-    # Time the retrieval phase
-    retrieval_start = time.time()
-    results = index.query(
-        data=question,
-        top_k=3,
-        include_metadata=True,
-        include_data=True
-    )
-    retrieval_time = time.time() - retrieval_start
-    
-    # Extract context
-    if results:
-        context = "\n".join([r.metadata.get("text", "") for r in results])
-        top_docs = [(r.id, r.score, r.metadata.get("text", "")[:50]) for r in results]
-    else:
-        context = "No relevant documents found."
-        top_docs = []
-    
-    # Time the generation phase
-    generation_start = time.time()
-    
+def result_text(result):
+    """Document text for a query result - local doc store first, then Upstash metadata/data"""
+    if doc_store is not None:
+        row = doc_store.row(result.id)
+        if row is not None:
+            return doc_store.text(row)
+    return (result.metadata or {}).get("text") or result.data or ""
+
+def generate_answer(question, context):
+    """Generate an answer for a question from the retrieved context; returns (answer, TokenUsage)"""
     system_prompt = """You are a knowledgeable food expert assistant. 
 Answer questions based on the provided context accurately and helpfully."""
     
@@ -186,8 +210,9 @@ Context:
 Question: {question}
 Answer:"""
     
+    start = time.time()
     completion = groq_client.chat.completions.create(
-        model="llama-3.1-8b-instant",
+        model=LLM_MODEL,
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": full_prompt}
@@ -195,7 +220,40 @@ Answer:"""
         temperature=0.7,
         max_tokens=512
     )
-    answer = completion.choices[0].message.content.strip()
+    usage = from_groq(completion, LLM_MODEL, time.time() - start, system_prompt + full_prompt)
+    return completion.choices[0].message.content.strip(), usage
+
+def execute_query_with_timing(question, category, tracker):
+    """Execute a RAG query and record performance metrics"""
+    
+    # Time the retrieval phase
+    retrieval_start = time.time()
+    results = index.query(
+        data=question,
+        top_k=3,
+        include_metadata=FETCH_PAYLOAD,
+        include_data=FETCH_PAYLOAD
+    )
+    retrieval_time = time.time() - retrieval_start
+    usage = [estimated_embedding([question], retrieval_time)]
+    
+    # Extract context
+    if results:
+        context = "\n".join([result_text(r) for r in results])
+        top_docs = [(r.id, r.score, result_text(r)[:50]) for r in results]
+    else:
+        context = "No relevant documents found."
+        top_docs = []
+    
+    # Time the generation phase (skipped when the retrieval scores decide the answer)
+    decision = gate.decide(question, [r.score for r in results],
+                           [result_text(r) for r in results])
+    generation_start = time.time()
+    if decision.call_llm:
+        answer, generation_usage = generate_answer(question, context)
+        usage.append(generation_usage)
+    else:
+        answer = decision.answer
     generation_time = time.time() - generation_start
     
     # Calculate total time
@@ -209,7 +267,9 @@ Answer:"""
         generation_time=generation_time,
         total_time=total_time,
         num_results=len(results) if results else 0,
-        answer_preview=answer
+        answer_preview=answer,
+        gate_action=decision.action,
+        usage=usage
     )
     
     return {
@@ -224,12 +284,92 @@ Answer:"""
         }
     }
 
+def execute_batch_with_timing(queries, tracker, max_workers=BATCH_MAX_WORKERS):
+    """
+    Execute many (question, category) pairs as one batch and record metrics.
+    Retrieval is a single bulk Upstash request; generations run concurrently.
+    """
+    if not queries:
+        return []
+    
+    # Time the bulk retrieval phase (one request embeds and searches every query)
+    retrieval_start = time.time()
+    batch_results = index.query_many(
+        queries=[
+            {
+                "data": question,
+                "top_k": 3,
+                "include_metadata": FETCH_PAYLOAD,
+                "include_data": FETCH_PAYLOAD
+            }
+            for question, _ in queries
+        ]
+    )
+    retrieval_time = time.time() - retrieval_start
+    # Each query is charged its share of the bulk request
+    per_query_retrieval = retrieval_time / len(queries)
+    
+    def timed_generate(args):
+        question, results = args
+        decision = gate.decide(question, [r.score for r in results],
+                               [result_text(r) for r in results])
+        if not decision.call_llm:
+            return decision.answer, 0.0, decision.action, None
+        if results:
+            context = "\n".join([result_text(r) for r in results])
+        else:
+            context = "No relevant documents found."
+        generation_start = time.time()
+        answer, usage = generate_answer(question, context)
+        return answer, time.time() - generation_start, decision.action, usage
+    
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        generations = list(pool.map(
+            timed_generate,
+            [(question, results) for (question, _), results in zip(queries, batch_results)]
+        ))
+    
+    batch_output = []
+    for (question, category), results, (answer, generation_time, gate_action, usage) in zip(
+            queries, batch_results, generations):
+        total_time = per_query_retrieval + generation_time
+        # The bulk request embeds every query; each is charged its own tokens and share of the time
+        calls = [estimated_embedding([question], per_query_retrieval)] + ([usage] if usage else [])
+        tracker.record(
+            query=question,
+            category=category,
+            retrieval_time=per_query_retrieval,
+            generation_time=generation_time,
+            total_time=total_time,
+            num_results=len(results) if results else 0,
+            answer_preview=answer,
+            gate_action=gate_action,
+            usage=calls
+        )
+        batch_output.append({
+            "query": question,
+            "category": category,
+            "answer": answer,
+            "retrieved_docs": [(r.id, r.score, result_text(r)[:50]) for r in results],
+            "timing": {
+                "retrieval_ms": round(per_query_retrieval * 1000, 2),
+                "generation_ms": round(generation_time * 1000, 2),
+                "total_ms": round(total_time * 1000, 2)
+            }
+        })
+    
+    return batch_output
+
 # ============================================
 # Test Suite Runner
 # ============================================
 
-def run_test_suite(verbose=True):
-    """Run the complete test suite with all 15+ queries"""
+def run_test_suite(verbose=True, batch=False):
+    """
+    Run the complete test suite with all 15+ queries.
+    With batch=True all queries go through execute_batch_with_timing instead
+    of one-by-one execution (much faster for large evaluation sets).
+    """
     
     print("=" * 70)
     print("🧪 ADVANCED RAG TESTING SUITE")
@@ -241,7 +381,21 @@ def run_test_suite(verbose=True):
     tracker = PerformanceTracker()
     all_results = []
     
-    for category, queries in TEST_QUERIES.items():
+    if batch:
+        print(f"\n📦 Batch mode: bulk retrieval + {BATCH_MAX_WORKERS} concurrent generations")
+        batch_queries = [(query, category)
+                         for category, queries in TEST_QUERIES.items()
+                         for query in queries]
+        batch_start = time.time()
+        try:
+            all_results = execute_batch_with_timing(batch_queries, tracker)
+        except Exception as e:
+            print(f"   ❌ Error: {str(e)}")
+            all_results = [{"query": q, "category": c, "error": str(e)} for q, c in batch_queries]
+        print(f"   ✅ {len(batch_queries)} queries completed in "
+              f"{(time.time() - batch_start) * 1000:.2f}ms wall time")
+    
+    for category, queries in ({} if batch else TEST_QUERIES).items():
         print(f"\n📂 Category: {category.replace('_', ' ').title()}")
         print("-" * 50)
         
@@ -299,9 +453,23 @@ def run_test_suite(verbose=True):
     print(f"   • Generation: {'+' if improvement['generation_percent'] > 0 else ''}{improvement['generation_percent']}%")
     print(f"   • Overall: {'+' if improvement['total_percent'] > 0 else ''}{improvement['total_percent']}%")
     
+    print(f"\n⚡ Confidence Gate:")
+    print(f"   • LLM calls avoided: {summary['gating']['llm_calls_avoided']} "
+          f"({summary['gating']['avoided_percent']}% of queries)")
+    
+    tokens = summary['tokens']
+    generation = tokens.get('generation', {})
+    print(f"\n🪙 Tokens & Cost:")
+    print(f"   • Generation: {generation.get('prompt_tokens', 0)} prompt + "
+          f"{generation.get('completion_tokens', 0)} completion tokens "
+          f"({generation.get('tokens_per_second', 0)} tok/s)")
+    print(f"   • Embedding: {tokens.get('embedding', {}).get('prompt_tokens', 0)} tokens (estimated)")
+    print(f"   • Estimated cost: ${tokens['cost_usd']:.6f} (${tokens['cost_per_query_usd']:.8f} per query)")
+    
     print(f"\n📂 Performance by Category:")
     for cat, data in summary['by_category'].items():
-        print(f"   • {cat.replace('_', ' ').title()}: {data['avg_ms']}ms avg ({data['count']} queries)")
+        print(f"   • {cat.replace('_', ' ').title()}: {data['avg_ms']}ms avg ({data['count']} queries, "
+              f"${data['tokens'].get('cost_usd', 0):.6f})")
     
     print("\n" + "=" * 70)
     
@@ -369,12 +537,14 @@ def generate_markdown_report(results, filename="TEST_RESULTS.md"):
 
 ## Test Categories Performance
 
-| Category | Avg Response Time | Queries |
-|----------|------------------|---------|
+| Category | Avg Response Time | Queries | Avg Completion Tokens | Est. Cost |
+|----------|------------------|---------|-----------------------|-----------|
 """
     
     for cat, data in summary['by_category'].items():
-        md_content += f"| {cat.replace('_', ' ').title()} | {data['avg_ms']}ms | {data['count']} |\n"
+        generation = data['tokens'].get('generation', {})
+        md_content += (f"| {cat.replace('_', ' ').title()} | {data['avg_ms']}ms | {data['count']} | "
+                       f"{generation.get('avg_completion_tokens', 0)} | ${data['tokens'].get('cost_usd', 0):.6f} |\n")
     
     md_content += """
 ---
@@ -442,13 +612,22 @@ The cloud migration from ChromaDB + Ollama to Upstash Vector + Groq has resulted
 if __name__ == "__main__":
     print("\n🚀 Starting Advanced RAG Testing Suite...\n")
     
-    # Run the full test suite
-    results = run_test_suite(verbose=True)
+    # Run the full test suite (pass --batch for bulk retrieval + concurrent generation)
+    batch = "--batch" in sys.argv
+    results = run_test_suite(verbose=True, batch=batch)
     
-    # Save reports
+    # Save reports (latest run) and append the run to the benchmark history
     save_test_report(results, "test_report.json")
     generate_markdown_report(results, "TEST_RESULTS.md")
+    run = record_run("cloud", {
+        "mode": "batch" if batch else "sequential",
+        "llm": "llama-3.1-8b-instant",
+        "top_k": 3,
+        "doc_store": not FETCH_PAYLOAD,
+        **env_config(TUNING_ENV_VARS)
+    }, results["tracker"].stage_samples())
     
     print("\n✅ Testing complete!")
     print("   - JSON report: test_report.json")
     print("   - Markdown report: TEST_RESULTS.md")
+    print(f"   - History: run {run['run_id']} (python bench_history.py compare --system cloud)")
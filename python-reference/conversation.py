@@ -0,0 +1,197 @@
+"""
+Conversation Memory
+Bounded chat history for the interactive RAG loops.
+
+Appending every turn to the prompt makes prompt size (and therefore
+generation latency) grow without limit. ConversationMemory keeps recent
+turns verbatim within a rolling token budget; turns that fall out of the
+budget are folded into a running summary by a background thread, so
+summarisation never sits on the critical path of a question. Follow-up
+questions ("is it spicy?") are rewritten into standalone retrieval
+queries using the topic of the previous turns.
+
+Usage:
+    memory = ConversationMemory(summarize=my_llm_summarizer)
+    search_query = memory.standalone_query(question)
+    prompt_history = memory.context()
+    ...
+    memory.add_turn(question, answer)
+"""
+
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from rerank import tokenize
+from tokens import CHARS_PER_TOKEN, estimate_tokens
+
+DEFAULT_TOKEN_BUDGET = 1024
+# Share of the budget the summary may use; the rest holds recent turns verbatim
+SUMMARY_SHARE = 0.3
+
+_FOLLOW_UP_RE = re.compile(
+    r"\b(it|its|it's|they|them|their|this|that|these|those|one|ones|he|she)\b"
+    r"|^(and|also|what about|how about|why|which)\b",
+    re.IGNORECASE,
+)
+# Request phrasing that says nothing about the topic of a question
+_FILLER = frozenset("tell about know explain describe please give more".split())
+
+
+@dataclass
+class Turn:
+    question: str
+    answer: str
+    # Standalone retrieval query the question was rewritten to, if any
+    query: str = ""
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.question) + estimate_tokens(self.answer)
+
+    def render(self) -> str:
+        return f"User: {self.question}\nAssistant: {self.answer}"
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Keep the end of text within max_tokens (newest information is at the end)"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    return text if len(text) <= max_chars else "..." + text[-max_chars:]
+
+
+def extractive_summary(previous: str, turns: list[Turn]) -> str:
+    """LLM-free summarizer: the previous summary plus the first sentence of each answer"""
+    lines = [previous] if previous else []
+    for turn in turns:
+        first_sentence = re.split(r"(?<=[.!?])\s", turn.answer.strip(), maxsplit=1)[0]
+        lines.append(f"Asked about: {turn.question.strip()} -> {first_sentence}")
+    return "\n".join(lines)
+
+
+def summary_prompt(previous: str, turns: list[Turn]) -> str:
+    """Prompt for an LLM summarizer that extends a running summary"""
+    history = "\n\n".join(turn.render() for turn in turns)
+    return f"""Update the running summary of a conversation about food with the new turns.
+Keep the foods, preferences and facts the user may refer back to. Answer with the summary only, in a few sentences.
+
+Current summary:
+{previous or "(empty)"}
+
+New turns:
+{history}
+
+Updated summary:"""
+
+
+class ConversationMemory:
+    """Recent turns within a token budget plus a background-maintained summary"""
+
+    def __init__(self, summarize: Optional[Callable[[str, list[Turn]], str]] = None,
+                 token_budget: int = DEFAULT_TOKEN_BUDGET):
+        """
+        Args:
+            summarize: Function(previous summary, evicted turns) -> new summary;
+                defaults to extractive_summary (no LLM call)
+            token_budget: Maximum tokens of history (summary + recent turns) in a prompt
+        """
+        self.summarize = summarize or extractive_summary
+        self.token_budget = token_budget
+        self.summary_budget = int(token_budget * SUMMARY_SHARE)
+        self.turns: list[Turn] = []
+        self.summary = ""
+        self._pending: list[Turn] = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-summary")
+        self._future: Optional[Future] = None
+        self.summaries_built = 0
+
+    def add_turn(self, question: str, answer: str, query: str = "") -> None:
+        """
+        Record a turn; evicts old turns into the background summary when over budget.
+
+        Pass the standalone query used for retrieval so chained follow-ups keep their topic.
+        """
+        with self._lock:
+            self.turns.append(Turn(question, answer, query))
+            recent_budget = self.token_budget - self.summary_budget
+            # Always keep the latest turn verbatim
+            while len(self.turns) > 1 and sum(t.tokens for t in self.turns) > recent_budget:
+                self._pending.append(self.turns.pop(0))
+            if self._pending and (self._future is None or self._future.done()):
+                self._future = self._executor.submit(self._summarize_pending)
+
+    def _summarize_pending(self) -> None:
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, []
+                previous = self.summary
+            try:
+                updated = self.summarize(previous, batch)
+            except Exception:
+                # Keep the conversation usable if the summarizer fails
+                updated = extractive_summary(previous, batch)
+            with self._lock:
+                self.summary = truncate_to_tokens(updated.strip(), self.summary_budget)
+                self.summaries_built += 1
+
+    def context(self) -> str:
+        """
+        History for the prompt, never blocking on a running summary.
+
+        Turns still waiting to be summarised are represented by the
+        extractive fallback so nothing is dropped in the meantime.
+        """
+        with self._lock:
+            summary = self.summary
+            if self._pending:
+                summary = truncate_to_tokens(extractive_summary(summary, self._pending),
+                                             self.summary_budget)
+            parts = []
+            if summary:
+                parts.append(f"Summary of earlier conversation:\n{summary}")
+            if self.turns:
+                parts.append("Recent conversation:\n" + "\n".join(t.render() for t in self.turns))
+        return "\n\n".join(parts)
+
+    def prompt_tokens(self) -> int:
+        return estimate_tokens(self.context()) if self.turns else 0
+
+    @staticmethod
+    def is_follow_up(question: str) -> bool:
+        return bool(_FOLLOW_UP_RE.search(question)) or len(tokenize(question)) <= 1
+
+    def standalone_query(self, question: str, rewrite: Optional[Callable[[str, str], str]] = None) -> str:
+        """
+        Retrieval query for a question, resolving references to earlier turns.
+
+        Args:
+            question: The user's latest question
+            rewrite: Optional Function(history, question) -> standalone question
+                (e.g. an LLM call); by default the topic words of the previous
+                question are appended, which costs no extra round trip
+
+        Returns:
+            The question itself when it does not look like a follow-up
+        """
+        with self._lock:
+            last = self.turns[-1] if self.turns else None
+        if last is None or not self.is_follow_up(question):
+            return question
+        if rewrite is not None:
+            return rewrite(self.context(), question).strip() or question
+        own_terms = set(tokenize(question))
+        topic = [term for term in tokenize(last.query or last.question) if term not in own_terms and term not in _FILLER]
+        return f"{question} ({' '.join(topic)})" if topic else question
+
+    def clear(self) -> None:
+        with self._lock:
+            self.turns.clear()
+            self._pending.clear()
+            self.summary = ""
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
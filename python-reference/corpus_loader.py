@@ -0,0 +1,243 @@
+"""
+Streaming Food Corpus Loader
+Lazily yields food items from large catalogs for the indexing pipeline.
+
+Supports JSON arrays (parsed incrementally), JSONL/NDJSON (one item per
+line) and gzip-compressed versions of both. Invalid rows are skipped and
+counted instead of aborting the whole load, so multi-gigabyte catalogs
+can be indexed with flat memory.
+"""
+
+import gzip
+import json
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+JSONL_SUFFIXES = {".jsonl", ".ndjson"}
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Read size for incremental JSON array parsing
+CHUNK_SIZE = 1 << 16
+# A single item larger than this is treated as a malformed document
+MAX_ITEM_BYTES = 16 * 1024 * 1024
+
+# Characters that matter when skipping over an element without decoding it
+_STRUCTURAL_RE = re.compile(r'["\[\]{},]')
+_STRING_END_RE = re.compile(r'["\\]')
+
+
+@dataclass
+class LoadStats:
+    """Counters describing a streaming load"""
+    loaded: int = 0
+    skipped: int = 0
+    reasons: dict = field(default_factory=dict)
+
+    def skip(self, reason: str) -> None:
+        self.skipped += 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+
+    def summary(self) -> str:
+        if not self.skipped:
+            return f"{self.loaded} items loaded"
+        details = ", ".join(f"{reason}: {count}" for reason, count in sorted(self.reasons.items()))
+        return f"{self.loaded} items loaded, {self.skipped} skipped ({details})"
+
+
+def validate_item(item) -> Optional[str]:
+    """
+    Check that a decoded row is a usable food item.
+
+    Args:
+        item: The decoded JSON value
+
+    Returns:
+        None if the item is valid, otherwise the reason it should be skipped
+    """
+    if not isinstance(item, dict):
+        return "not_an_object"
+    if item.get("id") in (None, ""):
+        return "missing_id"
+    text = item.get("text")
+    if not isinstance(text, str) or not text.strip():
+        return "missing_text"
+    return None
+
+
+def _open_text(path: Path):
+    """Open a corpus file as text, transparently decompressing gzip"""
+    with open(path, "rb") as f:
+        magic = f.read(2)
+    if magic == GZIP_MAGIC:
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def _is_jsonl(path: Path) -> bool:
+    suffixes = [s.lower() for s in path.suffixes]
+    if suffixes and suffixes[-1] == ".gz":
+        suffixes = suffixes[:-1]
+    return bool(suffixes) and suffixes[-1] in JSONL_SUFFIXES
+
+
+def _iter_jsonl(stream, stats: LoadStats) -> Iterator:
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            stats.skip("invalid_json")
+
+
+def _element_end(buf: str, pos: int) -> Optional[int]:
+    """
+    Find where the array element starting at `pos` ends, without decoding it.
+
+    Tracks bracket depth and string literals, so it also works on malformed
+    elements. Returns the index of the depth-0 "," or closing "]" after the
+    element, or None if the buffer ends first.
+    """
+    depth = 0
+    i = pos
+    while True:
+        m = _STRUCTURAL_RE.search(buf, i)
+        if m is None:
+            return None
+        c = m.group()
+        i = m.end()
+        if c == '"':
+            while True:
+                m = _STRING_END_RE.search(buf, i)
+                if m is None:
+                    return None
+                i = m.end()
+                if m.group() == '"':
+                    break
+                i += 1  # skip the escaped character
+                if i > len(buf):
+                    return None
+        elif c in "[{":
+            depth += 1
+        elif c in "]}":
+            if depth == 0:
+                if c == "]":
+                    return m.start()
+            else:
+                depth -= 1
+        elif depth == 0:
+            return m.start()
+
+
+def _iter_json_array(stream, stats: LoadStats) -> Iterator:
+    """
+    Decode the elements of a top-level JSON array one at a time.
+
+    A malformed element is skipped (counted as "invalid_json") by
+    resynchronising on the next top-level ",". If that is impossible (an
+    element larger than MAX_ITEM_BYTES, or an unterminated one at the end
+    of the file), ValueError is raised rather than silently dropping the
+    rest of the corpus.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    started = False
+    eof = False
+
+    def read_more() -> bool:
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        # Grow geometrically so a large element is not rescanned once per chunk
+        chunk = stream.read(max(CHUNK_SIZE, len(buf) - pos))
+        if not chunk:
+            eof = True
+            return False
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    while True:
+        # Skip whitespace and separators between elements
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+
+        if pos >= len(buf):
+            if not read_more():
+                if started:
+                    stats.skip("truncated_array")
+                return
+            continue
+
+        if not started:
+            if buf[pos] != "[":
+                stats.skip("not_a_json_array")
+                return
+            started = True
+            pos += 1
+            continue
+
+        if buf[pos] == "]":
+            return
+
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            pass
+        else:
+            after = end
+            while after < len(buf) and buf[after] in " \t\r\n":
+                after += 1
+            # A number can decode "successfully" when cut at the buffer end
+            if after == len(buf) and read_more():
+                continue
+            if after == len(buf) or buf[after] in ",]":
+                pos = end
+                yield item
+                continue
+
+        # Malformed element (or trailing garbage): skip to the next top-level separator
+        boundary = _element_end(buf, pos)
+        if boundary is None:
+            if len(buf) - pos < MAX_ITEM_BYTES and read_more():
+                continue
+            reason = "is unterminated" if eof else "exceeds MAX_ITEM_BYTES"
+            raise ValueError(f"Malformed JSON array: element {stats.loaded + stats.skipped + 1} "
+                             f"{reason}; cannot resynchronise")
+        stats.skip("invalid_json")
+        pos = boundary
+
+
+def iter_food_items(path: Union[str, Path], stats: Optional[LoadStats] = None) -> Iterator[dict]:
+    """
+    Stream validated food items from a corpus file.
+
+    Args:
+        path: A .json, .jsonl or .ndjson file, optionally gzip-compressed
+        stats: Optional LoadStats updated with loaded/skipped counters
+
+    Returns:
+        An iterator of food item dicts (ids normalised to strings)
+    """
+    path = Path(path)
+    stats = stats if stats is not None else LoadStats()
+
+    with _open_text(path) as stream:
+        rows = _iter_jsonl(stream, stats) if _is_jsonl(path) else _iter_json_array(stream, stats)
+        for item in rows:
+            reason = validate_item(item)
+            if reason:
+                stats.skip(reason)
+                continue
+            item["id"] = str(item["id"])
+            stats.loaded += 1
+            yield item
+
+
+def count_food_items(path: Union[str, Path]) -> int:
+    """Count valid items with a streaming pass (no items are kept in memory)"""
+    return sum(1 for _ in iter_food_items(path))
@@ -0,0 +1,302 @@
+"""
+Columnar Document Store
+Compact local storage for retrieved food documents.
+
+Vector search only needs to return ids and scores; the documents are then
+hydrated from this store instead of shipping the full text back in every
+response's metadata. Layout of a store directory:
+
+    texts.bin         UTF-8 texts concatenated (memory-mapped)
+    text_offsets.npy  int64[n + 1] byte offsets into texts.bin
+    ids.bin           UTF-8 ids concatenated
+    id_offsets.npy    int64[n + 1] byte offsets into ids.bin
+    region_codes.npy  uint16[n] dictionary-encoded region
+    type_codes.npy    uint16[n] dictionary-encoded type
+    vocab.json        region/type dictionaries and format version
+"""
+
+import json
+import mmap
+import os
+import shutil
+from array import array
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+import numpy as np
+
+from snapshot import encode_strings
+
+FORMAT_VERSION = 1
+UNKNOWN = "Unknown"
+
+
+class DocStoreWriter:
+    """
+    Streams documents to disk so building a store keeps memory flat.
+
+    Files are written to a sibling ".tmp" directory and moved into place
+    by close(), so processes that have the live store memory-mapped keep
+    reading the old files instead of seeing them truncated.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.tmp_path = self.path.with_name(self.path.name + ".tmp")
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        self.tmp_path.mkdir(parents=True)
+        self._texts = open(self.tmp_path / "texts.bin", "wb")
+        self._ids = open(self.tmp_path / "ids.bin", "wb")
+        self._text_offsets = array("q", [0])
+        self._id_offsets = array("q", [0])
+        self._region_codes = array("H")
+        self._type_codes = array("H")
+        self._vocab = {"region": {}, "type": {}}
+
+    def _encode(self, column: str, value: Optional[str]) -> int:
+        codes = self._vocab[column]
+        value = value or UNKNOWN
+        if value not in codes:
+            if len(codes) >= 0xFFFF:
+                raise ValueError(f"Too many distinct {column} values for a uint16 column")
+            codes[value] = len(codes)
+        return codes[value]
+
+    def add(self, doc_id: str, text: str, region: Optional[str] = None,
+            type_: Optional[str] = None) -> None:
+        """Append one document"""
+        text_bytes = text.encode("utf-8")
+        id_bytes = str(doc_id).encode("utf-8")
+        self._texts.write(text_bytes)
+        self._ids.write(id_bytes)
+        self._text_offsets.append(self._text_offsets[-1] + len(text_bytes))
+        self._id_offsets.append(self._id_offsets[-1] + len(id_bytes))
+        self._region_codes.append(self._encode("region", region))
+        self._type_codes.append(self._encode("type", type_))
+
+    def add_item(self, item: dict) -> None:
+        """Append a food item ({"id", "text", "region", "type"})"""
+        self.add(item["id"], item["text"], item.get("region"), item.get("type"))
+
+    def close(self) -> None:
+        """Finish the files and move them into the store directory"""
+        self._texts.close()
+        self._ids.close()
+        tmp = self.tmp_path
+        np.save(tmp / "text_offsets.npy", np.frombuffer(self._text_offsets, dtype=np.int64))
+        np.save(tmp / "id_offsets.npy", np.frombuffer(self._id_offsets, dtype=np.int64))
+        np.save(tmp / "region_codes.npy", np.frombuffer(self._region_codes, dtype=np.uint16))
+        np.save(tmp / "type_codes.npy", np.frombuffer(self._type_codes, dtype=np.uint16))
+        vocab = {
+            "version": FORMAT_VERSION,
+            "count": len(self._region_codes),
+            # Dictionaries are stored as code-ordered lists
+            "region": sorted(self._vocab["region"], key=self._vocab["region"].get),
+            "type": sorted(self._vocab["type"], key=self._vocab["type"].get),
+        }
+        with open(tmp / "vocab.json", "w", encoding="utf-8") as f:
+            json.dump(vocab, f, ensure_ascii=False)
+
+        # Renaming over a mapped file leaves the old inode alive for its readers.
+        # vocab.json goes last: its count marks the store as complete.
+        self.path.mkdir(parents=True, exist_ok=True)
+        for name in ("texts.bin", "ids.bin", "text_offsets.npy", "id_offsets.npy",
+                     "region_codes.npy", "type_codes.npy", "vocab.json"):
+            os.replace(tmp / name, self.path / name)
+        tmp.rmdir()
+
+    def abort(self) -> None:
+        """Discard a partially written store, leaving the live one untouched"""
+        self._texts.close()
+        self._ids.close()
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+def _map_blob(path: Path):
+    """Memory-map a blob file read-only (empty files cannot be mapped)"""
+    if path.stat().st_size == 0:
+        return b""
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class DocStore:
+    """Read-only view over columnar document arrays (memory-mapped from disk)"""
+
+    def __init__(self, texts, text_offsets, ids, id_offsets, region_codes, type_codes,
+                 regions: list, types: list):
+        self._texts = texts
+        self._ids = ids
+        self.text_offsets = text_offsets
+        self.id_offsets = id_offsets
+        self.region_codes = region_codes
+        self.type_codes = type_codes
+        self.regions = regions
+        self.types = types
+        self._row_by_id = None
+
+    @classmethod
+    def open(cls, path: Union[str, Path]) -> "DocStore":
+        """Memory-map a store directory"""
+        path = Path(path)
+        with open(path / "vocab.json", "r", encoding="utf-8") as f:
+            vocab = json.load(f)
+        if vocab.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported doc store version: {vocab.get('version')}")
+        return cls(
+            texts=_map_blob(path / "texts.bin"),
+            text_offsets=np.load(path / "text_offsets.npy", mmap_mode="r"),
+            ids=_map_blob(path / "ids.bin"),
+            id_offsets=np.load(path / "id_offsets.npy", mmap_mode="r"),
+            region_codes=np.load(path / "region_codes.npy", mmap_mode="r"),
+            type_codes=np.load(path / "type_codes.npy", mmap_mode="r"),
+            regions=vocab["region"],
+            types=vocab["type"],
+        )
+
+    @classmethod
+    def from_columns(cls, ids: list, texts: list, regions: Optional[list] = None,
+                     types: Optional[list] = None) -> "DocStore":
+        """Build an in-memory store from parallel column lists"""
+        n = len(ids)
+        region_codes, region_vocab = dictionary_encode(regions or [UNKNOWN] * n)
+        type_codes, type_vocab = dictionary_encode(types or [UNKNOWN] * n)
+        text_blob, text_offsets = encode_strings(texts)
+        id_blob, id_offsets = encode_strings(ids)
+        return cls(text_blob, text_offsets, id_blob, id_offsets,
+                   region_codes, type_codes, region_vocab, type_vocab)
+
+    @classmethod
+    def from_snapshot(cls, snap, prefix: str = "doc_") -> "DocStore":
+        """View the doc store columns embedded in a snapshot (see sections())"""
+        return cls(
+            texts=snap[prefix + "texts"],
+            text_offsets=snap[prefix + "text_offsets"],
+            ids=snap[prefix + "ids"],
+            id_offsets=snap[prefix + "id_offsets"],
+            region_codes=snap[prefix + "region_codes"],
+            type_codes=snap[prefix + "type_codes"],
+            regions=snap.meta[prefix + "regions"],
+            types=snap.meta[prefix + "types"],
+        )
+
+    def sections(self, prefix: str = "doc_") -> tuple:
+        """
+        Export the columns for embedding in a snapshot.
+
+        Returns:
+            (dict of section name -> array, dict of meta entries)
+        """
+        def as_array(blob):
+            return blob if isinstance(blob, np.ndarray) else np.frombuffer(blob, dtype=np.uint8)
+
+        arrays = {
+            prefix + "texts": as_array(self._texts),
+            prefix + "text_offsets": np.asarray(self.text_offsets),
+            prefix + "ids": as_array(self._ids),
+            prefix + "id_offsets": np.asarray(self.id_offsets),
+            prefix + "region_codes": np.asarray(self.region_codes),
+            prefix + "type_codes": np.asarray(self.type_codes),
+        }
+        meta = {prefix + "regions": list(self.regions), prefix + "types": list(self.types)}
+        return arrays, meta
+
+    def __len__(self) -> int:
+        return len(self.region_codes)
+
+    def doc_id(self, row: int) -> str:
+        start, end = self.id_offsets[row], self.id_offsets[row + 1]
+        return bytes(self._ids[start:end]).decode("utf-8")
+
+    def row(self, doc_id: str) -> Optional[int]:
+        """Row number for a document id (the id map is built on first use)"""
+        if self._row_by_id is None:
+            self._row_by_id = {self.doc_id(i): i for i in range(len(self))}
+        return self._row_by_id.get(str(doc_id))
+
+    def text_view(self, row: int) -> memoryview:
+        """Zero-copy view of a document's UTF-8 bytes"""
+        start, end = self.text_offsets[row], self.text_offsets[row + 1]
+        return memoryview(self._texts)[start:end]
+
+    def text(self, row: int) -> str:
+        return str(self.text_view(row), "utf-8")
+
+    def region(self, row: int) -> str:
+        return self.regions[self.region_codes[row]]
+
+    def type(self, row: int) -> str:
+        return self.types[self.type_codes[row]]
+
+    def result(self, row: int, score: float) -> dict:
+        """Search result for a row (same shape as rag_system.search_food_items output)"""
+        text = self.text(row)
+        return {
+            "id": self.doc_id(row),
+            "score": score,
+            "data": text,
+            "metadata": {"text": text, "region": self.region(row), "type": self.type(row)},
+        }
+
+    def get(self, doc_id: str) -> Optional[dict]:
+        """Hydrate a single document by id"""
+        row = self.row(doc_id)
+        if row is None:
+            return None
+        return {
+            "id": str(doc_id),
+            "text": self.text(row),
+            "region": self.region(row),
+            "type": self.type(row),
+        }
+
+    def hydrate(self, hits: Iterable) -> list[dict]:
+        """
+        Turn (id, score) hits into search results.
+
+        Args:
+            hits: Iterable of (id, score) pairs, e.g. from an id-only vector query
+
+        Returns:
+            Results shaped like rag_system.search_food_items output;
+            unknown ids are dropped
+        """
+        results = []
+        for doc_id, score in hits:
+            row = self.row(doc_id)
+            if row is not None:
+                results.append(self.result(row, score))
+        return results
+
+
+def dictionary_encode(values: Iterable) -> tuple:
+    """
+    Dictionary-encode a string column.
+
+    Returns:
+        (uint16 codes array, code-ordered list of distinct values)
+    """
+    vocab = {}
+    codes = array("H")
+    for value in values:
+        value = value or UNKNOWN
+        if value not in vocab:
+            vocab[value] = len(vocab)
+        codes.append(vocab[value])
+    return np.frombuffer(codes, dtype=np.uint16), list(vocab)
+
+
+def open_doc_store(path: Optional[Union[str, Path]]) -> Optional[DocStore]:
+    """Open a doc store if one exists at path, otherwise return None"""
+    if not path or not (Path(path) / "vocab.json").exists():
+        return None
+    return DocStore.open(path)
@@ -0,0 +1,35 @@
+"""
+Ollama Embedding Client
+Batched embedding calls for the local (Ollama) embedding model.
+"""
+
+import os
+
+import numpy as np
+import requests
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "mxbai-embed-large")
+
+# Shared keep-alive connection pool for every Ollama request
+session = requests.Session()
+
+
+def ollama_embed(texts: list[str], model: str = EMBED_MODEL, timeout: float = 120) -> np.ndarray:
+    """
+    Embed many texts with one Ollama /api/embed call.
+
+    Args:
+        texts: The texts to embed
+        model: Ollama embedding model
+        timeout: Request timeout in seconds
+
+    Returns:
+        (len(texts), dim) float32 array
+    """
+    response = session.post(f"{OLLAMA_URL}/api/embed", json={
+        "model": model,
+        "input": texts
+    }, timeout=timeout)
+    response.raise_for_status()
+    return np.asarray(response.json()["embeddings"], dtype=np.float32)
@@ -0,0 +1,513 @@
+"""
+Food Name Index
+Typo-tolerant lookup of dish names mentioned in a question.
+
+Users misspell dish names ("biriyani", "samosaa"). The embedding path
+only partly compensates and costs a full embed + search. This index maps
+a question to the food items it names, lexically:
+
+- names and aliases are extracted from the item texts ("Biryani is ...",
+  "..., known as Kare Raisu, ...", "Greek Salad with Chickpeas" ->
+  "greek salad"), folded and lemmatized like canonical query terms
+- each query word missing from the name vocabulary is corrected to the
+  closest vocabulary words by restricted Damerau-Levenshtein distance.
+  One-edit neighbours (most typos) share a single-deletion variant with
+  the typed word, so they are found by hashing ~len(word) variants into a
+  sorted array; two-edit corrections of long words fall back to a trigram
+  index whose postings are sorted by word length, so only words of a
+  compatible length are counted and only those sharing enough trigrams
+  are scored. Corrections are cached per query word
+- corrected words are matched against whole names, longest first; when
+  a typo is equally close to several words, the combination that forms
+  a name wins
+
+Matches boost the vector search candidates in rag_query, and a question
+that is nothing but a dish name ("what is biriyani?") skips vector
+search entirely.
+
+Usage:
+    python entity_index.py "what is biriyani?" "samosaa"    # matches
+    python entity_index.py --bench 1000000                   # lookup latency over synthetic names
+
+Configuration (environment):
+    FOODS_FILE        corpus the names are extracted from (default data/foods.json)
+    ENTITY_LOOKUP     "0" disables the index in rag_query (default on)
+"""
+
+import argparse
+import random
+import re
+import time
+from array import array
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import islice, product
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+import numpy as np
+
+from canonicalize import FOODS_FILE, QUERY_STOPWORDS, fold, lemmatize
+
+# Display score (Upstash scale) of an exactly named item; each corrected character costs
+# ENTITY_SCORE_STEP. It is not a similarity: results carry "named": True, which the gate skips
+ENTITY_SCORE = 0.95
+ENTITY_SCORE_STEP = 0.05
+# Verified candidates per corrected word (best trigram overlap first)
+MAX_CANDIDATES = 64
+# Equally close corrections kept per word, and word combinations tried per name window
+MAX_CORRECTIONS = 4
+MAX_COMBINATIONS = 16
+MAX_NAME_WORDS = 6
+CORRECTION_CACHE_SIZE = 65536
+
+_NAME_END_RE = re.compile(r"\s+(?:is|are|consists|refers|can be)\b|,")
+_ALIAS_RE = re.compile(r"\bknown as ([^,.]+)")
+_ARTICLE_RE = re.compile(r"^(?:an?|the)\s+", re.IGNORECASE)
+_WORD_RE = re.compile(r"\w+")
+
+
+def max_typos(word: str) -> int:
+    """Edits tolerated in a word: none for short words (too many neighbours), then 1, then 2"""
+    return 0 if len(word) < 5 else 1 if len(word) < 9 else 2
+
+
+def damerau_levenshtein(a: str, b: str, max_distance: int) -> int:
+    """
+    Restricted Damerau-Levenshtein (optimal string alignment) distance.
+
+    Only the diagonal band of width 2 * max_distance + 1 is computed, and
+    max_distance + 1 is returned as soon as the distance is known to exceed it.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    over = max_distance + 1
+    previous = None
+    row = [j if j <= max_distance else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [over] * (len(b) + 1)
+        if i <= max_distance:
+            current[0] = i
+        lo, hi = max(1, i - max_distance), min(len(b), i + max_distance)
+        best = current[0]
+        for j in range(lo, hi + 1):
+            cost = row[j - 1] + (a[i - 1] != b[j - 1])
+            if row[j] + 1 < cost:
+                cost = row[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            if (previous is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]
+                    and previous[j - 2] + 1 < cost):
+                cost = previous[j - 2] + 1
+            current[j] = cost
+            if cost < best:
+                best = cost
+        if best > max_distance:
+            return over
+        previous, row = row, current
+    return min(row[-1], over)
+
+
+def within_one_edit(a: str, b: str) -> bool:
+    """Whether two different words are one substitution, insertion, deletion or transposition apart"""
+    if len(a) < len(b):
+        a, b = b, a
+    if len(a) - len(b) > 1:
+        return False
+    i = 0
+    while i < len(b) and a[i] == b[i]:
+        i += 1
+    if len(a) != len(b):
+        return a[i + 1:] == b[i:]
+    return (a[i + 1:] == b[i + 1:]
+            or (i + 1 < len(a) and a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:]))
+
+
+def deletions(word: str) -> set:
+    """The word and every variant with one character deleted"""
+    return {word} | {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def trigrams(word: str) -> list[str]:
+    padded = f"${word}$"
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def name_words(name: str) -> tuple:
+    """Folded, lemmatized words of a name (the form both names and queries are matched in)"""
+    return tuple(lemmatize(w) for w in _WORD_RE.findall(fold(name).replace("_", " ")))
+
+
+def extract_names(text: str) -> list[str]:
+    """Name and aliases of the item a text describes ("Biryani is a flavorful ...")"""
+    match = _NAME_END_RE.search(text)
+    if match is None:
+        return []
+    name = _ARTICLE_RE.sub("", text[:match.start()].strip())
+    names = [name] + [m.strip() for m in _ALIAS_RE.findall(text)]
+    if " with " in name.casefold():
+        # "Greek Salad with Chickpeas" is also asked for as "greek salad"
+        names.append(name[:name.casefold().index(" with ")])
+    return [n for n in names if 0 < len(n.split()) <= MAX_NAME_WORDS]
+
+
+class DeletionIndex:
+    """
+    Vocabulary words within one edit of a query word.
+
+    Two words are at most one edit apart only if they share a
+    single-deletion variant (a transposition too: "ab" and "ba" both
+    become "b"), so the variants of every word are stored as sorted
+    64-bit hashes and a query costs ~len(word) binary searches.
+    """
+
+    def __init__(self, words: list[str]):
+        """
+        Args:
+            words: The vocabulary (word ids are list positions)
+        """
+        self.words = words
+        hashes, word_ids = array("q"), array("i")
+        for word_id, word in enumerate(words):
+            for variant in deletions(word):
+                hashes.append(hash(variant))
+                word_ids.append(word_id)
+        hashes = np.frombuffer(hashes, dtype=np.int64)
+        order = np.argsort(hashes, kind="stable")
+        self.hashes = hashes[order]
+        self.word_ids = np.frombuffer(word_ids, dtype=np.int32)[order]
+
+    def search(self, word: str) -> list[str]:
+        """Vocabulary words exactly one edit away"""
+        keys = np.fromiter((hash(v) for v in deletions(word)), dtype=np.int64)
+        starts = np.searchsorted(self.hashes, keys, "left").tolist()
+        ends = np.searchsorted(self.hashes, keys, "right").tolist()
+        candidates = {self.words[word_id] for start, end in zip(starts, ends) if end > start
+                      for word_id in self.word_ids[start:end].tolist()}
+        return [c for c in candidates if c != word and within_one_edit(word, c)]
+
+
+class TrigramIndex:
+    """Closest-word search over a vocabulary by Damerau-Levenshtein distance"""
+
+    def __init__(self, words: list[str]):
+        """
+        Args:
+            words: The vocabulary (word ids are list positions)
+        """
+        self.words = words
+        # Postings are keyed by trigram and position (a word within k edits of the query
+        # has each unedited trigram within k positions of where the query has it), and
+        # sorted by word length within a key so a length range is one contiguous slice
+        codes: dict[tuple, int] = {}
+        gram_codes, word_ids = array("i"), array("i")
+        for word_id, word in enumerate(words):
+            for position, gram in enumerate(trigrams(word)):
+                gram_codes.append(codes.setdefault((gram, position), len(codes)))
+                word_ids.append(word_id)
+        lengths = np.fromiter((len(w) for w in words), dtype=np.int32, count=len(words))
+        gram_codes = np.frombuffer(gram_codes, dtype=np.int32)
+        word_ids = np.frombuffer(word_ids, dtype=np.int32)
+        order = np.lexsort((lengths[word_ids], gram_codes))
+        self.postings = word_ids[order]
+        self.codes = codes
+        self.max_length = int(lengths.max(initial=0))
+
+        # offsets[code, n]: start of the words of length >= n in the postings of code
+        keys = gram_codes[order].astype(np.int64) * (self.max_length + 2) + lengths[self.postings]
+        grid = np.arange(len(codes) * (self.max_length + 2), dtype=np.int64)
+        self.offsets = np.searchsorted(keys, grid).astype(np.int32).reshape(len(codes), self.max_length + 2)
+
+    def search(self, word: str, max_distance: int) -> Optional[tuple]:
+        """
+        Closest vocabulary word within max_distance edits.
+
+        Returns:
+            (word, distance), or None when no word is close enough
+        """
+        grams = trigrams(word)
+        codes = [
+            code
+            for position, gram in enumerate(grams)
+            for shifted in range(max(0, position - max_distance), position + max_distance + 1)
+            if (code := self.codes.get((gram, shifted))) is not None
+        ]
+        shortest = min(max(0, len(word) - max_distance), self.max_length + 1)
+        longest = min(len(word) + max_distance + 1, self.max_length + 1)
+        starts = self.offsets[codes, shortest].tolist()
+        ends = self.offsets[codes, longest].tolist()
+        slices = [self.postings[start:end] for start, end in zip(starts, ends) if end > start]
+        if not slices:
+            return None
+        candidates, shared = np.unique(np.concatenate(slices), return_counts=True)
+
+        # An edit removes at most 3 of the word's trigrams, a transposition at most 4:
+        # a candidate sharing `shared` trigrams is at least (len(grams) - shared) / 4 edits away
+        keep = shared >= len(grams) - 4 * max_distance
+        candidates, shared = candidates[keep], shared[keep]
+        if len(candidates) > MAX_CANDIDATES:
+            top = np.argpartition(-shared, MAX_CANDIDATES - 1)[:MAX_CANDIDATES]
+            candidates, shared = candidates[top], shared[top]
+        order = np.argsort(-shared, kind="stable")
+
+        best = None
+        for word_id, common in zip(candidates[order].tolist(), shared[order].tolist()):
+            if best is not None and (len(grams) - common + 3) // 4 >= best[1]:
+                break  # no remaining candidate can be closer
+            candidate = self.words[word_id]
+            distance = damerau_levenshtein(word, candidate, max_distance)
+            if distance <= max_distance and (best is None or distance < best[1]):
+                best = (candidate, distance)
+                max_distance = distance
+        return best
+
+
+@dataclass
+class EntityMatch:
+    name: str                     # name as written in the corpus
+    query_text: str               # words of the question it was matched on
+    ids: list = field(default_factory=list)
+    distance: int = 0             # corrected characters
+
+    @property
+    def score(self) -> float:
+        return round(max(0.5, ENTITY_SCORE - ENTITY_SCORE_STEP * self.distance), 4)
+
+
+class FoodNameIndex:
+    """Names and aliases of food items with typo-tolerant matching"""
+
+    def __init__(self, items: Iterable[dict], known_words: Iterable[str] = ()):
+        """
+        Args:
+            items: Food items ({"id", "text", "region", "type"}); names come from the texts
+            known_words: Words that are correct as typed and must not be corrected into
+                a name word (the corpus vocabulary; query stopwords are always included)
+        """
+        self.items: dict[str, dict] = {}
+        self.names: dict[tuple, tuple] = {}     # name words -> (display name, [item ids])
+        for item in items:
+            item_id = str(item["id"])
+            self.items[item_id] = item
+            for name in extract_names(item.get("text", "")):
+                words = name_words(name)
+                if words:
+                    display, ids = self.names.setdefault(words, (name, []))
+                    if item_id not in ids:
+                        ids.append(item_id)
+        # How many names use a word: the more common of two equally close corrections is preferred
+        self.word_counts: dict[str, int] = {}
+        for words in self.names:
+            for word in set(words):
+                self.word_counts[word] = self.word_counts.get(word, 0) + 1
+        vocabulary = sorted(self.word_counts)
+        self.vocabulary = set(vocabulary)
+        self.known_words = {lemmatize(w) for w in QUERY_STOPWORDS} | set(known_words)
+        self.max_words = max((len(words) for words in self.names), default=0)
+        self.deletions = DeletionIndex(vocabulary)
+        self.trigrams = TrigramIndex(vocabulary)
+        self.corrections = lru_cache(maxsize=CORRECTION_CACHE_SIZE)(self._corrections)
+
+    @classmethod
+    def from_foods(cls, path: Union[str, Path] = FOODS_FILE) -> "FoodNameIndex":
+        from corpus_loader import iter_food_items
+
+        items = list(iter_food_items(path))
+        known = {lemmatize(w) for item in items for w in _WORD_RE.findall(fold(item.get("text", "")))}
+        return cls(items, known)
+
+    def _corrections(self, word: str) -> tuple:
+        """
+        Closest vocabulary words as ((word, distance), ...), most common first;
+        ((word, 0),) when it is left as typed.
+        """
+        if word in self.vocabulary or word in self.known_words or not max_typos(word):
+            return ((word, 0),)
+        # Most typos are a single edit, found by the deletion index alone
+        near = self.deletions.search(word)
+        if near:
+            near.sort(key=lambda w: (-self.word_counts[w], w))
+            return tuple((w, 1) for w in near[:MAX_CORRECTIONS])
+        if max_typos(word) > 1:
+            found = self.trigrams.search(word, 2)
+            if found is not None:
+                return (found,)
+        return ((word, 0),)
+
+    def correct(self, word: str) -> tuple:
+        """(vocabulary word, distance), or (word, 0) when it is left as typed"""
+        return self.corrections(word)[0]
+
+    def find(self, query: str) -> list[EntityMatch]:
+        """
+        Food names mentioned in a question, longest first, non-overlapping.
+
+        Args:
+            query: The user question (misspellings tolerated)
+
+        Returns:
+            One match per mentioned name
+        """
+        typed = _WORD_RE.findall(fold(query).replace("_", " "))
+        corrected = [self.corrections(lemmatize(w)) for w in typed]
+        matches, i = [], 0
+        while i < len(corrected):
+            for n in range(min(self.max_words, len(corrected) - i), 0, -1):
+                match = self._match_window(typed[i:i + n], corrected[i:i + n])
+                if match is not None:
+                    matches.append(match)
+                    i += n
+                    break
+            else:
+                i += 1
+        return matches
+
+    def _match_window(self, typed: list[str], corrected: list[tuple]) -> Optional[EntityMatch]:
+        """The name spelled by consecutive corrected words (first combination that is a name)"""
+        for combination in islice(product(*corrected), MAX_COMBINATIONS):
+            entry = self.names.get(tuple(w for w, _ in combination))
+            if entry is not None:
+                return EntityMatch(entry[0], " ".join(typed), list(entry[1]), sum(d for _, d in combination))
+        return None
+
+    def lookup(self, name: str) -> Optional[EntityMatch]:
+        """The item(s) a bare name refers to, or None"""
+        matches = self.find(name)
+        if len(matches) == 1 and len(matches[0].query_text.split()) == len(_WORD_RE.findall(fold(name))):
+            return matches[0]
+        return None
+
+    def is_entity_query(self, query: str, matches: list[EntityMatch]) -> bool:
+        """Whether the question asks about the named items and nothing else ("what is biriyani?")"""
+        if not matches:
+            return False
+        named = {lemmatize(w) for m in matches for w in m.query_text.split()}
+        rest = [lemmatize(w) for w in _WORD_RE.findall(fold(query))]
+        return all(w in named or w in self.known_words and w in QUERY_STOPWORDS for w in rest)
+
+    def results(self, matches: list[EntityMatch], top_k: int = 5) -> list[dict]:
+        """Named items shaped like rag_system.search_food_items output, flagged as named"""
+        results, seen = [], set()
+        for match in matches:
+            for item_id in match.ids:
+                if item_id in seen:
+                    continue
+                seen.add(item_id)
+                item = self.items[item_id]
+                results.append({
+                    "id": item_id,
+                    "score": match.score,
+                    "named": True,
+                    "data": item.get("text", ""),
+                    "metadata": {"text": item.get("text", ""), "region": item.get("region", ""),
+                                 "type": item.get("type", "")},
+                })
+        return results[:top_k]
+
+
+def boost_results(results: list[dict], entity_results: list[dict], top_k: int) -> list[dict]:
+    """
+    Merge named items into vector search results.
+
+    Named items go first, flagged "named". One that was also retrieved
+    keeps its vector score; a missing one is added with its display
+    score. The other results follow in their original order, cut to top_k.
+    """
+    if not entity_results:
+        return results
+    retrieved = {str(r["id"]): r for r in results}
+    named = [{**retrieved[e["id"]], "named": True} if e["id"] in retrieved else e for e in entity_results]
+    named_ids = {e["id"] for e in entity_results}
+    return (named + [r for r in results if str(r["id"]) not in named_ids])[:top_k]
+
+
+# ============================================
+# Benchmark
+# ============================================
+
+_ONSETS = "b bh br c ch d dh f g gh gr h j k kh kr l m n p ph pr r s sh sk st t th tr v w y z".split()
+_NUCLEI = "a a e e i i o o u u ai au ee ia oo ou".split()
+_CODAS = [""] * 8 + "k l m n ng r s t".split()
+
+
+def synthetic_names(n: int, vocabulary: int = 250_000, seed: int = 0) -> list[str]:
+    """
+    Distinct names of 1-3 pseudo-words.
+
+    Words are drawn from a fixed vocabulary with Zipf-like frequencies, as
+    real dish names reuse words ("chicken", "curry", "noodle soup").
+    """
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < vocabulary:
+        words.add("".join(rng.choice(_ONSETS) + rng.choice(_NUCLEI) + rng.choice(_CODAS)
+                          for _ in range(rng.randint(2, 4))))
+    words = sorted(words)
+    rng.shuffle(words)
+    weights = [1 / (rank + 10) for rank in range(len(words))]
+    names = set()
+    while len(names) < n:
+        batch = rng.choices(words, weights, k=3 * (n - len(names)))
+        for i in range(0, len(batch) - 2, 3):
+            names.add(" ".join(batch[i:i + rng.randint(1, 3)]))
+    return sorted(names)[:n]
+
+
+def misspell(word: str, rng: random.Random) -> str:
+    """One random insertion, deletion, substitution or transposition"""
+    i = rng.randrange(len(word))
+    op = rng.choice("idst")
+    if op == "i":
+        return word[:i] + rng.choice("aeiourn") + word[i:]
+    if op == "d" and len(word) > 1:
+        return word[:i] + word[i + 1:]
+    if op == "t" and i < len(word) - 1:
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word[:i] + rng.choice("aeiourn") + word[i + 1:]
+
+
+def benchmark(n: int, queries: int = 2000) -> dict:
+    names = synthetic_names(n)
+    start = time.perf_counter()
+    index = FoodNameIndex({"id": str(i), "text": f"{name} is a dish."} for i, name in enumerate(names))
+    build_s = time.perf_counter() - start
+
+    rng = random.Random(1)
+    latencies, found = [], 0
+    for name in rng.sample(names, min(queries, len(names))):
+        typo = " ".join(misspell(w, rng) if max_typos(w) else w for w in name.split())
+        index.corrections.cache_clear()  # cold lookups: every word is corrected from scratch
+        start = time.perf_counter()
+        match = index.lookup(typo)
+        latencies.append((time.perf_counter() - start) * 1e6)
+        found += match is not None and match.name == name
+    latencies = np.array(latencies)
+    return {
+        "entries": n,
+        "vocabulary": len(index.vocabulary),
+        "build_s": round(build_s, 1),
+        "p50_us": round(float(np.percentile(latencies, 50)), 1),
+        "p99_us": round(float(np.percentile(latencies, 99)), 1),
+        "recovered": round(found / len(latencies), 4),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Typo-tolerant food name lookup")
+    parser.add_argument("queries", nargs="*", help="Questions or names to match")
+    parser.add_argument("--bench", type=int, metavar="N", help="Benchmark lookups over N synthetic names")
+    args = parser.parse_args()
+
+    if args.bench:
+        print(f"⏱️ {benchmark(args.bench)}")
+    else:
+        food_index = FoodNameIndex.from_foods()
+        print(f"📇 {len(food_index.names)} names, {len(food_index.vocabulary)} words")
+        for query in args.queries or ["what is biriyani?", "samosaa", "Tell me about pad thai",
+                                      "is tteokboki spicy", "egg tart recipes", "I love spicy food"]:
+            start = time.perf_counter()
+            matches = food_index.find(query)
+            elapsed_us = (time.perf_counter() - start) * 1e6
+            shortcut = " (entity query)" if food_index.is_entity_query(query, matches) else ""
+            print(f"   {query!r}: {[(m.name, m.ids, m.distance) for m in matches]}{shortcut} "
+                  f"[{elapsed_us:.0f} µs]")
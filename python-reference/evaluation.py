@@ -0,0 +1,242 @@
+"""
+Retrieval Quality Evaluation
+Measure recall@k, MRR and nDCG against relevance judgments (qrels).
+
+data/qrels.json holds graded judgments for TEST_QUERIES (2 = highly
+relevant, 1 = relevant). Metrics are computed on (queries, k) NumPy
+arrays, so large query batches cost a few array operations. Any backend
+(quantized, reduced, sharded, cached, ...) can also be compared against
+exact search by overlap@k, and a quality floor decides whether it is
+safe to enable.
+
+The judgments cover data/foods.json. An index built from a smaller corpus
+(local-version/foods.json has 90 of its 110 items) cannot retrieve the
+missing ids, so judgments for ids that are not indexed are dropped (and
+reported) before scoring; otherwise recall would be capped below 1.
+
+Usage:
+    python evaluation.py local-version/index.snap --k 3
+    python evaluation.py local-version/index.snap --baseline local-version/local_baseline.json
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Callable, Sequence, Union
+
+import numpy as np
+
+QRELS_FILE = Path(__file__).parent / "data" / "qrels.json"
+
+# Default quality floor: a backend may lose at most MAX_METRIC_DROP of any
+# metric relative to exact search and must return MIN_OVERLAP of its results
+MAX_METRIC_DROP = 0.02
+MIN_OVERLAP = 0.9
+
+
+def load_qrels(path: Union[str, Path] = QRELS_FILE) -> dict:
+    """Relevance judgments: {query: {doc id: grade}}"""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["queries"]
+
+
+def restrict_qrels(qrels: dict, indexed_ids) -> tuple:
+    """
+    Judgments limited to documents that are in the index.
+
+    Returns:
+        (qrels without unindexed ids or queries left without judgments, number of judgments dropped)
+    """
+    indexed = set(indexed_ids)
+    restricted, dropped = {}, 0
+    for query, judged in qrels.items():
+        kept = {doc_id: grade for doc_id, grade in judged.items() if doc_id in indexed}
+        dropped += len(judged) - len(kept)
+        if kept:
+            restricted[query] = kept
+    return restricted, dropped
+
+
+def _pad(run: Sequence[Sequence[str]], k: int) -> list[list[str]]:
+    """Each ranked list cut or padded (with ids that match nothing) to length k"""
+    return [list(ids[:k]) + [""] * (k - len(ids[:k])) for ids in run]
+
+
+def relevance_grades(run: Sequence[Sequence[str]], judgments: Sequence[dict], k: int) -> np.ndarray:
+    """(queries, k) matrix of the grade of each retrieved document (0 = not relevant)"""
+    return np.array([[judged.get(doc_id, 0) for doc_id in ids]
+                     for ids, judged in zip(_pad(run, k), judgments)], dtype=np.float64).reshape(len(run), k)
+
+
+def ideal_grades(judgments: Sequence[dict], k: int) -> np.ndarray:
+    """(queries, k) matrix of the best possible grades at each rank"""
+    ideal = np.zeros((len(judgments), k))
+    for i, judged in enumerate(judgments):
+        grades = sorted(judged.values(), reverse=True)[:k]
+        ideal[i, :len(grades)] = grades
+    return ideal
+
+
+def recall_at_k(grades: np.ndarray, n_relevant: np.ndarray) -> np.ndarray:
+    found = (grades > 0).sum(axis=1)
+    return np.divide(found, n_relevant, out=np.zeros(len(grades)), where=n_relevant > 0)
+
+
+def reciprocal_rank(grades: np.ndarray) -> np.ndarray:
+    relevant = grades > 0
+    first = relevant.argmax(axis=1)
+    return np.where(relevant.any(axis=1), 1.0 / (first + 1), 0.0)
+
+
+def ndcg_at_k(grades: np.ndarray, ideal: np.ndarray) -> np.ndarray:
+    discounts = 1.0 / np.log2(np.arange(2, grades.shape[1] + 2))
+    dcg = ((2 ** grades - 1) * discounts).sum(axis=1)
+    idcg = ((2 ** ideal - 1) * discounts).sum(axis=1)
+    return np.divide(dcg, idcg, out=np.zeros(len(grades)), where=idcg > 0)
+
+
+def evaluate_run(queries: Sequence[str], run: Sequence[Sequence[str]], qrels: dict, k: int = 3) -> dict:
+    """
+    Mean recall@k, MRR and nDCG@k of a run.
+
+    Args:
+        queries: Query texts (looked up in qrels; unjudged queries are skipped)
+        run: Ranked document ids per query
+        qrels: Output of load_qrels
+        k: Cutoff
+
+    Returns:
+        {"queries": n, "recall@k": ..., "mrr": ..., "ndcg@k": ...}
+    """
+    judged = [i for i, q in enumerate(queries) if q in qrels]
+    judgments = [qrels[queries[i]] for i in judged]
+    grades = relevance_grades([run[i] for i in judged], judgments, k)
+    n_relevant = np.array([sum(1 for g in j.values() if g > 0) for j in judgments])
+    return {
+        "queries": len(judged),
+        f"recall@{k}": round(float(recall_at_k(grades, n_relevant).mean()), 4) if judged else 0.0,
+        "mrr": round(float(reciprocal_rank(grades).mean()), 4) if judged else 0.0,
+        f"ndcg@{k}": round(float(ndcg_at_k(grades, ideal_grades(judgments, k)).mean()), 4) if judged else 0.0,
+    }
+
+
+def overlap_at_k(run: Sequence[Sequence[str]], reference: Sequence[Sequence[str]], k: int = 3) -> float:
+    """Mean share of the reference (exact search) top-k that the run also returns"""
+    run_ids, ref_ids = _pad(run, k), _pad(reference, k)
+    vocab = {doc_id: n for n, doc_id in enumerate({d for ids in run_ids + ref_ids for d in ids if d})}
+    # Padding gets distinct negative codes so it never matches
+    run_codes = np.array([[vocab.get(d, -1) for d in ids] for ids in run_ids]).reshape(len(run_ids), k)
+    ref_codes = np.array([[vocab.get(d, -2) for d in ids] for ids in ref_ids]).reshape(len(ref_ids), k)
+    matches = (run_codes[:, :, None] == ref_codes[:, None, :]).any(axis=1).sum(axis=1)
+    ref_sizes = (ref_codes >= 0).sum(axis=1)
+    return float(np.divide(matches, ref_sizes, out=np.ones(len(ref_codes)), where=ref_sizes > 0).mean())
+
+
+def check_quality_floor(candidate: dict, exact: dict, max_drop: float = MAX_METRIC_DROP,
+                        min_overlap: float = MIN_OVERLAP) -> list[str]:
+    """
+    Failures of a backend's metrics against the exact-search metrics.
+
+    Returns:
+        Human-readable reasons; empty when the backend is safe to enable
+    """
+    failures = []
+    for metric, value in exact.items():
+        if metric in ("queries", "overlap") or metric not in candidate:
+            continue
+        if candidate[metric] < value - max_drop:
+            failures.append(f"{metric} {candidate[metric]} < {value} - {max_drop}")
+    if candidate.get("overlap", 1.0) < min_overlap:
+        failures.append(f"overlap {candidate['overlap']} < {min_overlap}")
+    return failures
+
+
+def compare_backends(queries: Sequence[str], backends: dict, qrels: dict, k: int = 3,
+                     reference: str = "exact", max_drop: float = MAX_METRIC_DROP,
+                     min_overlap: float = MIN_OVERLAP) -> list[dict]:
+    """
+    Evaluate search backends side by side against the exact-search reference.
+
+    Args:
+        queries: Query texts
+        backends: {name: Function(queries, k) -> ranked id lists}; must include `reference`
+        qrels: Output of load_qrels
+        k: Cutoff
+
+    Returns:
+        One row per backend with its metrics, overlap@k with the reference
+        and whether it passes the quality floor
+    """
+    runs = {name: search(list(queries), k) for name, search in backends.items()}
+    exact = evaluate_run(queries, runs[reference], qrels, k)
+    rows = []
+    for name, run in runs.items():
+        metrics = evaluate_run(queries, run, qrels, k)
+        metrics["overlap"] = round(overlap_at_k(run, runs[reference], k), 4)
+        failures = [] if name == reference else check_quality_floor(metrics, exact, max_drop, min_overlap)
+        rows.append({"backend": name, **metrics, "passed": not failures, "failures": failures})
+    return rows
+
+
+def index_backends(index, query_vectors: np.ndarray) -> dict:
+    """Exact, int8 and binary search over one VectorIndex (plus reduced search if configured)"""
+    from vector_index import normalize_rows, top_k
+
+    def ids(rows) -> list[str]:
+        return [index.docs.doc_id(int(r)) for r in rows]
+
+    def exact(queries, k):
+        # Full-dimension brute force, regardless of the index's configured search mode
+        rows, _ = top_k(normalize_rows(query_vectors) @ np.asarray(index.embeddings).T, k)
+        return [ids(r) for r in rows]
+
+    def search_with(mode: str) -> Callable:
+        return lambda queries, k: [ids(index.search(q, k, mode=mode)[0]) for q in query_vectors]
+
+    backends = {"exact": exact, "int8": search_with("int8"), "binary": search_with("binary")}
+    if index.reducer is not None:
+        backends[f"{index.reducer.method}-{index.reducer.dims}"] = search_with("float32")
+    return backends
+
+
+if __name__ == "__main__":
+    from embeddings import ollama_embed
+    from query_sets import all_test_queries
+    from vector_index import VectorIndex
+
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality against qrels")
+    parser.add_argument("snapshot", help="Path to an index snapshot")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--qrels", default=str(QRELS_FILE))
+    parser.add_argument("--baseline", help="Also score the retrieved_ids recorded in a baseline report")
+    parser.add_argument("--max-drop", type=float, default=MAX_METRIC_DROP)
+    parser.add_argument("--min-overlap", type=float, default=MIN_OVERLAP)
+    args = parser.parse_args()
+
+    queries = [q for q, _ in all_test_queries()]
+    index = VectorIndex.load(args.snapshot)
+    qrels, dropped = restrict_qrels(load_qrels(args.qrels), (index.docs.doc_id(r) for r in range(len(index))))
+    if dropped:
+        print(f"ℹ️ Dropped {dropped} judgments for ids not in {args.snapshot} "
+              f"({len(qrels)} judged queries left); build the index from data/foods.json to score them all")
+    print(f"🔢 Embedding {len(queries)} TEST_QUERIES with Ollama...")
+    query_vectors = ollama_embed(queries)
+
+    backends = index_backends(index, query_vectors)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            recorded = {r["query"]: r.get("retrieved_ids", []) for r in json.load(f)["results"]}
+        backends["baseline-report"] = lambda qs, k: [recorded.get(q, []) for q in qs]
+
+    rows = compare_backends(queries, backends, qrels, args.k, max_drop=args.max_drop,
+                            min_overlap=args.min_overlap)
+    k = args.k
+    print(f"\n{'Backend':<16} {'Recall@' + str(k):>9} {'MRR':>7} {'nDCG@' + str(k):>8} {'Overlap':>8}  Floor")
+    for row in rows:
+        status = "✅" if row["passed"] else "❌ " + "; ".join(row["failures"])
+        print(f"{row['backend']:<16} {row[f'recall@{k}']:>9} {row['mrr']:>7} {row[f'ndcg@{k}']:>8} "
+              f"{row['overlap']:>8}  {status}")
+
+    # Non-zero exit lets CI block enabling a backend that falls below the floor
+    sys.exit(0 if all(row["passed"] for row in rows) else 1)
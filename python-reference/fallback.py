@@ -0,0 +1,76 @@
+"""
+Fallback Chain
+What answers while a backend's circuit breaker is open.
+
+- Retrieval: an optional local index snapshot, queried with an Ollama
+  embedding, stands in for Upstash
+- Generation: registered answer sources (e.g. the answer cache's lookup)
+  are tried in order, then an answer built from the retrieved sources
+  alone; with no sources either, the fixed "unavailable" answer
+
+rag_system.py and cloud-version/rag_run.py share this chain.
+
+Usage:
+    fallbacks = FallbackChain.from_env()
+    results = upstash_breaker.call(search, query, fallback=fallbacks.searcher(query, top_k))
+    answer = fallbacks.answer(query, texts)
+
+Configuration (environment):
+    FALLBACK_SNAPSHOT   local index snapshot searched while Upstash is unavailable (default none)
+"""
+
+import os
+from typing import Callable, Optional, Sequence
+
+from circuit_breaker import breaker, first_answer, retrieval_only_answer
+
+
+class FallbackChain:
+    """Local retrieval and answer sources used while Upstash or Groq is unavailable"""
+
+    def __init__(self, snapshot: Optional[str] = None):
+        """
+        Args:
+            snapshot: VectorIndex snapshot searched instead of Upstash (None = no local retrieval)
+        """
+        self.index = None
+        if snapshot:
+            from vector_index import VectorIndex
+            self.index = VectorIndex.load(snapshot)
+        self.answer_sources = []
+
+    @classmethod
+    def from_env(cls) -> "FallbackChain":
+        return cls(os.getenv("FALLBACK_SNAPSHOT"))
+
+    def search(self, query: str, top_k: int = 5) -> list[dict]:
+        """
+        Search the local index.
+
+        Scores are converted from cosine to the Upstash scale, so the
+        confidence gate applies unchanged.
+        """
+        from embeddings import ollama_embed
+
+        vector = breaker("ollama").call(ollama_embed, [query])[0]
+        return [{**r, "score": (1 + r["score"]) / 2} for r in self.index.query(vector, k=top_k)]
+
+    def searcher(self, query: str, top_k: int = 5) -> Optional[Callable[[], list[dict]]]:
+        """Breaker fallback searching the local index, or None without one"""
+        return (lambda: self.search(query, top_k)) if self.index is not None else None
+
+    def register(self, source: Callable[[str], Optional[str]]) -> None:
+        """
+        Add an answer source used while generation is unavailable (e.g. a cached answer store).
+
+        Args:
+            source: Function(query) -> answer, or None when it has no answer
+        """
+        self.answer_sources.append(source)
+
+    def answer(self, query: str, texts: Sequence[str] = ()) -> str:
+        """Registered sources first, then an answer built from the retrieved texts"""
+        return first_answer(
+            *[lambda s=s: s(query) for s in self.answer_sources],
+            lambda: retrieval_only_answer(query, texts),
+        )
@@ -0,0 +1,184 @@
+"""
+Confidence Gating
+Decide from retrieval scores whether a question needs an LLM call at all.
+
+- No relevant match (best score below a floor): answer immediately with a
+  fixed "no relevant information" response
+- One source clearly answers a lookup-style question (high score and a
+  clear gap to the runner-up): optionally answer with the matching
+  sentences of that source
+- Otherwise: generate as usual
+
+Results found by name rather than by similarity (entity_index.py, flagged
+"named") carry no backend score: a question that names an item is always
+generated, never refused or answered extractively from such a score.
+
+Thresholds are expressed as cosine similarities so the same settings
+apply to every backend; Upstash scores ((1 + cosine) / 2) are converted
+before comparison.
+
+Configuration (environment):
+    GATE_MIN_SCORE         cosine floor below which nothing is relevant (default 0.25, "off" disables)
+    GATE_EXTRACTIVE        "1" enables extractive answers (default off)
+    GATE_EXTRACTIVE_SCORE  cosine required for an extractive answer (default 0.75)
+    GATE_EXTRACTIVE_GAP    cosine margin over the second result (default 0.08)
+"""
+
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Optional, Sequence
+
+from rerank import tokenize
+
+SCALES = ("cosine", "upstash")
+
+NO_RELEVANT_INFO = ("I couldn't find relevant information about that in the food knowledge base. "
+                    "Try asking about a specific dish, ingredient, cuisine or cooking method.")
+
+_LOOKUP_RE = re.compile(
+    r"^\s*(what|where|which|who|when)\s+(is|are|was|were|does|do)\b"
+    r"|^\s*(tell me about|describe|define)\b"
+    r"|\b(origin of|made of|made from|come from|comes from)\b",
+    re.IGNORECASE,
+)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+MAX_EXTRACTIVE_SENTENCES = 2
+
+
+@dataclass
+class GateDecision:
+    action: str                   # "generate", "no_answer" or "extractive"
+    reason: str
+    top_score: float              # cosine
+    gap: float                    # cosine margin between the two best results
+    answer: Optional[str] = None  # set unless action == "generate"
+
+    @property
+    def call_llm(self) -> bool:
+        return self.action == "generate"
+
+
+@dataclass
+class GateStats:
+    decisions: Counter = field(default_factory=Counter)
+
+    def record(self, decision: GateDecision) -> None:
+        self.decisions[decision.action] += 1
+
+    @property
+    def total(self) -> int:
+        return sum(self.decisions.values())
+
+    @property
+    def llm_calls_avoided(self) -> int:
+        return self.total - self.decisions["generate"]
+
+    @property
+    def avoided_rate(self) -> float:
+        return self.llm_calls_avoided / self.total if self.total else 0.0
+
+    def summary(self) -> dict:
+        return {
+            "questions": self.total,
+            "llm_calls_avoided": self.llm_calls_avoided,
+            "avoided_percent": round(self.avoided_rate * 100, 1),
+            "by_action": dict(self.decisions),
+        }
+
+
+def parse_floor(value: str) -> Optional[float]:
+    """GATE_MIN_SCORE value: a cosine, or "off"/"none" for no floor (cosines can be negative)"""
+    return None if value.strip().lower() in ("off", "none", "") else float(value)
+
+
+def is_lookup_question(question: str) -> bool:
+    """Short factual questions ("what is X", "where does X come from")"""
+    return bool(_LOOKUP_RE.search(question))
+
+
+def extract_answer(question: str, text: str, max_sentences: int = MAX_EXTRACTIVE_SENTENCES) -> Optional[str]:
+    """Sentences of text that share the most terms with the question, in document order"""
+    terms = set(tokenize(question))
+    sentences = [s for s in _SENTENCE_RE.split(text.strip()) if s]
+    overlaps = [len(terms & set(tokenize(s))) for s in sentences]
+    if not sentences or max(overlaps) == 0:
+        return None
+    best = sorted(range(len(sentences)), key=lambda i: -overlaps[i])[:max_sentences]
+    return " ".join(sentences[i] for i in sorted(best) if overlaps[i] > 0)
+
+
+class ConfidenceGate:
+    """Score-threshold and score-gap decision stage in front of generation"""
+
+    def __init__(self, min_score: Optional[float] = 0.25, extractive: bool = False,
+                 extractive_score: float = 0.75, extractive_gap: float = 0.08,
+                 scale: str = "cosine"):
+        """
+        Args:
+            min_score: Cosine floor for "something relevant was found" (None = no floor)
+            extractive: Allow extractive answers for confident lookups
+            extractive_score: Cosine required for an extractive answer
+            extractive_gap: Required cosine margin over the second result
+            scale: Score scale of the backend ("cosine" or "upstash")
+        """
+        if scale not in SCALES:
+            raise ValueError(f"Unknown score scale {scale!r}, expected one of {SCALES}")
+        self.min_score = float("-inf") if min_score is None else min_score
+        self.extractive = extractive
+        self.extractive_score = extractive_score
+        self.extractive_gap = extractive_gap
+        self.scale = scale
+        self.stats = GateStats()
+
+    @classmethod
+    def from_env(cls, scale: str = "cosine") -> "ConfidenceGate":
+        return cls(
+            min_score=parse_floor(os.getenv("GATE_MIN_SCORE", "0.25")),
+            extractive=os.getenv("GATE_EXTRACTIVE", "0") == "1",
+            extractive_score=float(os.getenv("GATE_EXTRACTIVE_SCORE", "0.75")),
+            extractive_gap=float(os.getenv("GATE_EXTRACTIVE_GAP", "0.08")),
+            scale=scale,
+        )
+
+    def to_cosine(self, score: float) -> float:
+        return 2 * score - 1 if self.scale == "upstash" else score
+
+    def decide(self, question: str, scores: Sequence[float], texts: Sequence[str] = (),
+               named: Sequence[bool] = ()) -> GateDecision:
+        """
+        Decide how to answer a question from its retrieval results.
+
+        Args:
+            question: The user question
+            scores: Retrieval scores in any order (backend scale)
+            texts: Document texts in the same order (needed for extractive answers)
+            named: Per result, whether it was matched by name (its score is not a similarity)
+
+        Returns:
+            The decision (also counted in self.stats)
+        """
+        named = list(named) + [False] * (len(scores) - len(named))
+        # Re-ranking, attribute filters and named items leave results out of score order
+        ranked = sorted(((self.to_cosine(s), i) for i, (s, by_name) in enumerate(zip(scores, named))
+                         if not by_name), reverse=True)
+        cosines = [cosine for cosine, _ in ranked]
+        top = cosines[0] if cosines else float("-inf")
+        gap = top - cosines[1] if len(cosines) > 1 else top
+
+        if any(named):
+            decision = GateDecision("generate", "names an item", top, gap)
+        elif not cosines or top < self.min_score:
+            decision = GateDecision("no_answer", "below score floor", top, gap, NO_RELEVANT_INFO)
+        else:
+            decision = GateDecision("generate", "needs synthesis", top, gap)
+            best = ranked[0][1]
+            if (self.extractive and best < len(texts) and top >= self.extractive_score
+                    and gap >= self.extractive_gap and is_lookup_question(question)):
+                answer = extract_answer(question, texts[best])
+                if answer:
+                    decision = GateDecision("extractive", "single confident source", top, gap, answer)
+        self.stats.record(decision)
+        return decision
@@ -8,11 +8,19 @@ Purpose: Week 3 AI Builder - Performance baseline for migration comparison
 """
 
 import os
+import sys
 import json
 import time
 import chromadb
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from pathlib import Path
+
+# Shared helpers live one level up in python-reference/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bench_history import env_config, record_run
+from token_usage import from_ollama_embed, from_ollama_generate
 
 # ============================================================================
 # CONFIGURATION
@@ -23,52 +31,32 @@ COLLECTION_NAME = "foods"
 EMBED_MODEL = "mxbai-embed-large"
 LLM_MODEL = "llama3.2"
 OUTPUT_FILE = "local_baseline.json"
+# Concurrent generations in batch mode (match OLLAMA_NUM_PARALLEL on the server)
+BATCH_MAX_WORKERS = 2
+# Per-query token fields copied into each result
+TOKEN_KEYS = ("embedding_tokens", "prompt_tokens", "completion_tokens", "tokens_per_second")
 
 # ============================================================================
 # TEST QUERIES (15 queries across 5 categories)
 # ============================================================================
 
-TEST_QUERIES = {
-    "semantic_similarity": [
-        "healthy Mediterranean options",
-        "light and refreshing summer dishes",
-        "warm comforting winter meals"
-    ],
-    "multi_criteria": [
-        "spicy vegetarian Asian dishes",
-        "quick easy breakfast options",
-        "creamy pasta dishes from Italy"
-    ],
-    "nutritional": [
-        "high-protein low-carb foods",
-        "foods rich in vitamins and antioxidants",
-        "heart-healthy meal options"
-    ],
-    "cultural_exploration": [
-        "traditional comfort foods",
-        "authentic street food dishes",
-        "festive celebration meals"
-    ],
-    "cooking_method": [
-        "dishes that can be grilled",
-        "slow-cooked tender meals",
-        "fresh raw preparations"
-    ]
-}
+# The same 15 queries are shared by every test and benchmark script
+from query_sets import TEST_QUERIES
 
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
 
 def get_embedding_timed(text):
-    """Get embedding from Ollama and return (embedding, time_ms)"""
+    """Get embedding from Ollama and return (embedding, time_ms, TokenUsage)"""
     start = time.perf_counter()
     response = requests.post("http://localhost:11434/api/embeddings", json={
         "model": EMBED_MODEL,
         "prompt": text
     })
     elapsed_ms = (time.perf_counter() - start) * 1000
-    return response.json()["embedding"], elapsed_ms
+    body = response.json()
+    return body["embedding"], elapsed_ms, from_ollama_embed(body, EMBED_MODEL, elapsed_ms / 1000, [text])
 
 
 def query_chromadb_timed(collection, query_embedding, n_results=3):
@@ -80,7 +68,7 @@ def query_chromadb_timed(collection, query_embedding, n_results=3):
 
 
 def generate_response_timed(prompt):
-    """Generate LLM response from Ollama and return (response, time_ms)"""
+    """Generate LLM response from Ollama and return (response, time_ms, TokenUsage)"""
     start = time.perf_counter()
     response = requests.post("http://localhost:11434/api/generate", json={
         "model": LLM_MODEL,
@@ -88,7 +76,8 @@ def generate_response_timed(prompt):
         "stream": False
     })
     elapsed_ms = (time.perf_counter() - start) * 1000
-    return response.json()["response"].strip(), elapsed_ms
+    body = response.json()
+    return body["response"].strip(), elapsed_ms, from_ollama_generate(body, LLM_MODEL, elapsed_ms / 1000)
 
 
 def run_rag_query_timed(collection, question):
@@ -99,7 +88,7 @@ def run_rag_query_timed(collection, question):
     total_start = time.perf_counter()
     
     # Phase 1: Embedding
-    query_embedding, embedding_ms = get_embedding_timed(question)
+    query_embedding, embedding_ms, embedding_usage = get_embedding_timed(question)
     
     # Phase 2: Retrieval
     results, retrieval_ms = query_chromadb_timed(collection, query_embedding)
@@ -118,7 +107,7 @@ Question: {question}
 Answer:"""
     
     # Phase 4: Generation
-    response, generation_ms = generate_response_timed(prompt)
+    response, generation_ms, usage = generate_response_timed(prompt)
     
     total_ms = (time.perf_counter() - total_start) * 1000
     
@@ -127,17 +116,94 @@ Answer:"""
         "retrieval_ms": round(retrieval_ms, 2),
         "generation_ms": round(generation_ms, 2),
         "total_ms": round(total_ms, 2),
+        **token_fields(usage, embedding_usage.prompt_tokens),
         "retrieved_ids": top_ids,
         "response_preview": response[:200] + "..." if len(response) > 200 else response
     }
 
 
+def token_fields(usage, embedding_tokens):
+    """Per-query token counts and throughput of a generation"""
+    return {
+        "embedding_tokens": embedding_tokens,
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "tokens_per_second": round(usage.tokens_per_second, 1)
+    }
+
+
+def get_embeddings_batch_timed(texts):
+    """Embed many texts with one Ollama /api/embed call and return (embeddings, time_ms, TokenUsage)"""
+    start = time.perf_counter()
+    response = requests.post("http://localhost:11434/api/embed", json={
+        "model": EMBED_MODEL,
+        "input": texts
+    })
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    body = response.json()
+    return body["embeddings"], elapsed_ms, from_ollama_embed(body, EMBED_MODEL, elapsed_ms / 1000, texts)
+
+
+def run_rag_queries_batch_timed(collection, questions, max_workers=BATCH_MAX_WORKERS):
+    """
+    Run many RAG queries as one batch.
+    Embedding is one batched call, retrieval is one bulk ChromaDB query and
+    generations are dispatched concurrently on a bounded pool.
+    Returns a list of timing dicts in the same order as questions.
+    """
+    if not questions:
+        return []
+    
+    # Phase 1: Embedding (one call for the whole batch)
+    query_embeddings, embedding_ms, embedding_usage = get_embeddings_batch_timed(questions)
+    
+    # Phase 2: Retrieval (one bulk query)
+    start = time.perf_counter()
+    results = collection.query(query_embeddings=query_embeddings, n_results=3)
+    retrieval_ms = (time.perf_counter() - start) * 1000
+    
+    # Phase 3: Build prompts
+    prompts = []
+    for question, top_docs in zip(questions, results['documents']):
+        context = "\n".join(top_docs)
+        prompts.append(f"""Use the following context to answer the question.
+
+Context:
+{context}
+
+Question: {question}
+Answer:""")
+    
+    # Phase 4: Generation (bounded concurrency)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        generations = list(pool.map(generate_response_timed, prompts))
+    
+    # Batched phases are charged to each query as its share of the batch
+    n = len(questions)
+    timings = []
+    for top_ids, (response, generation_ms, usage) in zip(results['ids'], generations):
+        total_ms = embedding_ms / n + retrieval_ms / n + generation_ms
+        timings.append({
+            "embedding_ms": round(embedding_ms / n, 2),
+            "retrieval_ms": round(retrieval_ms / n, 2),
+            "generation_ms": round(generation_ms, 2),
+            "total_ms": round(total_ms, 2),
+            **token_fields(usage, round(embedding_usage.prompt_tokens / n)),
+            "retrieved_ids": top_ids,
+            "response_preview": response[:200] + "..." if len(response) > 200 else response
+        })
+    return timings
+
+
 # ============================================================================
 # MAIN TEST RUNNER
 # ============================================================================
 
-def run_performance_tests():
-    """Run all 15 test queries and collect timing data."""
+def run_performance_tests(batch=False):
+    """
+    Run all 15 test queries and collect timing data.
+    With batch=True the queries run through run_rag_queries_batch_timed.
+    """
     
     print("=" * 70)
     print("🚀 LOCAL RAG PERFORMANCE TEST")
@@ -165,6 +231,38 @@ def run_performance_tests():
     query_count = 0
     total_queries = sum(len(queries) for queries in TEST_QUERIES.values())
     
+    if batch:
+        print(f"📦 Batch mode: {total_queries} queries, {BATCH_MAX_WORKERS} concurrent generations")
+        batch_queries = [(query, category)
+                         for category, queries in TEST_QUERIES.items()
+                         for query in queries]
+        batch_start = time.perf_counter()
+        try:
+            timings = run_rag_queries_batch_timed(collection, [q for q, _ in batch_queries])
+            for (query, category), timing_data in zip(batch_queries, timings):
+                results.append({
+                    "query": query,
+                    "category": category,
+                    "embedding_ms": timing_data["embedding_ms"],
+                    "retrieval_ms": timing_data["retrieval_ms"],
+                    "generation_ms": timing_data["generation_ms"],
+                    "total_ms": timing_data["total_ms"],
+                    **{key: timing_data[key] for key in TOKEN_KEYS},
+                    "retrieved_ids": timing_data["retrieved_ids"],
+                    "status": "success"
+                })
+        except Exception as e:
+            print(f"   ❌ Error: {str(e)}")
+            for query, category in batch_queries:
+                results.append({
+                    "query": query,
+                    "category": category,
+                    "status": "error",
+                    "error": str(e)
+                })
+        print(f"✅ Batch completed in {time.perf_counter() - batch_start:.2f} s")
+        return results
+    
     for category, queries in TEST_QUERIES.items():
         print(f"\n📁 Category: {category.upper().replace('_', ' ')}")
         print("-" * 50)
@@ -183,6 +281,7 @@ def run_performance_tests():
                     "retrieval_ms": timing_data["retrieval_ms"],
                     "generation_ms": timing_data["generation_ms"],
                     "total_ms": timing_data["total_ms"],
+                    **{key: timing_data[key] for key in TOKEN_KEYS},
                     "retrieved_ids": timing_data["retrieved_ids"],
                     "status": "success"
                 }
@@ -192,6 +291,8 @@ def run_performance_tests():
                 print(f"   ⏱️  Retrieval:  {timing_data['retrieval_ms']:>8.2f} ms")
                 print(f"   ⏱️  Generation: {timing_data['generation_ms']:>8.2f} ms")
                 print(f"   ⏱️  TOTAL:      {timing_data['total_ms']:>8.2f} ms")
+                print(f"   🪙 Tokens:     {timing_data['prompt_tokens']} in / "
+                      f"{timing_data['completion_tokens']} out ({timing_data['tokens_per_second']} tok/s)")
                 print(f"   📋 Retrieved IDs: {timing_data['retrieved_ids']}")
                 
             except Exception as e:
@@ -228,7 +329,27 @@ def calculate_summary(results):
         "avg_total_ms": round(sum(total_times) / len(total_times), 2),
         "min_total_ms": round(min(total_times), 2),
         "max_total_ms": round(max(total_times), 2),
-        "median_total_ms": round(sorted(total_times)[len(total_times) // 2], 2)
+        "median_total_ms": round(sorted(total_times)[len(total_times) // 2], 2),
+        "avg_prompt_tokens": round(sum(r["prompt_tokens"] for r in successful) / len(successful), 1),
+        "avg_completion_tokens": round(sum(r["completion_tokens"] for r in successful) / len(successful), 1),
+        "avg_tokens_per_second": round(sum(r["tokens_per_second"] for r in successful) / len(successful), 1),
+        "tokens_by_category": tokens_by_category(successful)
+    }
+
+
+def tokens_by_category(results):
+    """Average prompt/completion tokens and generation throughput per query category"""
+    categories = {}
+    for r in results:
+        categories.setdefault(r["category"], []).append(r)
+    return {
+        cat: {
+            "count": len(rows),
+            "avg_prompt_tokens": round(sum(r["prompt_tokens"] for r in rows) / len(rows), 1),
+            "avg_completion_tokens": round(sum(r["completion_tokens"] for r in rows) / len(rows), 1),
+            "avg_tokens_per_second": round(sum(r["tokens_per_second"] for r in rows) / len(rows), 1)
+        }
+        for cat, rows in categories.items()
     }
 
 
@@ -254,6 +375,19 @@ def save_results(results, summary):
     return output
 
 
+def record_history(results, batch):
+    """Append this run's per-stage latencies to the benchmark history"""
+    successful = [r for r in results if r.get("status") == "success"]
+    stages = {stage: [r[stage] for r in successful]
+              for stage in ("embedding_ms", "retrieval_ms", "generation_ms", "total_ms")}
+    return record_run("local", {
+        "mode": "batch" if batch else "sequential",
+        "embed_model": EMBED_MODEL,
+        "llm": LLM_MODEL,
+        **env_config(["SEARCH_MODE", "REDUCE_DIMS", "SHARDS"])
+    }, stages)
+
+
 def print_summary(summary):
     """Print formatted summary to console."""
     print("\n" + "=" * 70)
@@ -271,6 +405,10 @@ def print_summary(summary):
     print(f"   Min Total:          {summary['min_total_ms']:>8.2f} ms")
     print(f"   Max Total:          {summary['max_total_ms']:>8.2f} ms")
     print(f"   Median Total:       {summary['median_total_ms']:>8.2f} ms")
+    print("-" * 70)
+    print(f"   Avg Prompt Tokens:  {summary['avg_prompt_tokens']:>8.1f}")
+    print(f"   Avg Output Tokens:  {summary['avg_completion_tokens']:>8.1f}")
+    print(f"   Avg Throughput:     {summary['avg_tokens_per_second']:>8.1f} tok/s")
     print("=" * 70)
 
 
@@ -280,19 +418,21 @@ def print_summary(summary):
 
 if __name__ == "__main__":
     try:
-        # Run tests
-        results = run_performance_tests()
+        # Run tests (pass --batch for batched embedding/retrieval + concurrent generation)
+        batch = "--batch" in sys.argv
+        results = run_performance_tests(batch=batch)
         
         # Calculate summary
         summary = calculate_summary(results)
         
-        # Save to JSON
+        # Save to JSON (latest run) and append to the benchmark history
         output = save_results(results, summary)
+        run = record_history(results, batch)
         
         # Print summary
         print_summary(summary)
         
-        print(f"\n💾 Results saved to: {OUTPUT_FILE}")
+        print(f"\n💾 Results saved to: {OUTPUT_FILE} (history run {run['run_id']})")
         print("\n✅ Performance test complete!")
         print("📝 Use this baseline data to compare against your cloud-migrated version.")
         
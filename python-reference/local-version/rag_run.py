@@ -1,66 +1,183 @@
 import os
-import json
+import sys
+import time
 import chromadb
-import requests
+from pathlib import Path
+
+# Shared helpers (corpus loader, ...) live one level up in python-reference/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from circuit_breaker import UNAVAILABLE_ANSWER, CircuitOpenError, breaker, retrieval_only_answer
+from conversation import ConversationMemory, summary_prompt
+from corpus_loader import LoadStats, iter_food_items
+from embeddings import OLLAMA_URL, session as ollama_session
+from gating import ConfidenceGate
+from sharding import ShardedIndex, build_local_shards
+from snapshot import SnapshotError
+from token_usage import UsageLedger, from_ollama_embed, from_ollama_generate
+from vector_index import VectorIndex
+from warmup import (OLLAMA_KEEP_ALIVE, WARMUP_ENABLED, ollama_embed_task, ollama_generate_task, print_report,
+                    touch_task, warm_up)
 
 # Constants
 CHROMA_DIR = "chroma_db"
 COLLECTION_NAME = "foods"
-JSON_FILE = "foods.json"
+JSON_FILE = os.getenv("FOODS_FILE", "foods.json")  # .json, .jsonl/.ndjson, optionally .gz
 EMBED_MODEL = "mxbai-embed-large"
 LLM_MODEL = "llama3.2"
-
-# Load data
-with open(JSON_FILE, "r", encoding="utf-8") as f:
-    food_data = json.load(f)
+# Memory-mapped snapshot of the embeddings + documents (reloads in milliseconds)
+SNAPSHOT_FILE = os.getenv("INDEX_SNAPSHOT", "index.snap")
+# Retrieval backend: float32 (exact), int8 or binary (quantized + float rescoring)
+SEARCH_MODE = os.getenv("SEARCH_MODE", "float32")
+# Optional reduced-dimension search, e.g. REDUCE_DIMS=256 REDUCE_METHOD=pca|matryoshka
+REDUCE_DIMS = int(os.getenv("REDUCE_DIMS", "0"))
+REDUCE_METHOD = os.getenv("REDUCE_METHOD", "pca")
+# Optional sharded search with parallel scatter-gather, e.g. SHARDS=4 SHARD_BY=hash|type|region
+SHARDS = int(os.getenv("SHARDS", "0"))
+SHARD_BY = os.getenv("SHARD_BY", "hash")
+# Score-based gate that skips Ollama for irrelevant results (GATE_MIN_SCORE, GATE_EXTRACTIVE, ...)
+gate = ConfidenceGate.from_env(scale="cosine")
+# Token counts and throughput of every Ollama call (local models cost nothing per call)
+usage_ledger = UsageLedger()
+# Fail fast while Ollama is down or overloaded instead of waiting on every question
+ollama_breaker = breaker("ollama")
+# Tokens of conversation history (summary + recent turns) sent with each question
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "1024"))
 
 # Setup ChromaDB
 chroma_client = chromadb.PersistentClient(path=CHROMA_DIR)
 collection = chroma_client.get_or_create_collection(name=COLLECTION_NAME)
 
 # Ollama embedding function
-def get_embedding(text):
-    response = requests.post("http://localhost:11434/api/embeddings", json={
+def get_embedding(text, category="all"):
+    start = time.time()
+    response = ollama_session.post(f"{OLLAMA_URL}/api/embeddings", json={
         "model": EMBED_MODEL,
-        "prompt": text
+        "prompt": text,
+        "keep_alive": OLLAMA_KEEP_ALIVE
     })
-    return response.json()["embedding"]
+    body = response.json()
+    usage_ledger.record(from_ollama_embed(body, EMBED_MODEL, time.time() - start, [text]), category)
+    return body["embedding"]
 
-# Add only new items
+# Add only new items (streamed from disk, never fully loaded)
 existing_ids = set(collection.get()['ids'])
-new_items = [item for item in food_data if item['id'] not in existing_ids]
-
-if new_items:
-    print(f"🆕 Adding {len(new_items)} new documents to Chroma...")
-    for item in new_items:
-        # Enhance text with region/type
-        enriched_text = item["text"]
-        if "region" in item:
-            enriched_text += f" This food is popular in {item['region']}."
-        if "type" in item:
-            enriched_text += f" It is a type of {item['type']}."
-
-        emb = get_embedding(enriched_text)
-
-        collection.add(
-            documents=[item["text"]],  # Use original text as retrievable context
-            embeddings=[emb],
-            ids=[item["id"]]
-        )
+load_stats = LoadStats()
+added = 0
+
+for item in iter_food_items(JSON_FILE, load_stats):
+    if item['id'] in existing_ids:
+        continue
+    # Enhance text with region/type
+    enriched_text = item["text"]
+    if "region" in item:
+        enriched_text += f" This food is popular in {item['region']}."
+    if "type" in item:
+        enriched_text += f" It is a type of {item['type']}."
+
+    emb = get_embedding(enriched_text, "indexing")
+
+    collection.add(
+        documents=[item["text"]],  # Use original text as retrievable context
+        embeddings=[emb],
+        metadatas=[{"region": item.get("region", "Unknown"), "type": item.get("type", "Unknown")}],
+        ids=[item["id"]]
+    )
+    added += 1
+
+if added:
+    print(f"🆕 Added {added} new documents to Chroma.")
 else:
     print("✅ All documents already in ChromaDB.")
+if load_stats.skipped:
+    print(f"⚠️ Skipped invalid rows: {load_stats.summary()}")
+
+# Load the in-memory index from its snapshot (no re-embedding after a restart)
+def build_snapshot():
+    data = collection.get(include=["embeddings", "documents", "metadatas"])
+    metadatas = [m or {} for m in data["metadatas"]]
+    new_index = VectorIndex.build(
+        data["embeddings"],
+        data["ids"],
+        data["documents"],
+        regions=[m.get("region") for m in metadatas],
+        types=[m.get("type") for m in metadatas],
+        model=EMBED_MODEL
+    )
+    new_index.mode = SEARCH_MODE  # quantized codes are stored in the snapshot too
+    if REDUCE_DIMS:
+        # Remembered so a snapshot that could not be reduced is not rebuilt on every start
+        new_index.meta["requested_reduce_dims"] = REDUCE_DIMS
+        try:
+            new_index.reduce(REDUCE_DIMS, REDUCE_METHOD)
+        except ValueError as e:
+            print(f"⚠️ Searching full-dimension vectors instead: {e}")
+    new_index.save(SNAPSHOT_FILE)
+    return VectorIndex.load(SNAPSHOT_FILE)
+
+def load_vector_index():
+    if not added and os.path.exists(SNAPSHOT_FILE):
+        try:
+            snapshot_index = VectorIndex.load(SNAPSHOT_FILE, mode=SEARCH_MODE)
+            if (len(snapshot_index) == collection.count()
+                    and snapshot_index.meta.get("model") == EMBED_MODEL
+                    and snapshot_index.meta.get("requested_reduce_dims", 0) == REDUCE_DIMS):
+                print(f"⚡ Loaded index snapshot ({len(snapshot_index)} documents) from {SNAPSHOT_FILE}")
+                return snapshot_index
+        except (SnapshotError, ValueError) as e:
+            print(f"⚠️ Ignoring unusable snapshot: {e}")
+    print(f"💾 Writing index snapshot to {SNAPSHOT_FILE}...")
+    return build_snapshot()
+
+vector_index = load_vector_index()
+if SHARDS > 1:
+    vector_index = ShardedIndex(build_local_shards(vector_index, SHARDS, SHARD_BY))
+    print(f"🧩 Searching {len(vector_index.shards)} shards (partitioned by {SHARD_BY})")
+
+# Background conversation summarizer (runs off the question's critical path)
+def summarize_with_ollama(previous, turns):
+    start = time.time()
+    response = ollama_session.post(f"{OLLAMA_URL}/api/generate", json={
+        "model": LLM_MODEL,
+        "prompt": summary_prompt(previous, turns),
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE
+    })
+    body = response.json()
+    usage_ledger.record(from_ollama_generate(body, LLM_MODEL, time.time() - start), "summary")
+    return body["response"]
 
-# RAG query
-def rag_query(question):
-    # Step 1: Embed the user question
-    q_emb = get_embedding(question)
+def generate_answer(prompt):
+    start = time.time()
+    response = ollama_session.post(f"{OLLAMA_URL}/api/generate", json={
+        "model": LLM_MODEL,
+        "prompt": prompt,
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE
+    })
+    response.raise_for_status()
+    body = response.json()
+    usage_ledger.record(from_ollama_generate(body, LLM_MODEL, time.time() - start))
+    return body["response"].strip()
 
-    # Step 2: Query the vector DB
-    results = collection.query(query_embeddings=[q_emb], n_results=3)
+# RAG query
+def rag_query(question, memory=None):
+    # Step 1: Embed the user question (follow-ups are made standalone first)
+    search_query = memory.standalone_query(question) if memory is not None else question
+    usage_ledger.count_query()
+    try:
+        q_emb = ollama_breaker.call(get_embedding, search_query)
+    except CircuitOpenError:
+        return UNAVAILABLE_ANSWER
+
+    # Step 2: Query the in-memory index
+    if SHARDS > 1:
+        results = vector_index.search(q_emb, k=3)
+    else:
+        results = vector_index.query(q_emb, k=3)
 
     # Step 3: Extract documents
-    top_docs = results['documents'][0]
-    top_ids = results['ids'][0]
+    top_docs = [r["data"] for r in results]
+    top_ids = [r["id"] for r in results]
 
     # Step 4: Show friendly explanation of retrieved documents
     print("\n🧠 Retrieving relevant information to reason through your question...\n")
@@ -71,7 +188,15 @@ def rag_query(question):
 
     print("📚 These seem to be the most relevant pieces of information to answer your question.\n")
 
-    # Step 5: Build prompt from context
+    # Step 5: Skip generation when the scores already decide the answer
+    decision = gate.decide(search_query, [r["score"] for r in results], top_docs)
+    if not decision.call_llm:
+        print(f"⚡ Answered without the LLM ({decision.reason}, top score {decision.top_score:.3f})\n")
+        if memory is not None:
+            memory.add_turn(question, decision.answer, search_query)
+        return decision.answer
+
+    # Step 6: Build prompt from context
     context = "\n".join(top_docs)
 
     prompt = f"""Use the following context to answer the question.
@@ -81,24 +206,44 @@ Context:
 
 Question: {question}
 Answer:"""
+    if memory is not None and memory.turns:
+        prompt = f"""{memory.context()}
 
-    # Step 6: Generate answer with Ollama
-    response = requests.post("http://localhost:11434/api/generate", json={
-        "model": LLM_MODEL,
-        "prompt": prompt,
-        "stream": False
-    })
+{prompt}"""
 
-    # Step 7: Return final result
-    return response.json()["response"].strip()
+    # Step 7: Generate answer with Ollama (retrieval-only answer while Ollama is down)
+    answer = ollama_breaker.call(generate_answer, prompt,
+                                 fallback=lambda: retrieval_only_answer(question, top_docs))
 
+    # Step 8: Return final result
+    if memory is not None:
+        memory.add_turn(question, answer, search_query)
+    return answer
+
+
+# Warm-up: load both Ollama models (kept resident) and fault in the index pages concurrently
+if WARMUP_ENABLED:
+    print("🔥 Warming up...")
+    report = warm_up({
+        "ollama embed": ollama_embed_task(ollama_session, OLLAMA_URL, EMBED_MODEL),
+        "ollama generate": ollama_generate_task(ollama_session, OLLAMA_URL, LLM_MODEL),
+        "index pages": touch_task(vector_index),
+    })
+    print_report(report)
 
 # Interactive loop
 print("\n🧠 RAG is ready. Ask a question (type 'exit' to quit):\n")
+memory = ConversationMemory(summarize=summarize_with_ollama, token_budget=CONVERSATION_TOKEN_BUDGET)
 while True:
     question = input("You: ")
     if question.lower() in ["exit", "quit"]:
+        if gate.stats.total:
+            print(f"📊 LLM calls avoided: {gate.stats.llm_calls_avoided}/{gate.stats.total}")
+        generation = usage_ledger.by_category().get("all", {}).get("generation")
+        if generation:
+            print(f"🪙 Tokens: {generation['prompt_tokens']} in / {generation['completion_tokens']} out "
+                  f"({generation['tokens_per_second']} tok/s)")
         print("👋 Goodbye!")
         break
-    answer = rag_query(question)
+    answer = rag_query(question, memory)
     print("🤖:", answer)
@@ -0,0 +1,238 @@
+"""
+Speculative Retrieval Prefetch
+Start retrieval while the user is still typing.
+
+The client sends partial-query updates (keystrokes from a chat box).
+After a debounce pause the current text is retrieved speculatively on a
+background worker; newer updates cancel queued work that has not started.
+When the final query arrives and matches a prefetched key, its results
+are already warm (or in flight), so retrieval latency disappears from
+the response time. Every speculative retrieval that is never used is
+counted as wasted work.
+
+Usage:
+    python prefetch.py --cps 8 --pause-ms 400   # simulate typing TEST_QUERIES
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from query_precompute import normalize_query
+
+DEFAULT_DEBOUNCE_MS = 150.0
+# Partial queries shorter than this (after normalization) are not worth retrieving
+MIN_QUERY_CHARS = 4
+
+
+@dataclass
+class PrefetchStats:
+    """Counters for prefetch effectiveness and wasted work"""
+
+    updates: int = 0           # partial-query updates received
+    debounced: int = 0         # updates superseded before their debounce timer fired
+    cancelled: int = 0         # speculative retrievals cancelled before they started
+    started: int = 0           # speculative retrievals executed
+    hits: int = 0              # final queries served from a finished prefetch
+    inflight_hits: int = 0     # final queries that joined a prefetch still running
+    misses: int = 0            # final queries retrieved from scratch
+    wasted: int = 0            # speculative retrievals whose results were never used
+    wasted_ms: float = 0.0     # time spent on those retrievals
+    saved_ms: float = 0.0      # retrieval time taken off the critical path by hits
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.inflight_hits + self.misses
+        return (self.hits + self.inflight_hits) / total if total else 0.0
+
+    @property
+    def waste_ratio(self) -> float:
+        """Share of speculative retrievals that were thrown away"""
+        return self.wasted / self.started if self.started else 0.0
+
+    def summary(self) -> dict:
+        return {
+            "updates": self.updates,
+            "speculative_retrievals": self.started,
+            "hit_rate": round(self.hit_rate, 4),
+            "hits": self.hits,
+            "inflight_hits": self.inflight_hits,
+            "misses": self.misses,
+            "wasted": self.wasted,
+            "waste_ratio": round(self.waste_ratio, 4),
+            "wasted_ms": round(self.wasted_ms, 2),
+            "saved_ms": round(self.saved_ms, 2),
+            "debounced": self.debounced,
+            "cancelled": self.cancelled,
+        }
+
+
+class Prefetcher:
+    """Debounced speculative retrieval for one query session (e.g. one chat box)"""
+
+    def __init__(self, retrieve: Callable[[str], list], debounce_ms: float = DEFAULT_DEBOUNCE_MS,
+                 min_chars: int = MIN_QUERY_CHARS):
+        """
+        Args:
+            retrieve: Function(query) -> results (embedding + vector search)
+            debounce_ms: Quiet period after the last update before retrieving
+            min_chars: Minimum normalized query length to prefetch
+        """
+        self.retrieve = retrieve
+        self.debounce_s = debounce_ms / 1000
+        self.min_chars = min_chars
+        self.stats = PrefetchStats()
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._generation = 0
+        # normalized query -> Future of (results, elapsed_ms)
+        self._inflight: dict[str, Future] = {}
+        # One worker: speculative work never competes with itself
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+
+    def update(self, partial_query: str) -> None:
+        """Report the current (partial) query text; retrieval starts after the debounce pause"""
+        key = normalize_query(partial_query)
+        with self._lock:
+            self.stats.updates += 1
+            self._generation += 1
+            self._cancel_timer()
+            if len(key) < self.min_chars or key in self._inflight:
+                return
+            self._timer = threading.Timer(self.debounce_s, self._fire,
+                                          (self._generation, key, partial_query))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _cancel_timer(self) -> None:
+        if self._timer is not None:
+            if not self._timer.finished.is_set():
+                self.stats.debounced += 1
+            self._timer.cancel()
+            self._timer = None
+
+    def _fire(self, generation: int, key: str, query: str) -> None:
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._timer = None
+            # Queued speculative work for older text is stale now
+            for stale_key, future in list(self._inflight.items()):
+                if future.cancel():
+                    self.stats.cancelled += 1
+                    del self._inflight[stale_key]
+            self._inflight[key] = self._executor.submit(self._timed_retrieve, query)
+
+    def _timed_retrieve(self, query: str) -> tuple:
+        with self._lock:
+            self.stats.started += 1
+        start = time.perf_counter()
+        results = self.retrieve(query)
+        return results, (time.perf_counter() - start) * 1000
+
+    def get(self, query: str) -> tuple:
+        """
+        Results for the submitted query, reusing a prefetch when one matches.
+
+        Unused speculative work for this session is accounted as wasted and
+        the session is reset for the next query.
+
+        Returns:
+            (results, source) with source "prefetch", "inflight" or "miss"
+        """
+        key = normalize_query(query)
+        with self._lock:
+            self._generation += 1
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            future = self._inflight.pop(key, None)
+            leftovers, self._inflight = self._inflight, {}
+        for leftover in leftovers.values():
+            self._discard(leftover)
+
+        if future is not None and not future.cancelled():
+            source = "prefetch" if future.done() else "inflight"
+            try:
+                results, elapsed_ms = future.result()
+            except Exception:
+                pass
+            else:
+                with self._lock:
+                    if source == "prefetch":
+                        self.stats.hits += 1
+                        self.stats.saved_ms += elapsed_ms
+                    else:
+                        self.stats.inflight_hits += 1
+                return results, source
+
+        with self._lock:
+            self.stats.misses += 1
+        return self.retrieve(query), "miss"
+
+    def _discard(self, future: Future) -> None:
+        if future.cancel():
+            with self._lock:
+                self.stats.cancelled += 1
+            return
+
+        def count_waste(done: Future) -> None:
+            if done.exception() is not None:
+                return
+            with self._lock:
+                self.stats.wasted += 1
+                self.stats.wasted_ms += done.result()[1]
+
+        future.add_done_callback(count_waste)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+        self._executor.shutdown(wait=True)
+
+
+def simulate_typing(prefetcher: Prefetcher, queries: list[str], chars_per_second: float = 8.0,
+                    pause_ms: float = 400.0) -> list[dict]:
+    """
+    Type each query one character at a time, pause, then submit it.
+
+    Returns:
+        Per-query submit latency and prefetch source
+    """
+    rows = []
+    for query in queries:
+        for end in range(1, len(query) + 1):
+            prefetcher.update(query[:end])
+            time.sleep(1 / chars_per_second)
+        time.sleep(pause_ms / 1000)
+        start = time.perf_counter()
+        _, source = prefetcher.get(query)
+        rows.append({"query": query, "source": source,
+                     "latency_ms": round((time.perf_counter() - start) * 1000, 2)})
+    return rows
+
+
+if __name__ == "__main__":
+    from query_sets import all_test_queries
+
+    parser = argparse.ArgumentParser(description="Simulate typing TEST_QUERIES with speculative prefetch")
+    parser.add_argument("--cps", type=float, default=8.0, help="Typing speed in characters per second")
+    parser.add_argument("--pause-ms", type=float, default=400.0, help="Pause between typing and submitting")
+    parser.add_argument("--debounce-ms", type=float, default=DEFAULT_DEBOUNCE_MS)
+    args = parser.parse_args()
+
+    from rag_system import TOP_K, search_food_items
+
+    prefetcher = Prefetcher(lambda q: search_food_items(q, top_k=TOP_K), debounce_ms=args.debounce_ms)
+    print(f"⌨️ Typing {len(all_test_queries())} queries at {args.cps} chars/s...")
+    for row in simulate_typing(prefetcher, [q for q, _ in all_test_queries()], args.cps, args.pause_ms):
+        print(f"  {row['source']:<9} {row['latency_ms']:>8} ms  {row['query']}")
+    prefetcher.close()
+
+    print("\n📊 Prefetch stats:")
+    for name, value in prefetcher.stats.summary().items():
+        print(f"  - {name}: {value}")
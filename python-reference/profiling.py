@@ -0,0 +1,237 @@
+"""
+Query Profiling
+Opt-in profiling of the RAG pipeline over N queries.
+
+Two modes:
+- sample: a background thread snapshots the stack of the profiled thread
+  at a configurable rate (sys._current_frames). Overhead is bounded by the
+  rate, time blocked on the network shows up under socket/ssl frames, and
+  the output is flamegraph-compatible collapsed stacks
+  (flamegraph.pl, speedscope, inferno) plus a top-functions table.
+- cprofile: deterministic cProfile over the same queries (exact call
+  counts, higher overhead), written as a .prof file plus the table.
+
+Samples are also attributed to coarse buckets (network, JSON parsing,
+client libraries, context building, ...) so the per-query CPU overhead
+outside model calls can be read off directly.
+
+Usage:
+    python profiling.py --queries 30 --mode sample --rate 500 --out profile
+    flamegraph.pl profile.collapsed > profile.svg
+"""
+
+import argparse
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Union
+
+DEFAULT_RATE_HZ = 200
+TOP_FUNCTIONS = 25
+
+# First matching bucket wins; patterns are matched against "file:function" frames
+ATTRIBUTION_BUCKETS = [
+    ("network wait", ("socket.py:", "ssl.py:", "selectors.py:", "http/client.py:", "httpcore", "urllib3")),
+    ("json parsing", ("json/decoder.py:", "json/__init__.py:loads", "pydantic")),
+    ("llm client", ("groq/",)),
+    ("vector client", ("upstash_vector/",)),
+    ("context building", (":build_context", ":document_text", ":result_text")),
+    ("rerank", ("rerank.py:",)),
+    ("local search", ("vector_index.py:", "quantization.py:", "numpy/")),
+]
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename.replace("\\", "/")
+    # Keep the path from site-packages / the package dir so labels stay short but unique
+    if "site-packages/" in filename:
+        filename = filename.split("site-packages/", 1)[1]
+    elif "/lib/python" in filename:
+        # Standard library: drop the "python3.x/" directory as well
+        filename = filename.split("/lib/python", 1)[1].split("/", 1)[-1]
+    else:
+        filename = Path(filename).name
+    return f"{filename}:{code.co_name}"
+
+
+def collapse_stack(frame) -> str:
+    """Root-to-leaf "a;b;c" stack of a frame (collapsed stack format)"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def attribute(stack: str) -> str:
+    """Coarse bucket for a collapsed stack, judged by its innermost matching frame"""
+    for label in reversed(stack.split(";")):
+        for bucket, patterns in ATTRIBUTION_BUCKETS:
+            if any(p in label for p in patterns):
+                return bucket
+    return "other python"
+
+
+class StackSampler:
+    """Statistical profiler that samples one thread's stack at a fixed rate"""
+
+    def __init__(self, rate_hz: float = DEFAULT_RATE_HZ, thread_id: Optional[int] = None):
+        """
+        Args:
+            rate_hz: Samples per second
+            thread_id: Thread to sample (default: the thread that calls start())
+        """
+        self.interval = 1.0 / rate_hz
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        next_sample = time.perf_counter()
+        while not self._stop.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+                self.samples += 1
+            next_sample += self.interval
+            self._stop.wait(max(0.0, next_sample - time.perf_counter()))
+
+    def collapsed(self) -> str:
+        """Collapsed stacks, one "stack count" line each (flamegraph.pl input)"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def top_functions(self, limit: int = TOP_FUNCTIONS) -> list[dict]:
+        """Functions by self samples (leaf) and total samples (anywhere on the stack)"""
+        self_counts, total_counts = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            self_counts[frames[-1]] += count
+            for label in set(frames):
+                total_counts[label] += count
+        return [
+            {
+                "function": label,
+                "self_percent": round(self_counts[label] / self.samples * 100, 1),
+                "total_percent": round(total_counts[label] / self.samples * 100, 1),
+            }
+            for label, _ in self_counts.most_common(limit)
+        ] if self.samples else []
+
+    def attribution(self) -> dict:
+        """Share of samples per coarse bucket (network, JSON parsing, ...)"""
+        buckets = Counter()
+        for stack, count in self.stacks.items():
+            buckets[attribute(stack)] += count
+        return {bucket: round(count / self.samples * 100, 1)
+                for bucket, count in buckets.most_common()} if self.samples else {}
+
+
+@contextmanager
+def sampling(rate_hz: float = DEFAULT_RATE_HZ):
+    """Sample the calling thread while the block runs"""
+    sampler = StackSampler(rate_hz)
+    sampler.start()
+    try:
+        yield sampler
+    finally:
+        sampler.stop()
+
+
+def profile_queries(run_query: Callable[[str], object], queries: Iterable[str], mode: str = "sample",
+                    rate_hz: float = DEFAULT_RATE_HZ, out: Union[str, Path] = "profile") -> dict:
+    """
+    Run queries under the profiler and write the reports.
+
+    Args:
+        run_query: Function(query), e.g. rag_system.rag_query
+        queries: Queries to run
+        mode: "sample" or "cprofile"
+        rate_hz: Sampling rate (sample mode)
+        out: Output path prefix
+
+    Returns:
+        {"queries", "wall_ms", "files", "top", "attribution"}
+    """
+    queries = list(queries)
+    out = Path(out)
+    start = time.perf_counter()
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            for query in queries:
+                run_query(query)
+        finally:
+            profiler.disable()
+        wall_ms = (time.perf_counter() - start) * 1000
+        prof_file = out.with_suffix(".prof")
+        profiler.dump_stats(prof_file)
+        table = io.StringIO()
+        pstats.Stats(profiler, stream=table).sort_stats("tottime").print_stats(TOP_FUNCTIONS)
+        text_file = out.with_suffix(".txt")
+        text_file.write_text(table.getvalue(), encoding="utf-8")
+        return {"queries": len(queries), "wall_ms": round(wall_ms, 2),
+                "files": [str(prof_file), str(text_file)], "top": [], "attribution": {}}
+
+    if mode != "sample":
+        raise ValueError(f"Unknown profiling mode {mode!r}, expected 'sample' or 'cprofile'")
+    with sampling(rate_hz) as sampler:
+        for query in queries:
+            run_query(query)
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    collapsed_file = out.with_suffix(".collapsed")
+    collapsed_file.write_text(sampler.collapsed(), encoding="utf-8")
+    top = sampler.top_functions()
+    attribution = sampler.attribution()
+    lines = [f"{sampler.samples} samples at {rate_hz} Hz over {len(queries)} queries "
+             f"({wall_ms / max(1, len(queries)):.1f} ms/query)", "",
+             f"{'Self %':>7} {'Total %':>8}  Function"]
+    lines += [f"{row['self_percent']:>7} {row['total_percent']:>8}  {row['function']}" for row in top]
+    lines += ["", "Attribution:"] + [f"{share:>7}%  {bucket}" for bucket, share in attribution.items()]
+    text_file = out.with_suffix(".txt")
+    text_file.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return {"queries": len(queries), "wall_ms": round(wall_ms, 2),
+            "files": [str(collapsed_file), str(text_file)], "top": top, "attribution": attribution}
+
+
+if __name__ == "__main__":
+    from query_sets import all_test_queries
+
+    parser = argparse.ArgumentParser(description="Profile rag_query over N queries")
+    parser.add_argument("--queries", type=int, default=15, help="Number of queries (TEST_QUERIES, repeated)")
+    parser.add_argument("--mode", choices=("sample", "cprofile"), default="sample")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE_HZ, help="Samples per second")
+    parser.add_argument("--out", default="profile", help="Output path prefix")
+    args = parser.parse_args()
+
+    from rag_system import rag_query
+
+    pool = [q for q, _ in all_test_queries()]
+    queries = [pool[i % len(pool)] for i in range(args.queries)]
+    print(f"🔬 Profiling {len(queries)} queries ({args.mode} mode)...")
+    report = profile_queries(rag_query, queries, args.mode, args.rate, args.out)
+    print(f"✅ {report['wall_ms']:.0f} ms total; wrote {', '.join(report['files'])}")
+    for bucket, share in report["attribution"].items():
+        print(f"   • {bucket}: {share}%")
@@ -0,0 +1,135 @@
+"""
+Embedding Quantization
+int8 scalar quantization and 1-bit binary codes for faster, smaller search.
+
+- int8: per-dimension symmetric scales, 4x smaller than float32
+- binary: sign bits packed 8 per byte (32x smaller), searched with a
+  vectorized Hamming distance (XOR + popcount)
+
+Both modes over-fetch candidates from the compressed codes and rescore
+only those rows against the float32 vectors, which stay memory-mapped
+on disk and are paged in on demand.
+
+Usage:
+    python quantization.py local-version/index.snap   # recall/latency report on TEST_QUERIES
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+MODES = ("float32", "int8", "binary")
+
+# Candidates fetched from compressed codes per requested result
+RESCORE_FACTOR = 10
+
+# Popcount of every byte value, used when np.bitwise_count is unavailable (NumPy < 2.0)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def fit_int8_scale(matrix: np.ndarray) -> np.ndarray:
+    """Per-dimension symmetric scale mapping [-max|x|, max|x|] onto [-127, 127]"""
+    scale = np.abs(np.asarray(matrix, dtype=np.float32)).max(axis=0) / 127.0
+    scale[scale == 0] = 1.0
+    return scale.astype(np.float32)
+
+
+def quantize_int8(matrix: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    return np.clip(np.rint(np.asarray(matrix) / scale), -127, 127).astype(np.int8)
+
+
+def int8_scores(query: np.ndarray, codes: np.ndarray, scale: np.ndarray,
+                chunk: int = 65536) -> np.ndarray:
+    """Approximate dot products of one query against int8 codes (chunked to bound memory)"""
+    q = (np.asarray(query, dtype=np.float32) * scale).astype(np.float32)
+    out = np.empty(codes.shape[0], dtype=np.float32)
+    for start in range(0, codes.shape[0], chunk):
+        out[start:start + chunk] = codes[start:start + chunk].astype(np.float32) @ q
+    return out
+
+
+def binary_codes(matrix: np.ndarray) -> np.ndarray:
+    """Sign bits of each vector packed into uint8 (dim / 8 bytes per vector)"""
+    return np.packbits(np.asarray(matrix) > 0, axis=-1)
+
+
+def hamming_distances(query_code: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """Hamming distance from one packed code to every row of codes"""
+    xor = np.bitwise_xor(codes, query_code)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(xor).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT[xor].sum(axis=1, dtype=np.int32)
+
+
+def candidate_rows(scores: np.ndarray, n: int) -> np.ndarray:
+    """Unordered indices of the n largest scores"""
+    n = min(n, scores.shape[0])
+    if n >= scores.shape[0]:
+        return np.arange(scores.shape[0])
+    return np.argpartition(-scores, n - 1)[:n]
+
+
+def quantization_report(index, query_vectors: np.ndarray, k: int = 3, repeats: int = 20) -> list[dict]:
+    """
+    Recall and latency of each search mode against exact float32 search.
+
+    Args:
+        index: A VectorIndex (quantized codes are computed if missing)
+        query_vectors: (n, dim) query embeddings
+        k: Results per query
+        repeats: Timing repetitions per query
+
+    Returns:
+        One row per mode with recall@k, average latency and bytes per vector
+    """
+    index.ensure_quantized()
+    exact = [set(index.search(q, k, mode="float32")[0].tolist()) for q in query_vectors]
+    bytes_per_vector = {
+        "float32": index.dim * 4,
+        "int8": index.dim,
+        "binary": index.dim // 8,
+    }
+
+    rows = []
+    for mode in MODES:
+        recalls = []
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for q, truth in zip(query_vectors, exact):
+                found, _ = index.search(q, k, mode=mode)
+                recalls.append(len(truth & set(found.tolist())) / max(1, len(truth)))
+        elapsed_ms = (time.perf_counter() - start) * 1000 / (repeats * len(query_vectors))
+        rows.append({
+            "mode": mode,
+            f"recall@{k}": round(float(np.mean(recalls)), 4),
+            "avg_ms": round(elapsed_ms, 4),
+            "bytes_per_vector": bytes_per_vector[mode],
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    from embeddings import ollama_embed
+    from query_sets import all_test_queries
+    from vector_index import VectorIndex
+
+    parser = argparse.ArgumentParser(description="Recall/latency report for quantized search")
+    parser.add_argument("snapshot", help="Path to an index snapshot")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--save", action="store_true",
+                        help="Write the quantized codes back into the snapshot")
+    args = parser.parse_args()
+
+    index = VectorIndex.load(args.snapshot)
+    queries = [q for q, _ in all_test_queries()]
+    print(f"🔢 Embedding {len(queries)} TEST_QUERIES with Ollama...")
+    query_vectors = ollama_embed(queries)
+
+    print(f"\n{'Mode':<10} {'Recall@' + str(args.top_k):>10} {'Avg ms':>10} {'Bytes/vec':>10}")
+    for row in quantization_report(index, query_vectors, args.top_k):
+        print(f"{row['mode']:<10} {row[f'recall@{args.top_k}']:>10} {row['avg_ms']:>10} {row['bytes_per_vector']:>10}")
+
+    if args.save:
+        index.save(args.snapshot)
+        print(f"\n💾 Saved quantized codes to {args.snapshot}")
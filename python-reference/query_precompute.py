@@ -0,0 +1,203 @@
+"""
+Popular Query Precomputation
+Warm-up job that retrieves the most frequent queries ahead of time.
+
+Query traffic is heavy-headed, so a few hundred canonical questions
+cover most requests. This job counts canonical queries (see
+canonicalize.py: surface variants of a question share one key) in a query log,
+retrieves the top-N in bulk and stores the results in a compact lookup
+table (each document text is stored once, entries hold ids and scores).
+rag_query checks the table first, so popular queries skip the embedding
+and vector search round trip entirely, including right after a deploy.
+
+Usage:
+    python query_precompute.py query_log.jsonl --top-n 500 --out precomputed_queries.json
+"""
+
+import argparse
+import json
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Union
+
+from canonicalize import canonicalize
+
+# Version 2: entries are keyed by canonical query (version 1 used basic normalization)
+FORMAT_VERSION = 2
+BATCH_SIZE = 100
+
+
+def normalize_query(query: str) -> str:
+    """Lookup key for a query: its canonical form (case, punctuation, stopwords, word order and synonyms folded)"""
+    return canonicalize(query)
+
+
+def read_query_log(path: Union[str, Path]) -> Iterable[str]:
+    """
+    Yield queries from a log file.
+
+    Accepts plain text (one query per line) or JSONL with a "query" field.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                try:
+                    line = json.loads(line).get("query", "")
+                except json.JSONDecodeError:
+                    continue
+            if line:
+                yield line
+
+
+def log_query(path: Optional[Union[str, Path]], query: str) -> None:
+    """Append a query to a JSONL query log (no-op when path is not set)"""
+    if not path:
+        return
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"ts": datetime.now().isoformat(), "query": query}, ensure_ascii=False) + "\n")
+
+
+def top_queries(queries: Iterable[str], top_n: int) -> list[tuple]:
+    """
+    Most frequent normalized queries.
+
+    Returns:
+        (normalized query, count, most common raw form) tuples, most frequent first
+    """
+    counts = Counter()
+    raw_forms = {}
+    for query in queries:
+        key = normalize_query(query)
+        if not key:
+            continue
+        counts[key] += 1
+        raw_forms.setdefault(key, Counter())[query] += 1
+    return [(key, count, raw_forms[key].most_common(1)[0][0])
+            for key, count in counts.most_common(top_n)]
+
+
+def build_lookup_table(queries: Iterable[str], search_batch: Callable, top_n: int = 500,
+                       top_k: int = 5) -> dict:
+    """
+    Retrieve the top-N frequent queries and build the lookup table.
+
+    Args:
+        queries: Raw queries (e.g. from read_query_log)
+        search_batch: Function(list of queries, top_k) -> list of result lists,
+            e.g. rag_system.search_documents_batch
+        top_n: Number of distinct normalized queries to precompute
+        top_k: Results stored per query
+
+    Returns:
+        The lookup table (JSON-serialisable)
+    """
+    popular = top_queries(queries, top_n)
+    entries = {}
+    docs = {}
+    for start in range(0, len(popular), BATCH_SIZE):
+        batch = popular[start:start + BATCH_SIZE]
+        batch_results = search_batch([raw for _, _, raw in batch], top_k)
+        for (key, count, _), results in zip(batch, batch_results):
+            entries[key] = {
+                "count": count,
+                "hits": [[r["id"], round(float(r["score"]), 6)] for r in results],
+            }
+            for r in results:
+                # Store each document once, however many entries reference it
+                docs.setdefault(r["id"], {"data": r.get("data") or "", "metadata": r.get("metadata") or {}})
+    return {
+        "version": FORMAT_VERSION,
+        "created": datetime.now().isoformat(),
+        "top_k": top_k,
+        "entries": entries,
+        "docs": docs,
+    }
+
+
+def rekey_entries(entries: dict) -> dict:
+    """Re-key version 1 entries by canonical query; when keys collide the more frequent entry wins"""
+    rekeyed = {}
+    for key, entry in entries.items():
+        canonical = normalize_query(key)
+        if canonical not in rekeyed or entry["count"] > rekeyed[canonical]["count"]:
+            rekeyed[canonical] = entry
+    return rekeyed
+
+
+class PrecomputedLookup:
+    """Read side of the lookup table, with hit/miss counters"""
+
+    def __init__(self, table: dict):
+        version = table.get("version")
+        if version not in (1, FORMAT_VERSION):
+            raise ValueError(f"Unsupported lookup table version: {version}")
+        self.top_k = table["top_k"]
+        self.entries = table["entries"] if version == FORMAT_VERSION else rekey_entries(table["entries"])
+        self.docs = table["docs"]
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path: Optional[Union[str, Path]]) -> Optional["PrecomputedLookup"]:
+        """Load a table if the file exists, otherwise return None"""
+        if not path or not Path(path).exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, query: str, top_k: Optional[int] = None) -> Optional[list[dict]]:
+        """
+        Precomputed results for a query.
+
+        Returns:
+            Results shaped like rag_system.search_food_items output, or None on
+            a miss (or when more results are requested than were stored)
+        """
+        entry = self.entries.get(normalize_query(query))
+        if entry is None or (top_k and top_k > self.top_k):
+            self.misses += 1
+            return None
+        self.hits += 1
+        hits = entry["hits"][:top_k] if top_k else entry["hits"]
+        return [
+            {"id": doc_id, "score": score, "data": self.docs[doc_id]["data"],
+             "metadata": self.docs[doc_id]["metadata"]}
+            for doc_id, score in hits
+        ]
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def save_lookup_table(table: dict, path: Union[str, Path]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False, separators=(",", ":"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute retrieval for popular queries")
+    parser.add_argument("logs", nargs="+", help="Query log files (plain text or JSONL)")
+    parser.add_argument("--top-n", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--out", default="precomputed_queries.json")
+    args = parser.parse_args()
+
+    from rag_system import search_documents_batch
+
+    def all_queries():
+        for log in args.logs:
+            yield from read_query_log(log)
+
+    print(f"🔥 Precomputing retrieval for the top {args.top_n} queries...")
+    table = build_lookup_table(all_queries(), search_documents_batch, args.top_n, args.top_k)
+    save_lookup_table(table, args.out)
+    print(f"✅ Stored {len(table['entries'])} queries ({len(table['docs'])} documents) in {args.out}")
@@ -0,0 +1,39 @@
+"""
+Shared Test Query Set
+The 15 evaluation queries (5 categories) used by every test and benchmark script.
+"""
+
+TEST_QUERIES = {
+    "semantic_similarity": [
+        "healthy Mediterranean options",
+        "light and refreshing summer dishes",
+        "warm comforting winter meals",
+    ],
+    "multi_criteria": [
+        "spicy vegetarian Asian dishes",
+        "quick easy breakfast options",
+        "creamy pasta dishes from Italy",
+    ],
+    "nutritional": [
+        "high-protein low-carb foods",
+        "foods rich in vitamins and antioxidants",
+        "heart-healthy meal options",
+    ],
+    "cultural_exploration": [
+        "traditional comfort foods",
+        "authentic street food dishes",
+        "festive celebration meals",
+    ],
+    "cooking_method": [
+        "dishes that can be grilled",
+        "slow-cooked tender meals",
+        "fresh raw preparations",
+    ],
+}
+
+
+def all_test_queries() -> list[tuple]:
+    """(query, category) pairs in a stable order"""
+    return [(query, category)
+            for category, queries in TEST_QUERIES.items()
+            for query in queries]
@@ -7,10 +7,30 @@ of the course for comparison with the Next.js implementation.
 """
 
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 from dotenv import load_dotenv
 from upstash_vector import Index
 import groq
 
+from answer_cache import AnswerCache
+from attributes import AttributeIndex
+from canonicalize import FOODS_FILE
+from chunking import ChunkConfig, best_chunks, expand_parents
+from circuit_breaker import CLOSED, CircuitOpenError, breaker
+from doc_store import open_doc_store
+from entity_index import FoodNameIndex, boost_results
+from fallback import FallbackChain
+from gating import ConfidenceGate
+from prefetch import DEFAULT_DEBOUNCE_MS, Prefetcher
+from query_precompute import PrecomputedLookup
+from rerank import DEFAULT_BUDGET_MS, rerank
+from token_usage import UsageLedger, estimated_embedding, from_groq
+from warmup import WARMUP_ENABLED, WarmupReport, groq_task, touch_task, upstash_task, warm_up
+
 # Load environment variables
 load_dotenv()
 
@@ -23,6 +43,80 @@ index = Index(
 # Initialize Groq client
 client = groq.Groq(api_key=os.getenv("GROQ_API_KEY"))
 
+# Optional local doc store: when present, queries return ids + scores only
+# and documents are hydrated locally instead of shipped in every response
+doc_store = open_doc_store(os.getenv("DOC_STORE_DIR"))
+
+# Precomputed retrieval for popular queries (built by query_precompute.py)
+precomputed = PrecomputedLookup.load(os.getenv("PRECOMPUTED_QUERIES"))
+
+# Results passed to build_context, and optional re-ranking: when
+# RERANK_CANDIDATES > TOP_K, that many candidates are fetched and re-scored
+TOP_K = 5
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "0"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", str(DEFAULT_BUDGET_MS)))
+
+# Long items are seeded as chunks (see seed_data.py): fetch this many chunks per requested
+# result, keep the best chunk per document and optionally expand it to the full document
+CHUNKING = ChunkConfig.from_env()
+CHUNK_CANDIDATE_FACTOR = 3
+CHUNK_EXPAND_PARENTS = os.getenv("CHUNK_EXPAND_PARENTS", "0") == "1"
+
+# Upper bound on concurrent Groq generations in rag_query_batch
+BATCH_MAX_WORKERS = int(os.getenv("RAG_BATCH_MAX_WORKERS", "4"))
+
+# Skip generation when retrieval finds nothing relevant (or one source answers a lookup)
+gate = ConfidenceGate.from_env(scale="upstash")
+
+# Quiet period after the last keystroke before speculative retrieval starts
+PREFETCH_DEBOUNCE_MS = float(os.getenv("PREFETCH_DEBOUNCE_MS", str(DEFAULT_DEBOUNCE_MS)))
+# Typing sessions with a live prefetcher (least recently used closed first)
+PREFETCH_MAX_SESSIONS = int(os.getenv("PREFETCH_MAX_SESSIONS", "256"))
+
+# Token counts and estimated cost of every embedding and generation call
+LLM_MODEL = "llama-3.1-8b-instant"
+usage_ledger = UsageLedger()
+
+# Fail fast while Upstash or Groq is degraded instead of waiting out timeouts
+upstash_breaker = breaker("upstash")
+groq_breaker = breaker("groq")
+
+# Local index (FALLBACK_SNAPSHOT) searched while Upstash is unavailable, and answer
+# sources (the answer cache) tried before a retrieval-only answer while Groq is
+fallbacks = FallbackChain.from_env()
+
+# Typo-tolerant dish names: named items are boosted into the search results, and a
+# question that only names dishes ("what is biriyani?") skips vector search
+entity_index = None
+if os.getenv("ENTITY_LOOKUP", "1") != "0" and FOODS_FILE.exists():
+    entity_index = FoodNameIndex.from_foods(FOODS_FILE)
+
+# Typed facet columns (protein, carbs, vegetarian, spicy, cooking method, ...): attribute
+# constraints in a question filter its vector results, which are over-fetched for them
+attribute_index = None
+if os.getenv("ATTRIBUTE_FILTER", "1") != "0" and FOODS_FILE.exists():
+    attribute_index = AttributeIndex.from_foods(FOODS_FILE)
+ATTRIBUTE_CANDIDATES = int(os.getenv("ATTRIBUTE_CANDIDATES", "20"))
+
+# Set once warm_up_backends() has finished; report readiness (and take traffic) only after that
+ready = threading.Event()
+
+
+def warm_up_backends() -> WarmupReport:
+    """
+    Open the pooled Upstash and Groq connections (and fault in the fallback
+    index pages) concurrently, then mark the process ready.
+    
+    Returns:
+        Per-backend warm-up outcome
+    """
+    tasks = {"upstash": upstash_task(index), "groq": groq_task(client, LLM_MODEL)}
+    if fallbacks.index is not None:
+        tasks["fallback index pages"] = touch_task(fallbacks.index)
+    report = warm_up(tasks) if WARMUP_ENABLED else WarmupReport()
+    ready.set()
+    return report
+
 
 def embed_text(text: str) -> list[float]:
     """
@@ -49,12 +143,20 @@ def search_food_items(query: str, top_k: int = 5) -> list[dict]:
     Returns:
         List of relevant food items with scores
     """
+    # Upstash embeds the query server-side and reports no token usage, so it is estimated
+    start = time.time()
+    if doc_store is not None:
+        results = index.query(data=query, top_k=top_k)
+        usage_ledger.record(estimated_embedding([query], time.time() - start))
+        return doc_store.hydrate((r.id, r.score) for r in results)
+    
     results = index.query(
         data=query,  # Upstash embeds this automatically
         top_k=top_k,
         include_metadata=True,
         include_data=True
     )
+    usage_ledger.record(estimated_embedding([query], time.time() - start))
     
     return [
         {
@@ -67,6 +169,173 @@ def search_food_items(query: str, top_k: int = 5) -> list[dict]:
     ]
 
 
+def search_food_items_batch(queries: list[str], top_k: int = 5) -> list[list[dict]]:
+    """
+    Search for many queries with a single bulk vector database request.
+    
+    Upstash embeds every query server-side as part of the same request,
+    so the whole batch pays one round trip instead of one per query.
+    
+    Args:
+        queries: The search queries
+        top_k: Number of results to return per query
+        
+    Returns:
+        One list of search results per query, in the same order
+    """
+    if not queries:
+        return []
+    
+    fetch_payload = doc_store is None
+    start = time.time()
+    batch_results = index.query_many(
+        queries=[
+            {
+                "data": query,
+                "top_k": top_k,
+                "include_metadata": fetch_payload,
+                "include_data": fetch_payload
+            }
+            for query in queries
+        ]
+    )
+    usage_ledger.record(estimated_embedding(queries, time.time() - start))
+    
+    if not fetch_payload:
+        return [doc_store.hydrate((r.id, r.score) for r in results) for results in batch_results]
+    
+    return [
+        [
+            {
+                "id": r.id,
+                "score": r.score,
+                "data": r.data,
+                "metadata": r.metadata
+            }
+            for r in results
+        ]
+        for results in batch_results
+    ]
+
+
+def retrieval_depth(query: str) -> int:
+    """Results to retrieve for a query: over-fetched when attribute constraints will filter them"""
+    candidates = max(TOP_K, RERANK_CANDIDATES)
+    if attribute_index is not None and attribute_index.parse(query).constraints:
+        return max(candidates, ATTRIBUTE_CANDIDATES)
+    return candidates
+
+
+def collapse_chunks(results: list[dict], top_k: int) -> list[dict]:
+    """
+    Best chunk per document, identified by its parent id (as cloud-version retrieve does).
+    
+    Entity boosting and attribute filtering match on item ids, so chunk
+    results carry the parent id as "id" and their own id as "chunk".
+    """
+    if not CHUNKING.enabled:
+        return results
+    results = best_chunks(results, top_k)
+    if CHUNK_EXPAND_PARENTS and doc_store is not None:
+        results = expand_parents(results, doc_store.get)
+    return [r if r["id"] == r["parent_id"] else {**r, "id": r["parent_id"], "chunk": r["id"]}
+            for r in results]
+
+
+def chunk_fetch_k(top_k: int) -> int:
+    """Chunks to retrieve for top_k documents"""
+    return top_k * CHUNK_CANDIDATE_FACTOR if CHUNKING.enabled else top_k
+
+
+def search_documents_batch(queries: list[str], top_k: int = 5) -> list[list[dict]]:
+    """search_food_items_batch with chunks collapsed to one result per document"""
+    return [collapse_chunks(results, top_k)
+            for results in search_food_items_batch(queries, top_k=chunk_fetch_k(top_k))]
+
+
+def lookup_or_search(query: str, top_k: int = 5) -> list[dict]:
+    """
+    Precomputed results for popular queries, falling back to vector search.
+    
+    Args:
+        query: The search query
+        top_k: Number of results to return
+        
+    Returns:
+        List of relevant food items with scores (one per document)
+    """
+    if precomputed is not None:
+        results = precomputed.get(query, top_k)
+        if results is not None:
+            return collapse_chunks(results, top_k)
+    fetch_k = chunk_fetch_k(top_k)
+    return collapse_chunks(upstash_breaker.call(search_food_items, query, top_k=fetch_k,
+                                                fallback=fallbacks.searcher(query, fetch_k)),
+                           top_k)
+
+
+def lookup_or_search_batch(queries: list[str], top_k: int = 5) -> list[list[dict]]:
+    """Batched lookup_or_search: only the lookup misses go to the bulk search"""
+    results = [precomputed.get(q, top_k) if precomputed is not None else None for q in queries]
+    results = [collapse_chunks(r, top_k) if r is not None else None for r in results]
+    misses = [i for i, r in enumerate(results) if r is None]
+    if misses:
+        missed = [queries[i] for i in misses]
+        fallback = ((lambda: [collapse_chunks(fallbacks.search(q, chunk_fetch_k(top_k)), top_k)
+                              for q in missed])
+                    if fallbacks.index is not None else None)
+        fetched = upstash_breaker.call(search_documents_batch, missed, top_k=top_k, fallback=fallback)
+        for i, found in zip(misses, fetched):
+            results[i] = found
+    return results
+
+
+def fallback_answer(query: str, search_results: list[dict]) -> str:
+    """Registered answer sources first, then an answer built from the retrieved sources"""
+    return fallbacks.answer(query, [r.get("data", "") for r in search_results])
+
+
+# Speculative retrieval for the query being typed, one Prefetcher per typing
+# session (see prefetch()) so callers never cancel each other's work
+prefetch_sessions: OrderedDict[str, Prefetcher] = OrderedDict()
+prefetch_sessions_lock = threading.Lock()
+
+
+def prefetch(partial_query: str, session: str) -> None:
+    """
+    Report the text currently typed by the user.
+    
+    Retrieval for it starts speculatively after a short pause, so a
+    following rag_query for the same text and session finds its results warm.
+    
+    Args:
+        partial_query: The partial (or complete) query text
+        session: Id of the typing session (e.g. one chat box)
+    """
+    evicted = []
+    with prefetch_sessions_lock:
+        prefetcher = prefetch_sessions.get(session)
+        if prefetcher is None:
+            prefetcher = prefetch_sessions[session] = Prefetcher(
+                lambda query: lookup_or_search(query, top_k=retrieval_depth(query)),
+                debounce_ms=PREFETCH_DEBOUNCE_MS,
+            )
+            while len(prefetch_sessions) > PREFETCH_MAX_SESSIONS:
+                evicted.append(prefetch_sessions.popitem(last=False)[1])
+        prefetch_sessions.move_to_end(session)
+    prefetcher.update(partial_query)
+    for stale in evicted:
+        stale.close()
+
+
+def end_prefetch_session(session: str) -> None:
+    """Close a typing session's prefetcher (e.g. when its chat box disconnects)"""
+    with prefetch_sessions_lock:
+        prefetcher = prefetch_sessions.pop(session, None)
+    if prefetcher is not None:
+        prefetcher.close()
+
+
 def build_context(search_results: list[dict]) -> str:
     """
     Build context string from search results.
@@ -102,6 +371,21 @@ def generate_response(query: str, context: str) -> str:
     Returns:
         The generated response
     """
+    return generate_response_with_usage(query, context)[0]
+
+
+def generate_response_with_usage(query: str, context: str, category: str = "all") -> tuple:
+    """
+    Generate a response and account for its tokens and cost.
+    
+    Args:
+        query: The user's question
+        context: Relevant context from vector search
+        category: Query category the usage is aggregated under
+        
+    Returns:
+        (response, TokenUsage)
+    """
     system_prompt = """You are a helpful food expert assistant. 
 Answer questions about food using ONLY the provided context.
 If the context doesn't contain relevant information, say so.
@@ -114,8 +398,9 @@ Question: {query}
 
 Please provide a helpful answer based on the context above."""
 
+    start = time.time()
     response = client.chat.completions.create(
-        model="llama-3.1-8b-instant",
+        model=LLM_MODEL,
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_message}
@@ -123,58 +408,261 @@ Please provide a helpful answer based on the context above."""
         temperature=0.7,
         max_tokens=1024
     )
+    usage = from_groq(response, LLM_MODEL, time.time() - start, system_prompt + user_message)
+    usage_ledger.record(usage, category)
+    
+    return response.choices[0].message.content, usage
+
+
+def query_result(answer: str, search_results: list[dict], vector_time: float, rerank_time: float,
+                 llm_time: float, total_time: float, retrieval_source: str, gate_action: str,
+                 usage=None, degraded: bool = False, batch_size: int = 1) -> dict:
+    """
+    Result dictionary shared by rag_query and rag_query_batch (every path reports the same metrics).
     
-    return response.choices[0].message.content
+    Args:
+        answer: The answer text
+        search_results: Retrieved documents used for the answer
+        vector_time, rerank_time, llm_time, total_time: Stage timings in seconds
+        retrieval_source: Where the documents came from ("search", "entity", "unavailable", ...)
+        gate_action: Confidence gate decision, or "unavailable"
+        usage: Token usage of the generation, if one ran
+        degraded: Whether a fallback answered instead of the LLM
+        batch_size: Questions retrieved together (1 outside rag_query_batch)
+    """
+    return {
+        "answer": answer,
+        "sources": [
+            {
+                "data": r.get("data", ""),
+                "score": r.get("score", 0)
+            }
+            for r in search_results
+        ],
+        "metrics": {
+            "vector_search_time": vector_time,
+            "rerank_time": rerank_time,
+            "llm_processing_time": llm_time,
+            "total_response_time": total_time,
+            "batch_size": batch_size,
+            "retrieval_source": retrieval_source,
+            "gate_action": gate_action,
+            "usage": usage.summary() if usage else None,
+            "degraded": degraded
+        }
+    }
 
 
-def rag_query(query: str) -> dict:
+def answer_query(query: str, category: str = "all", session: Optional[str] = None) -> dict:
     """
-    Main RAG pipeline function.
+    Main RAG pipeline function (uncached; rag_query serves it through the answer cache).
     
     Args:
         query: The user's question
+        category: Query category for token and cost accounting
+        session: Typing session whose prefetch is reused (see prefetch()); without
+            one, or for a session that never prefetched, retrieval runs directly
         
     Returns:
         Dictionary containing answer and sources
     """
-    import time
-    
     start_time = time.time()
     
-    # Step 1: Vector Search
+    # Step 1: Vector Search (over-fetch when re-ranking is enabled); reuses the session's
+    # speculative prefetch of the same query when one finished or is running.
+    # Named dishes come from the name index (alone when nothing else is asked), and
+    # attribute constraints filter the over-fetched vector results
     vector_start = time.time()
-    search_results = search_food_items(query, top_k=5)
+    candidates = max(TOP_K, RERANK_CANDIDATES)
+    entities = entity_index.find(query) if entity_index is not None else []
+    attributes = attribute_index.parse(query) if attribute_index is not None else None
+    try:
+        search_results = []
+        if entity_index is not None and entity_index.is_entity_query(query, entities):
+            search_results, retrieval_source = entity_index.results(entities, candidates), "entity"
+        if not search_results:
+            with prefetch_sessions_lock:
+                prefetcher = prefetch_sessions.get(session) if session is not None else None
+            if prefetcher is not None:
+                search_results, retrieval_source = prefetcher.get(query)
+            else:
+                search_results = lookup_or_search(query, top_k=retrieval_depth(query))
+                retrieval_source = "search"
+            if entities:
+                search_results = boost_results(search_results, entity_index.results(entities, candidates),
+                                               candidates)
+            elif attributes is not None:
+                # A question about a named dish keeps it even when it violates the constraints
+                search_results = attribute_index.filter_results(search_results, attributes)
+            search_results = search_results[:candidates]
+    except CircuitOpenError:
+        # Upstash is down and no local fallback is configured: answer in milliseconds
+        # (a cached answer when one exists)
+        usage_ledger.count_query(category)
+        return query_result(fallback_answer(query, []), [], time.time() - vector_start, 0.0, 0.0,
+                            time.time() - start_time, "unavailable", "unavailable", degraded=True)
     vector_time = time.time() - vector_start
     
-    # Step 2: Build Context
-    context = build_context(search_results)
+    # Step 1b: Re-rank candidates down to TOP_K (falls back to vector order over budget)
+    rerank_start = time.time()
+    if RERANK_CANDIDATES > TOP_K:
+        search_results = rerank(query, search_results, k=TOP_K, budget_ms=RERANK_BUDGET_MS)
+    rerank_time = time.time() - rerank_start
+    
+    # Step 2: Confidence gate - answer without the LLM when the scores decide it
+    decision = gate.decide(query, [r.get("score", 0) for r in search_results],
+                           [r.get("data", "") for r in search_results],
+                           [r.get("named", False) for r in search_results])
     
-    # Step 3: Generate Response
+    # Step 3: Build Context and Generate Response
     llm_start = time.time()
-    answer = generate_response(query, context)
+    usage = None
+    degraded = False
+    if decision.call_llm:
+        def degrade():
+            nonlocal degraded
+            degraded = True
+            return fallback_answer(query, search_results), None
+        
+        answer, usage = groq_breaker.call(generate_response_with_usage, query, build_context(search_results),
+                                          category, fallback=degrade)
+    else:
+        answer = decision.answer
     llm_time = time.time() - llm_start
+    usage_ledger.count_query(category)
     
     total_time = time.time() - start_time
     
-    return {
-        "answer": answer,
-        "sources": [
-            {
-                "data": r.get("data", ""),
-                "score": r.get("score", 0)
-            }
-            for r in search_results
-        ],
-        "metrics": {
-            "vector_search_time": vector_time,
-            "llm_processing_time": llm_time,
-            "total_response_time": total_time
-        }
-    }
+    return query_result(answer, search_results, vector_time, rerank_time, llm_time, total_time,
+                        retrieval_source, decision.action, usage, degraded)
+
+
+# Stale-while-revalidate answer cache in front of answer_query: background regeneration
+# runs only while Groq is healthy, and cached answers of any age back the outage fallbacks
+answer_cache = None
+if os.getenv("ANSWER_CACHE", "1") != "0":
+    # Refreshes run without a session, so they never touch a user's prefetch
+    answer_cache = AnswerCache.from_env(answer_query, can_refresh=lambda: groq_breaker.state == CLOSED)
+    fallbacks.register(answer_cache.lookup)
+
+
+def rag_query(query: str, category: str = "all", session: Optional[str] = None) -> dict:
+    """
+    Answer a question, from the answer cache when possible.
+    
+    Args:
+        query: The user's question
+        category: Query category for token and cost accounting
+        session: Typing session whose prefetch a cache miss reuses (see prefetch())
+        
+    Returns:
+        Dictionary containing answer and sources (metrics["cache"] is
+        "hit", "stale", "miss" or "shared" while the cache is enabled)
+    """
+    if answer_cache is None:
+        return answer_query(query, category, session)
+    result = answer_cache.get(query, category, compute=lambda: answer_query(query, category, session))
+    if result["metrics"]["cache"] != "miss":
+        # Only the miss that ran answer_query was counted there; hits and shared misses
+        # count too, so cost per query shows the savings
+        usage_ledger.count_query(category)
+    return result
+
+
+def rag_query_batch(questions: list[str], max_workers: int = BATCH_MAX_WORKERS) -> list[dict]:
+    """
+    Batched RAG pipeline for offline evaluation workloads.
+    
+    Retrieval for all questions runs as one bulk request, then the
+    generations are dispatched concurrently on a bounded thread pool.
+    
+    Args:
+        questions: The user questions
+        max_workers: Maximum number of concurrent LLM generations
+        
+    Returns:
+        One result dictionary per question (same shape as rag_query),
+        in the same order as the input
+    """
+    if not questions:
+        return []
+    
+    start_time = time.time()
+    
+    # Step 1: Bulk Vector Search (one request for the whole batch)
+    vector_start = time.time()
+    candidates = max(TOP_K, RERANK_CANDIDATES)
+    try:
+        batch_results = lookup_or_search_batch(questions, top_k=max(retrieval_depth(q) for q in questions))
+    except CircuitOpenError:
+        # Upstash is down and no local fallback is configured: fail fast for the whole batch
+        vector_time = time.time() - vector_start
+        results = []
+        for question in questions:
+            usage_ledger.count_query()
+            results.append(query_result(fallback_answer(question, []), [], vector_time, 0.0, 0.0,
+                                        time.time() - start_time, "unavailable", "unavailable",
+                                        degraded=True, batch_size=len(questions)))
+        return results
+    for i, (question, results) in enumerate(zip(questions, batch_results)):
+        entities = entity_index.find(question) if entity_index is not None else []
+        if entities:
+            results = boost_results(results, entity_index.results(entities, candidates), candidates)
+        elif attribute_index is not None:
+            results = attribute_index.filter_results(results, attribute_index.parse(question))
+        batch_results[i] = results[:candidates]
+    vector_time = time.time() - vector_start
+    
+    rerank_start = time.time()
+    if RERANK_CANDIDATES > TOP_K:
+        batch_results = [
+            rerank(question, results, k=TOP_K, budget_ms=RERANK_BUDGET_MS)
+            for question, results in zip(questions, batch_results)
+        ]
+    rerank_time = time.time() - rerank_start
+    
+    # Step 2: Confidence gate per question
+    decisions = [
+        gate.decide(question, [r.get("score", 0) for r in results], [r.get("data", "") for r in results],
+                    [r.get("named", False) for r in results])
+        for question, results in zip(questions, batch_results)
+    ]
+    
+    # Step 3: Generate Responses concurrently (gated questions are answered directly)
+    def timed_generate(args):
+        question, results, decision = args
+        usage_ledger.count_query()
+        if not decision.call_llm:
+            return decision.answer, 0.0, None, False
+        llm_start = time.time()
+        degraded = False
+        
+        def degrade():
+            nonlocal degraded
+            degraded = True
+            return fallback_answer(question, results), None
+        
+        answer, usage = groq_breaker.call(generate_response_with_usage, question, build_context(results),
+                                          fallback=degrade)
+        return answer, time.time() - llm_start, usage, degraded
+    
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        generations = list(pool.map(timed_generate, zip(questions, batch_results, decisions)))
+    
+    total_time = time.time() - start_time
+    
+    # Bulk search and re-rank times are shared by every question in the batch
+    return [
+        query_result(answer, search_results, vector_time, rerank_time, llm_time, total_time, "search",
+                     decision.action, usage, degraded, batch_size=len(questions))
+        for search_results, decision, (answer, llm_time, usage, degraded)
+        in zip(batch_results, decisions, generations)
+    ]
 
 
 # Example usage
 if __name__ == "__main__":
+    warm_up_backends()
     query = "What fruits are high in vitamin C?"
     result = rag_query(query)
     
@@ -184,3 +672,7 @@ if __name__ == "__main__":
     print(f"  - Vector Search: {result['metrics']['vector_search_time']:.3f}s")
     print(f"  - LLM Processing: {result['metrics']['llm_processing_time']:.3f}s")
     print(f"  - Total Time: {result['metrics']['total_response_time']:.3f}s")
+    if result['metrics']['usage']:
+        usage = result['metrics']['usage']
+        print(f"  - Tokens: {usage['prompt_tokens']} in / {usage['completion_tokens']} out "
+              f"({usage['tokens_per_second']} tok/s, ${usage['cost_usd']:.6f})")
@@ -0,0 +1,175 @@
+"""
+Embedding Dimensionality Reduction
+PCA projection or matryoshka truncation of the 1024-dim mxbai vectors.
+
+Scoring cost scales linearly with the dimension. Reduced vectors (e.g.
+256 dims) are searched first and, optionally, the top candidates are
+re-ranked with the full-dimension vectors so most of the recall is kept.
+
+The reduced matrix is stored next to the full one, which quantized modes
+and sharding still need, so snapshots grow rather than shrink. Without
+re-ranking, float32 search never reads the full matrix, and its
+memory-mapped pages stay out of memory.
+
+- PCA: projection fitted on the corpus (mean + components)
+- matryoshka: keep the first d dimensions and re-normalise (mxbai-embed-large
+  is trained with matryoshka representation learning, so prefixes stay useful)
+
+Usage:
+    python reduction.py local-version/index.snap --dims 512 256 128
+"""
+
+import argparse
+import time
+from typing import Optional
+
+import numpy as np
+
+METHODS = ("pca", "matryoshka")
+
+# Rows used to fit PCA (a sample is enough and keeps fitting fast)
+PCA_SAMPLE = 50_000
+
+
+class Reducer:
+    """Maps full-dimension vectors to `dims` dimensions"""
+
+    def __init__(self, method: str, dims: int, mean: Optional[np.ndarray] = None,
+                 components: Optional[np.ndarray] = None):
+        if method not in METHODS:
+            raise ValueError(f"Unknown reduction method {method!r}, expected one of {METHODS}")
+        self.method = method
+        self.dims = dims
+        self.mean = mean
+        self.components = components
+
+    @classmethod
+    def fit(cls, matrix: np.ndarray, dims: int, method: str = "pca", seed: int = 0) -> "Reducer":
+        """
+        Fit a reducer on document embeddings.
+
+        Args:
+            matrix: (n, dim) document embeddings
+            dims: Target dimension
+            method: "pca" or "matryoshka"
+
+        Raises:
+            ValueError: If `dims` exceeds the embedding dimension, or (PCA) the
+                number of samples, which bounds the principal components
+        """
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if dims > matrix.shape[1]:
+            raise ValueError(f"Cannot reduce {matrix.shape[1]}-dimensional embeddings to {dims} dimensions")
+        if method == "matryoshka":
+            return cls(method, dims)
+        if dims > min(matrix.shape[0], PCA_SAMPLE):
+            raise ValueError(f"PCA to {dims} dimensions needs at least {dims} documents, "
+                             f"got {matrix.shape[0]}")
+        if matrix.shape[0] > PCA_SAMPLE:
+            rows = np.random.default_rng(seed).choice(matrix.shape[0], PCA_SAMPLE, replace=False)
+            matrix = matrix[np.sort(rows)]
+        mean = matrix.mean(axis=0)
+        # Right singular vectors of the centred data are the principal axes
+        _, _, vt = np.linalg.svd(matrix - mean, full_matrices=False)
+        return cls(method, dims, mean.astype(np.float32), vt[:dims].astype(np.float32))
+
+    def transform(self, vectors) -> np.ndarray:
+        """Reduce and L2-normalise vectors (rows of a matrix or a single vector)"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.method == "matryoshka":
+            reduced = vectors[..., :self.dims]
+        else:
+            reduced = (vectors - self.mean) @ self.components.T
+        norms = np.linalg.norm(reduced, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (reduced / norms).astype(np.float32)
+
+    def sections(self) -> tuple:
+        """Arrays and metadata for storing the reducer in a snapshot"""
+        arrays = {}
+        if self.method == "pca":
+            arrays = {"pca_mean": self.mean, "pca_components": self.components}
+        return arrays, {"reduction": {"method": self.method, "dims": self.dims}}
+
+    @classmethod
+    def from_snapshot(cls, snap) -> Optional["Reducer"]:
+        config = snap.meta.get("reduction")
+        if not config:
+            return None
+        return cls(config["method"], config["dims"], snap.get("pca_mean"), snap.get("pca_components"))
+
+
+def reduction_report(index, query_vectors: np.ndarray, dims_list=(512, 256, 128), k: int = 3,
+                     repeats: int = 20) -> list[dict]:
+    """
+    Speed, scored-matrix size and recall of reduced-dimension search vs full float32 search.
+
+    Each configuration is measured with and without full-dimension
+    re-ranking of the top candidates.
+
+    Returns:
+        One row per (method, dims, rerank) configuration
+    """
+    from vector_index import top_k
+
+    full = np.asarray(index.embeddings, dtype=np.float32)
+    queries = np.asarray(query_vectors, dtype=np.float32)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    exact = [set(top_k(full @ q, k)[0].tolist()) for q in queries]
+
+    def measure(search) -> tuple:
+        recalls = []
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for q, truth in zip(queries, exact):
+                recalls.append(len(truth & set(search(q).tolist())) / max(1, len(truth)))
+        return float(np.mean(recalls)), (time.perf_counter() - start) * 1000 / (repeats * len(queries))
+
+    recall, avg_ms = measure(lambda q: top_k(full @ q, k)[0])
+    rows = [{"method": "full", "dims": full.shape[1], "rerank": False,
+             f"recall@{k}": round(recall, 4), "avg_ms": round(avg_ms, 4),
+             "matrix_mb": round(full.nbytes / 2**20, 2)}]
+
+    for method in METHODS:
+        for dims in dims_list:
+            try:
+                reducer = Reducer.fit(full, dims, method)
+            except ValueError:
+                continue  # more dimensions than the corpus supports
+            reduced = reducer.transform(full)
+            for rerank in (False, True):
+                def search(q):
+                    rows_, _ = top_k(reduced @ reducer.transform(q), k * 10 if rerank else k)
+                    if not rerank:
+                        return rows_
+                    rows_ = np.sort(rows_)
+                    best, _ = top_k(full[rows_] @ q, k)
+                    return rows_[best]
+                recall, avg_ms = measure(search)
+                rows.append({"method": method, "dims": dims, "rerank": rerank,
+                             f"recall@{k}": round(recall, 4), "avg_ms": round(avg_ms, 4),
+                             "matrix_mb": round(reduced.nbytes / 2**20, 2)})
+    return rows
+
+
+if __name__ == "__main__":
+    from embeddings import ollama_embed
+    from query_sets import all_test_queries
+    from vector_index import VectorIndex
+
+    parser = argparse.ArgumentParser(description="Benchmark reduced-dimension retrieval")
+    parser.add_argument("snapshot", help="Path to an index snapshot")
+    parser.add_argument("--dims", type=int, nargs="+", default=[512, 256, 128])
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    index = VectorIndex.load(args.snapshot)
+    queries = [q for q, _ in all_test_queries()]
+    print(f"🔢 Embedding {len(queries)} TEST_QUERIES with Ollama...")
+    query_vectors = ollama_embed(queries)
+
+    recall_col = f"recall@{args.top_k}"
+    print(f"\n{'Method':<11} {'Dims':>5} {'Rerank':>7} {'Recall':>8} {'Avg ms':>9} {'Matrix MB':>10}")
+    for row in reduction_report(index, query_vectors, args.dims, args.top_k):
+        print(f"{row['method']:<11} {row['dims']:>5} {str(row['rerank']):>7} "
+              f"{row[recall_col]:>8} {row['avg_ms']:>9} {row['matrix_mb']:>10}")
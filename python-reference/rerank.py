@@ -0,0 +1,135 @@
+"""
+Lightweight Re-ranking
+Re-score over-fetched vector search candidates with cheap CPU features.
+
+Vector search fetches the top-N candidates; this stage re-scores them
+with a blend of the vector score, BM25 over the candidate texts and
+region/type matches, and keeps only the best k for the LLM context.
+Every call has a hard time budget: if it is exceeded the candidates are
+returned in plain vector order, so re-ranking never hurts tail latency.
+"""
+
+import math
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can for from has have how i in is it its me "
+    "of on or some that the their this to what which with you your".split()
+)
+
+# Feature weights (vector score dominates; lexical and metadata features break ties)
+VECTOR_WEIGHT = 0.6
+LEXICAL_WEIGHT = 0.3
+METADATA_WEIGHT = 0.1
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+DEFAULT_BUDGET_MS = 15.0
+
+
+def tokenize(text: str) -> list[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+@dataclass
+class RerankStats:
+    """Counters for how often re-ranking ran versus fell back"""
+    reranked: int = 0
+    fallbacks: int = 0
+    total_ms: float = 0.0
+
+    @property
+    def calls(self) -> int:
+        return self.reranked + self.fallbacks
+
+    @property
+    def avg_ms(self) -> float:
+        return self.total_ms / self.calls if self.calls else 0.0
+
+
+stats = RerankStats()
+
+
+def _candidate_text(candidate: dict) -> str:
+    metadata = candidate.get("metadata") or {}
+    return metadata.get("text") or candidate.get("data") or ""
+
+
+def _bm25_scores(query_terms: list[str], docs: list[list[str]], deadline: float) -> list[float]:
+    """BM25 of each candidate against the query, with IDF taken over the candidate set"""
+    n = len(docs)
+    avg_len = sum(len(d) for d in docs) / n or 1.0
+    df = Counter()
+    for doc in docs:
+        df.update(set(doc))
+    idf = {t: math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5)) for t in set(query_terms)}
+
+    scores = []
+    for doc in docs:
+        if time.perf_counter() > deadline:
+            raise TimeoutError
+        tf = Counter(doc)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * len(doc) / avg_len)
+        scores.append(sum(
+            idf[t] * tf[t] * (BM25_K1 + 1) / (tf[t] + norm)
+            for t in query_terms if tf[t]
+        ))
+    return scores
+
+
+def _metadata_score(query_terms: set, candidate: dict) -> float:
+    metadata = candidate.get("metadata") or {}
+    fields = f"{metadata.get('region', '')} {metadata.get('type', '')}"
+    field_terms = set(tokenize(fields))
+    return 1.0 if field_terms and field_terms & query_terms else 0.0
+
+
+def rerank(query: str, candidates: list[dict], k: int = 3,
+           budget_ms: float = DEFAULT_BUDGET_MS) -> list[dict]:
+    """
+    Re-rank vector search candidates and keep the best k.
+
+    Args:
+        query: The user's question
+        candidates: Search results in vector order (id/score/data/metadata dicts)
+        k: Number of results to keep
+        budget_ms: Hard time budget; when exceeded the vector order is kept
+
+    Returns:
+        The top-k candidates, each annotated with a "rerank_score"
+    """
+    start = time.perf_counter()
+    deadline = start + budget_ms / 1000
+
+    if len(candidates) <= 1:
+        return candidates[:k]
+
+    try:
+        query_terms = tokenize(query)
+        docs = [tokenize(_candidate_text(c)) for c in candidates]
+        lexical = _bm25_scores(query_terms, docs, deadline) if query_terms else [0.0] * len(docs)
+        max_lexical = max(lexical) or 1.0
+        term_set = set(query_terms)
+
+        scored = []
+        for candidate, lex in zip(candidates, lexical):
+            score = (VECTOR_WEIGHT * candidate.get("score", 0)
+                     + LEXICAL_WEIGHT * lex / max_lexical
+                     + METADATA_WEIGHT * _metadata_score(term_set, candidate))
+            scored.append((score, candidate))
+        if time.perf_counter() > deadline:
+            raise TimeoutError
+    except TimeoutError:
+        stats.fallbacks += 1
+        stats.total_ms += (time.perf_counter() - start) * 1000
+        return candidates[:k]
+
+    scored.sort(key=lambda pair: pair[0], reverse=True)
+    stats.reranked += 1
+    stats.total_ms += (time.perf_counter() - start) * 1000
+    return [dict(candidate, rerank_score=round(score, 4)) for score, candidate in scored[:k]]
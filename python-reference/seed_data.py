@@ -10,6 +10,9 @@ import os
 from dotenv import load_dotenv
 from upstash_vector import Index
 
+from bulk_ingest import BulkUpserter
+from chunking import ChunkConfig, chunk_item
+
 # Load environment variables
 load_dotenv()
 
@@ -19,6 +22,12 @@ index = Index(
     token=os.getenv("UPSTASH_VECTOR_REST_TOKEN")
 )
 
+# Long entries are split into overlapping chunks (CHUNK_MAX_TOKENS / CHUNK_OVERLAP / CHUNK_MODE)
+CHUNKING = ChunkConfig.from_env()
+
+# Reconciliation report of the last seeding run (ids upserted, failed, missing)
+INGEST_REPORT = os.getenv("INGEST_REPORT", "ingest_report.json")
+
 
 # Sample food data
 FOOD_ITEMS = [
@@ -119,23 +128,35 @@ def seed_database():
     """
     Seed the vector database with food items.
     Uses Upstash's automatic embedding feature.
+    Long items are stored as chunks whose metadata points at the parent id.
+    Batches are uploaded in parallel and retried (see bulk_ingest.py); every
+    id is then fetched back and the reconciliation is written to INGEST_REPORT.
     """
     print(f"Seeding database with {len(FOOD_ITEMS)} food items...")
     
-    for item in FOOD_ITEMS:
-        try:
-            index.upsert(
-                vectors=[{
-                    "id": item["id"],
-                    "data": item["data"],
-                    "metadata": item["metadata"]
-                }]
-            )
-            print(f"  ✓ Added: {item['id']}")
-        except Exception as e:
-            print(f"  ✗ Failed to add {item['id']}: {e}")
+    vectors = (
+        {
+            "id": chunk["id"],
+            "data": chunk["data"],
+            "metadata": {**chunk["metadata"], "parent_id": chunk["parent_id"]}
+            if "parent_id" in chunk else chunk["metadata"]
+        }
+        for item in FOOD_ITEMS
+        for chunk in chunk_item(item, CHUNKING, text_field="data")
+    )
+    upserter = BulkUpserter.from_env(lambda batch: index.upsert(vectors=batch))
+    report = upserter.run(vectors, on_batch=lambda batches, upserted: print(
+        f"  ✓ Batch {batches} uploaded ({upserted} vectors so far)"))
+    upserter.verify(report, lambda ids: index.fetch(ids=ids))
+    report.save(INGEST_REPORT)
     
-    print("\nSeeding complete!")
+    for doc_id, error in report.failed.items():
+        print(f"  ✗ Failed to add {doc_id}: {error}")
+    for doc_id in report.missing:
+        print(f"  ✗ Missing after upload: {doc_id}")
+    summary = report.summary()
+    print(f"\nSeeding complete! {summary['upserted']}/{summary['submitted']} vectors in "
+          f"{summary['elapsed_s']}s (report: {INGEST_REPORT})")
     
     # Verify by checking index info
     info = index.info()
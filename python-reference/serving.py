@@ -0,0 +1,159 @@
+"""
+Pre-fork Query Serving
+Serve retrieval from N worker processes that share one index in memory.
+
+Each worker memory-maps the same snapshot file (see snapshot.py), so the
+embedding matrix and document columns live once in the OS page cache no
+matter how many workers run. CPU-bound per-query work (scoring, context
+building, token estimation) then scales across cores instead of being
+serialised by the GIL of a single process.
+
+Usage:
+    python serving.py index.snap --workers 1 2 4 8 --queries 5000
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+from tokens import estimate_tokens
+from vector_index import VectorIndex
+
+# Environment variables that cap BLAS/OpenMP threads inside each worker
+BLAS_THREAD_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+# Per-process index handle, opened once by the pool initializer
+_worker_index: Optional[VectorIndex] = None
+
+
+def _init_worker(snapshot_path: str) -> None:
+    global _worker_index
+    _worker_index = VectorIndex.load(snapshot_path)
+
+
+def _worker_pid(_) -> int:
+    return os.getpid()
+
+
+def build_context(results: list[dict]) -> str:
+    """Join retrieved documents into an LLM context (same format as rag_run.py)"""
+    return "\n".join(r["data"] for r in results)
+
+
+def _serve_one(task: tuple) -> dict:
+    query_vector, k = task
+    results = _worker_index.query(query_vector, k)
+    context = build_context(results)
+    return {
+        "ids": [r["id"] for r in results],
+        "scores": [r["score"] for r in results],
+        "context": context,
+        "context_tokens": estimate_tokens(context),
+        "pid": os.getpid(),
+    }
+
+
+@contextmanager
+def _single_threaded_blas():
+    """Spawned workers inherit this environment, so each uses one BLAS thread"""
+    saved = {name: os.environ.get(name) for name in BLAS_THREAD_VARS}
+    for name in BLAS_THREAD_VARS:
+        os.environ[name] = "1"
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+class QueryServer:
+    """Pool of worker processes serving retrieval from a shared snapshot"""
+
+    def __init__(self, snapshot_path: Union[str, Path], workers: Optional[int] = None):
+        self.snapshot_path = str(snapshot_path)
+        self.workers = workers or os.cpu_count() or 1
+        # spawn works on every platform and avoids forking a process holding client sockets
+        ctx = mp.get_context("spawn")
+        with _single_threaded_blas():
+            self._pool = ctx.Pool(
+                self.workers,
+                initializer=_init_worker,
+                initargs=(self.snapshot_path,)
+            )
+        # Block until every worker has mapped the snapshot
+        self._pool.map(_worker_pid, range(self.workers), chunksize=1)
+
+    def search(self, query_vector, k: int = 3) -> dict:
+        """Serve a single query on the next free worker"""
+        return self._pool.apply(_serve_one, ((np.asarray(query_vector, dtype=np.float32), k),))
+
+    def search_many(self, query_vectors, k: int = 3, chunksize: int = 16) -> list[dict]:
+        """Serve many queries across all workers, results in input order"""
+        tasks = [(np.asarray(q, dtype=np.float32), k) for q in query_vectors]
+        return self._pool.map(_serve_one, tasks, chunksize=chunksize)
+
+    def close(self) -> None:
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def sample_queries(index: VectorIndex, n: int, noise: float = 0.05, seed: int = 0) -> np.ndarray:
+    """Synthetic query vectors: random documents plus Gaussian noise"""
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(index), size=n)
+    base = np.asarray(index.embeddings[rows], dtype=np.float32)
+    return base + rng.normal(0, noise, size=base.shape).astype(np.float32)
+
+
+def benchmark(snapshot_path: Union[str, Path], worker_counts=(1, 2, 4), queries: int = 2000,
+              k: int = 3, chunksize: int = 16) -> list[dict]:
+    """
+    Measure serving throughput for each worker count.
+
+    Returns:
+        One row per worker count with queries/sec and speedup vs the first row
+    """
+    query_vectors = sample_queries(VectorIndex.load(snapshot_path), queries)
+    rows = []
+    for workers in worker_counts:
+        with QueryServer(snapshot_path, workers=workers) as server:
+            start = time.perf_counter()
+            server.search_many(query_vectors, k=k, chunksize=chunksize)
+            elapsed = time.perf_counter() - start
+        qps = queries / elapsed
+        rows.append({
+            "workers": workers,
+            "seconds": round(elapsed, 3),
+            "qps": round(qps, 1),
+            "speedup": round(qps / rows[0]["qps"], 2) if rows else 1.0,
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark multi-process retrieval serving")
+    parser.add_argument("snapshot", help="Path to an index snapshot (e.g. local-version/index.snap)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"🚀 Serving benchmark: {args.queries} queries against {args.snapshot}")
+    print(f"{'Workers':>8} {'Seconds':>10} {'QPS':>10} {'Speedup':>8}")
+    for row in benchmark(args.snapshot, args.workers, args.queries, args.top_k):
+        print(f"{row['workers']:>8} {row['seconds']:>10} {row['qps']:>10} {row['speedup']:>7}x")
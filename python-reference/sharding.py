@@ -0,0 +1,187 @@
+"""
+Sharded Vector Search
+Partition documents across shards and search them in parallel (scatter-gather).
+
+Documents are assigned to shards by a stable hash of their id, or by
+their `type` / `region` so related documents share a shard (and queries
+with a known type can skip the other shards). A query is sent to every
+shard on a thread pool and the per-shard top-k lists are combined with a
+k-way heap merge. NumPy releases the GIL inside the matrix products, so
+threads give real parallelism.
+
+Shards are local VectorIndex snapshots. ShardedIndex only needs objects
+with a `name` and a `search(query, k)` method, but no remote (Upstash
+namespace) shard is provided: the cloud scripts upsert, verify and reset
+the default namespace only.
+
+Usage:
+    python sharding.py local-version/index.snap --shards 1 2 4 8 --by hash
+"""
+
+import argparse
+import heapq
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+from vector_index import VectorIndex
+
+PARTITION_KEYS = ("hash", "type", "region")
+
+
+def shard_for(key: str, n_shards: int) -> int:
+    """Stable shard number for a key (CRC32, identical across processes and runs)"""
+    return zlib.crc32(str(key).encode("utf-8")) % n_shards
+
+
+class LocalShard:
+    """A VectorIndex searched as one shard"""
+
+    def __init__(self, index: VectorIndex, name: str):
+        self.index = index
+        self.name = name
+
+    def search(self, query, k: int) -> list[dict]:
+        return self.index.query(query, k)
+
+
+class ShardedIndex:
+    """Scatter a query to every shard in parallel and merge the results"""
+
+    def __init__(self, shards: list, max_workers: Optional[int] = None):
+        self.shards = shards
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or len(shards))
+
+    def search(self, query, k: int = 3, shards: Optional[list] = None) -> list[dict]:
+        """
+        Top-k over all shards (or only the named ones).
+
+        Args:
+            query: Query vector
+            k: Number of results
+            shards: Optional shard names to restrict the search to
+
+        Returns:
+            Merged results, best first, each tagged with its "shard"
+        """
+        targets = [s for s in self.shards if shards is None or s.name in shards]
+        futures = [(shard.name, self._pool.submit(shard.search, query, k)) for shard in targets]
+        per_shard = [
+            [dict(r, shard=name) for r in future.result()]
+            for name, future in futures
+        ]
+        # Each shard list is already sorted best-first, so a k-way merge suffices
+        merged = heapq.merge(*per_shard, key=lambda r: -r["score"])
+        return list(islice(merged, k))
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+
+
+def partition_rows(index: VectorIndex, n_shards: int, by: str = "hash") -> list[np.ndarray]:
+    """Row numbers of each shard"""
+    if by not in PARTITION_KEYS:
+        raise ValueError(f"Unknown partition key {by!r}, expected one of {PARTITION_KEYS}")
+    docs = index.docs
+    if by == "hash":
+        keys = [docs.doc_id(row) for row in range(len(index))]
+    elif by == "type":
+        keys = [docs.type(row) for row in range(len(index))]
+    else:
+        keys = [docs.region(row) for row in range(len(index))]
+    assignment = np.fromiter((shard_for(key, n_shards) for key in keys), dtype=np.int32, count=len(keys))
+    return [np.flatnonzero(assignment == shard) for shard in range(n_shards)]
+
+
+def build_local_shards(index: VectorIndex, n_shards: int, by: str = "hash",
+                       path_prefix: Optional[Union[str, Path]] = None) -> list[LocalShard]:
+    """
+    Split a VectorIndex into shards.
+
+    Args:
+        index: The full index
+        n_shards: Number of shards
+        by: "hash" (of the id), "type" or "region"
+        path_prefix: When set, each shard is saved as `<prefix>.shard<i>.snap` and
+            reloaded memory-mapped
+
+    Returns:
+        One LocalShard per non-empty partition
+    """
+    docs = index.docs
+    shards = []
+    for shard_num, rows in enumerate(partition_rows(index, n_shards, by)):
+        if len(rows) == 0:
+            continue
+        shard_index = VectorIndex.build(
+            np.asarray(index.embeddings[rows]),
+            [docs.doc_id(r) for r in rows],
+            [docs.text(r) for r in rows],
+            [docs.region(r) for r in rows],
+            [docs.type(r) for r in rows],
+            model=index.meta.get("model"),
+        )
+        shard_index.mode = index.mode
+        if index.reducer is not None:
+            # The reducer is fitted on the whole corpus, so every shard searches the same space
+            shard_index.reducer = index.reducer
+            shard_index.reduced_embeddings = np.asarray(index.reduced_embeddings[rows])
+            shard_index.rerank_full = index.rerank_full
+        if path_prefix:
+            path = Path(f"{path_prefix}.shard{shard_num}.snap")
+            shard_index.save(path)
+            shard_index = VectorIndex.load(path)
+        shards.append(LocalShard(shard_index, f"shard-{shard_num}"))
+    return shards
+
+
+def sharding_benchmark(index: VectorIndex, query_vectors: np.ndarray, shard_counts=(1, 2, 4, 8),
+                       by: str = "hash", k: int = 3, repeats: int = 20) -> list[dict]:
+    """
+    Latency of scatter-gather search per shard count, checked against the unsharded index.
+
+    Returns:
+        One row per shard count with average latency and whether the top-k ids match
+    """
+    expected = [[r["id"] for r in index.query(q, k)] for q in query_vectors]
+    rows = []
+    for n_shards in shard_counts:
+        sharded = ShardedIndex(build_local_shards(index, n_shards, by))
+        try:
+            matches = all([r["id"] for r in sharded.search(q, k)] == ids
+                          for q, ids in zip(query_vectors, expected))
+            start = time.perf_counter()
+            for _ in range(repeats):
+                for q in query_vectors:
+                    sharded.search(q, k)
+            avg_ms = (time.perf_counter() - start) * 1000 / (repeats * len(query_vectors))
+        finally:
+            sharded.close()
+        rows.append({"shards": len(sharded.shards), "avg_ms": round(avg_ms, 4), "matches": matches})
+    return rows
+
+
+if __name__ == "__main__":
+    from embeddings import ollama_embed
+    from query_sets import all_test_queries
+
+    parser = argparse.ArgumentParser(description="Benchmark sharded scatter-gather search")
+    parser.add_argument("snapshot", help="Path to an index snapshot")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--by", choices=PARTITION_KEYS, default="hash")
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    index = VectorIndex.load(args.snapshot)
+    queries = [q for q, _ in all_test_queries()]
+    print(f"🔢 Embedding {len(queries)} TEST_QUERIES with Ollama...")
+    query_vectors = ollama_embed(queries)
+
+    print(f"\n{'Shards':>6} {'Avg ms':>10} {'Same top-k':>11}")
+    for row in sharding_benchmark(index, query_vectors, args.shards, args.by, args.top_k):
+        print(f"{row['shards']:>6} {row['avg_ms']:>10} {str(row['matches']):>11}")
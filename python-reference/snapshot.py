@@ -0,0 +1,202 @@
+"""
+Index Snapshot Format
+Versioned single-file snapshots of a retrieval index, loaded via np.memmap.
+
+Opening a snapshot only parses a small header and maps the sections, so
+load time does not depend on corpus size, and every process that opens
+the same file shares its pages through the OS page cache.
+
+File layout (all integers little-endian):
+
+    magic        8 bytes   b"FRAGSNAP"
+    version      uint32
+    header_len   uint32
+    header_crc   uint32    CRC32 of the header bytes
+    header       JSON      {"sections": {...}, "meta": {...}, "payload_crc32": int}
+    sections     raw array bytes, each aligned to 64 bytes
+"""
+
+import json
+import mmap
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+MAGIC = b"FRAGSNAP"
+VERSION = 1
+ALIGNMENT = 64
+PREFIX = struct.Struct("<8sIII")
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file is missing, corrupt or an unsupported version"""
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_snapshot(path: Union[str, Path], sections: dict, meta: Optional[dict] = None) -> Path:
+    """
+    Write named arrays to a snapshot file.
+
+    The file is written next to the target and renamed into place, so
+    readers never observe a partially written snapshot.
+
+    Args:
+        path: Output file
+        sections: Mapping of section name to numpy array
+        meta: JSON-serialisable metadata (vocabularies, model name, ...)
+
+    Returns:
+        The snapshot path
+    """
+    path = Path(path)
+    arrays = {name: np.ascontiguousarray(arr) for name, arr in sections.items()}
+
+    # Lay out sections: offsets are relative to the start of the payload
+    layout = {}
+    offset = 0
+    for name, arr in arrays.items():
+        offset = _align(offset)
+        layout[name] = {
+            "offset": offset,
+            "dtype": arr.dtype.str,
+            "shape": list(arr.shape),
+            "nbytes": int(arr.nbytes),
+        }
+        offset += arr.nbytes
+
+    crc = 0
+    for name, arr in arrays.items():
+        crc = zlib.crc32(memoryview(arr).cast("B"), crc)
+
+    header = {
+        "sections": layout,
+        "meta": meta or {},
+        "payload_crc32": crc,
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    payload_start = _align(PREFIX.size + len(header_bytes))
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(PREFIX.pack(MAGIC, VERSION, len(header_bytes), zlib.crc32(header_bytes)))
+        f.write(header_bytes)
+        for name, arr in arrays.items():
+            f.seek(payload_start + layout[name]["offset"])
+            f.write(memoryview(arr).cast("B"))
+        f.truncate(payload_start + offset)
+    os.replace(tmp_path, path)
+    return path
+
+
+class Snapshot:
+    """Memory-mapped, read-only view of a snapshot file"""
+
+    def __init__(self, path: Union[str, Path], verify: bool = False):
+        self.path = Path(path)
+        if not self.path.exists():
+            raise SnapshotError(f"Snapshot not found: {self.path}")
+
+        with open(self.path, "rb") as f:
+            prefix = f.read(PREFIX.size)
+            if len(prefix) < PREFIX.size:
+                raise SnapshotError("Snapshot file is truncated")
+            magic, version, header_len, header_crc = PREFIX.unpack(prefix)
+            if magic != MAGIC:
+                raise SnapshotError("Not a snapshot file (bad magic)")
+            if version != VERSION:
+                raise SnapshotError(f"Unsupported snapshot version: {version}")
+            header_bytes = f.read(header_len)
+
+        if zlib.crc32(header_bytes) != header_crc:
+            raise SnapshotError("Snapshot header checksum mismatch")
+
+        header = json.loads(header_bytes)
+        self.meta = header["meta"]
+        self.payload_crc32 = header["payload_crc32"]
+        self.sections = header["sections"]
+        self._payload_start = _align(PREFIX.size + header_len)
+        self._arrays = {}
+
+        if verify:
+            self.verify()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.sections
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """Section as a read-only memmap (mapped on first access)"""
+        if name not in self._arrays:
+            if name not in self.sections:
+                raise KeyError(name)
+            info = self.sections[name]
+            dtype = np.dtype(info["dtype"])
+            shape = tuple(info["shape"])
+            if info["nbytes"] == 0:
+                # Zero-length regions cannot be memory-mapped
+                self._arrays[name] = np.empty(shape, dtype=dtype)
+            else:
+                self._arrays[name] = np.memmap(
+                    self.path, dtype=dtype, mode="r",
+                    offset=self._payload_start + info["offset"], shape=shape
+                )
+        return self._arrays[name]
+
+    def get(self, name: str, default=None):
+        return self[name] if name in self else default
+
+    def verify(self) -> None:
+        """Recompute the payload checksum (reads every section once)"""
+        crc = 0
+        for name in self.sections:
+            arr = self[name]
+            if arr.nbytes:
+                crc = zlib.crc32(memoryview(np.ascontiguousarray(arr)).cast("B"), crc)
+        if crc != self.payload_crc32:
+            raise SnapshotError("Snapshot payload checksum mismatch")
+
+    def touch(self) -> int:
+        """
+        Fault every page of the snapshot into the page cache.
+
+        Returns:
+            Number of bytes touched
+        """
+        page = mmap.PAGESIZE
+        touched = 0
+        for name in self.sections:
+            arr = self[name]
+            if arr.nbytes:
+                flat = arr.reshape(-1).view(np.uint8)
+                # Reading one byte per page is enough to fault it in
+                int(flat[::page].sum())
+                touched += arr.nbytes
+        return touched
+
+
+def encode_strings(values) -> tuple:
+    """
+    Encode strings as a UTF-8 blob plus an int64 offsets array.
+
+    Returns:
+        (blob uint8 array, offsets int64 array of length n + 1)
+    """
+    encoded = [str(v).encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded)),
+              out=offsets[1:])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return blob, offsets
+
+
+def open_snapshot(path: Optional[Union[str, Path]], verify: bool = False) -> Optional[Snapshot]:
+    """Open a snapshot if the file exists, otherwise return None"""
+    if not path or not Path(path).exists():
+        return None
+    return Snapshot(path, verify=verify)
@@ -0,0 +1,228 @@
+"""
+Token and Cost Accounting
+Record token counts, throughput and estimated cost of model calls.
+
+Every generation and embedding call yields a TokenUsage record: prompt
+and completion tokens (from the provider's usage block when it returns
+one, otherwise estimated from text length), tokens per second and the
+estimated cost from a per-model price table. A UsageLedger aggregates
+records per query category, so tuning changes can be judged by what
+they do to both latency and spend.
+
+Provider usage fields:
+- Groq (OpenAI-compatible): usage.prompt_tokens / completion_tokens and
+  usage.completion_time (seconds spent generating)
+- Ollama /api/generate: prompt_eval_count, eval_count, eval_duration (ns)
+- Ollama /api/embed: prompt_eval_count
+- Upstash auto-embedding returns no usage, so query tokens are estimated
+
+Configuration (environment):
+    TOKEN_PRICES   JSON {"model": [input $/1M tokens, output $/1M tokens]}
+                   merged over the built-in table
+"""
+
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Optional
+
+from tokens import estimate_tokens
+
+# USD per million tokens: (input, output). Local Ollama models cost nothing per call;
+# Upstash bills embedding per request rather than per token.
+DEFAULT_PRICES = {
+    "llama-3.1-8b-instant": (0.05, 0.08),
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "llama3.2": (0.0, 0.0),
+    "mxbai-embed-large": (0.0, 0.0),
+    "upstash-embedding": (0.0, 0.0),
+}
+
+KINDS = ("generation", "embedding")
+
+
+def load_prices() -> dict:
+    """Built-in price table with TOKEN_PRICES overrides applied"""
+    prices = dict(DEFAULT_PRICES)
+    override = os.getenv("TOKEN_PRICES")
+    if override:
+        prices.update({model: tuple(pair) for model, pair in json.loads(override).items()})
+    return prices
+
+
+PRICES = load_prices()
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int = 0) -> float:
+    """Estimated USD cost of one call (0 for models missing from the price table)"""
+    input_price, output_price = PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+@dataclass
+class TokenUsage:
+    """Token counts and timing of one model call"""
+
+    kind: str                   # "generation" or "embedding"
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    seconds: float = 0.0        # time the throughput is measured over
+    estimated: bool = False     # counts approximated from text length
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def tokens_per_second(self) -> float:
+        """Generated tokens per second (input tokens per second for embeddings)"""
+        tokens = self.completion_tokens if self.kind == "generation" else self.prompt_tokens
+        return tokens / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def cost_usd(self) -> float:
+        return estimate_cost(self.model, self.prompt_tokens, self.completion_tokens)
+
+    def summary(self) -> dict:
+        return {
+            "kind": self.kind,
+            "model": self.model,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "tokens_per_second": round(self.tokens_per_second, 1),
+            "cost_usd": round(self.cost_usd, 8),
+            "estimated": self.estimated,
+        }
+
+
+def from_groq(completion, model: str, elapsed_s: float, prompt_text: str = "") -> TokenUsage:
+    """
+    Usage of a Groq chat completion.
+
+    Args:
+        completion: The ChatCompletion response
+        model: Model name (for pricing)
+        elapsed_s: Wall-clock time of the call (used when Groq reports no timing)
+        prompt_text: Prompt, for estimating when the response carries no usage block
+    """
+    usage = getattr(completion, "usage", None)
+    if usage is None:
+        text = completion.choices[0].message.content or ""
+        return TokenUsage("generation", model, estimate_tokens(prompt_text), estimate_tokens(text),
+                          elapsed_s, estimated=True)
+    return TokenUsage("generation", model, usage.prompt_tokens or 0, usage.completion_tokens or 0,
+                      getattr(usage, "completion_time", None) or elapsed_s)
+
+
+def from_ollama_generate(body: dict, model: str, elapsed_s: float) -> TokenUsage:
+    """Usage of an Ollama /api/generate (stream=False) response body"""
+    eval_ns = body.get("eval_duration")
+    return TokenUsage("generation", model, body.get("prompt_eval_count", 0), body.get("eval_count", 0),
+                      eval_ns / 1e9 if eval_ns else elapsed_s)
+
+
+def from_ollama_embed(body: dict, model: str, elapsed_s: float, texts: Optional[list] = None) -> TokenUsage:
+    """Usage of an Ollama /api/embed (or legacy /api/embeddings) response body"""
+    if "prompt_eval_count" in body:
+        return TokenUsage("embedding", model, body["prompt_eval_count"], seconds=elapsed_s)
+    # The legacy endpoint reports no counts
+    return TokenUsage("embedding", model, sum(estimate_tokens(t) for t in texts or []),
+                      seconds=elapsed_s, estimated=True)
+
+
+def estimated_embedding(texts: list[str], elapsed_s: float, model: str = "upstash-embedding") -> TokenUsage:
+    """Usage of an embedding the provider does not report (e.g. Upstash auto-embedding)"""
+    return TokenUsage("embedding", model, sum(estimate_tokens(t) for t in texts),
+                      seconds=elapsed_s, estimated=True)
+
+
+@dataclass
+class UsageTotals:
+    """Running totals of one (category, kind) bucket"""
+
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    seconds: float = 0.0
+    cost_usd: float = 0.0
+    estimated_calls: int = 0
+    models: set = field(default_factory=set)
+
+    def add(self, usage: TokenUsage) -> None:
+        self.calls += 1
+        self.prompt_tokens += usage.prompt_tokens
+        self.completion_tokens += usage.completion_tokens
+        self.seconds += usage.seconds
+        self.cost_usd += usage.cost_usd
+        self.estimated_calls += usage.estimated
+        self.models.add(usage.model)
+
+    def merge(self, other: "UsageTotals") -> None:
+        self.calls += other.calls
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.seconds += other.seconds
+        self.cost_usd += other.cost_usd
+        self.estimated_calls += other.estimated_calls
+        self.models |= other.models
+
+    def summary(self, kind: str) -> dict:
+        tokens = self.completion_tokens if kind == "generation" else self.prompt_tokens
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "avg_prompt_tokens": round(self.prompt_tokens / self.calls, 1) if self.calls else 0.0,
+            "avg_completion_tokens": round(self.completion_tokens / self.calls, 1) if self.calls else 0.0,
+            "tokens_per_second": round(tokens / self.seconds, 1) if self.seconds > 0 else 0.0,
+            "cost_usd": round(self.cost_usd, 6),
+            "estimated_calls": self.estimated_calls,
+            "models": sorted(self.models),
+        }
+
+
+class UsageLedger:
+    """Thread-safe aggregation of TokenUsage records per query category"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: dict[tuple, UsageTotals] = {}
+        self.queries: dict[str, int] = {}
+
+    def record(self, usage: Optional[TokenUsage], category: str = "all") -> None:
+        if usage is None:
+            return
+        with self._lock:
+            self._totals.setdefault((category, usage.kind), UsageTotals()).add(usage)
+
+    def count_query(self, category: str = "all") -> None:
+        """Count a query (including ones answered without model calls) for per-query cost"""
+        with self._lock:
+            self.queries[category] = self.queries.get(category, 0) + 1
+
+    def _summarize(self, buckets: dict, queries: int) -> dict:
+        merged = {kind: UsageTotals() for kind in KINDS}
+        for (_, kind), totals in buckets.items():
+            merged[kind].merge(totals)
+        cost = sum(t.cost_usd for t in merged.values())
+        return {
+            "queries": queries,
+            **{kind: merged[kind].summary(kind) for kind in KINDS if merged[kind].calls},
+            "cost_usd": round(cost, 6),
+            "cost_per_query_usd": round(cost / queries, 8) if queries else 0.0,
+        }
+
+    def by_category(self) -> dict:
+        with self._lock:
+            categories = sorted({c for c, _ in self._totals} | set(self.queries))
+            return {
+                category: self._summarize({key: t for key, t in self._totals.items() if key[0] == category},
+                                          self.queries.get(category, 0))
+                for category in categories
+            }
+
+    def summary(self) -> dict:
+        with self._lock:
+            return self._summarize(dict(self._totals), sum(self.queries.values()))
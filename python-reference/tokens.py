@@ -0,0 +1,15 @@
+"""
+Token Estimation
+One cheap token-count rule shared by serving, conversation memory and usage accounting.
+
+Tokenizers differ per model; for budgeting prompts and estimating cost
+when a provider reports no usage, ~4 characters per token is close
+enough for English text and costs nothing to compute.
+"""
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text); 0 for empty text"""
+    return max(1, len(text) // CHARS_PER_TOKEN) if text else 0
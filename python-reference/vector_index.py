@@ -0,0 +1,234 @@
+"""
+In-Memory Vector Index
+Cosine-similarity search over an embedding matrix with NumPy.
+
+The index owns an L2-normalised float32 matrix plus a DocStore for the
+documents, and persists both into a single snapshot file (see snapshot.py)
+so a restart reloads it via np.memmap instead of re-embedding the corpus.
+Search is exact by default; int8 or binary codes (quantization.py) can be
+selected as the search mode, with float32 rescoring of the candidates.
+Exact search can also run on reduced-dimension vectors (reduction.py),
+optionally re-ranking the top candidates with the full vectors.
+"""
+
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+import quantization
+from doc_store import DocStore
+from reduction import Reducer
+from snapshot import Snapshot, write_snapshot
+
+INDEX_KIND = "food-rag-vector-index"
+
+
+def normalize_rows(matrix) -> np.ndarray:
+    """L2-normalise rows so a dot product equals cosine similarity"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k(scores: np.ndarray, k: int) -> tuple:
+    """
+    Indices and values of the k largest scores along the last axis, sorted descending.
+
+    Works for a single score vector or a (queries, docs) score matrix.
+    """
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        empty = np.empty(scores.shape[:-1] + (0,))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    part = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    part_scores = np.take_along_axis(scores, part, axis=-1)
+    order = np.argsort(-part_scores, axis=-1)
+    return np.take_along_axis(part, order, axis=-1), np.take_along_axis(part_scores, order, axis=-1)
+
+
+class VectorIndex:
+    """Brute-force cosine index over a document collection"""
+
+    def __init__(self, embeddings: np.ndarray, docs: DocStore, meta: Optional[dict] = None,
+                 mode: str = "float32"):
+        self.embeddings = embeddings
+        self.docs = docs
+        self.meta = meta or {}
+        self.snapshot = None
+        # Quantized codes (see quantization.py); computed by ensure_quantized()
+        self.int8_codes = None
+        self.int8_scale = None
+        self.binary_codes = None
+        # Optional reduced-dimension copy used by float32 search (see reduce())
+        self.reducer = None
+        self.reduced_embeddings = None
+        self.rerank_full = True
+        self.mode = mode
+
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    @mode.setter
+    def mode(self, mode: str) -> None:
+        """Select the search backend: "float32" (exact), "int8" or "binary" (+ float rescoring)"""
+        if mode not in quantization.MODES:
+            raise ValueError(f"Unknown search mode {mode!r}, expected one of {quantization.MODES}")
+        self._mode = mode
+        if mode != "float32":
+            self.ensure_quantized()
+
+    def ensure_quantized(self) -> None:
+        """Compute int8 and binary codes if they were not loaded from a snapshot"""
+        if self.int8_codes is None:
+            self.int8_scale = quantization.fit_int8_scale(self.embeddings)
+            self.int8_codes = quantization.quantize_int8(self.embeddings, self.int8_scale)
+        if self.binary_codes is None:
+            self.binary_codes = quantization.binary_codes(self.embeddings)
+
+    def reduce(self, dims: int, method: str = "pca", rerank_full: bool = True) -> None:
+        """
+        Search float32 mode on `dims`-dimensional vectors.
+
+        Args:
+            dims: Reduced dimension (e.g. 256)
+            method: "pca" or "matryoshka"
+            rerank_full: Re-rank the top candidates with the full-dimension vectors
+        """
+        self.reducer = Reducer.fit(self.embeddings, dims, method)
+        self.reduced_embeddings = self.reducer.transform(self.embeddings)
+        self.rerank_full = rerank_full
+
+    @classmethod
+    def build(cls, embeddings, ids: list, texts: list, regions: Optional[list] = None,
+              types: Optional[list] = None, model: Optional[str] = None) -> "VectorIndex":
+        """
+        Build an index from raw embeddings and document columns.
+
+        Args:
+            embeddings: (n, dim) array-like of document embeddings
+            ids, texts, regions, types: Parallel document columns
+            model: Embedding model name, recorded in the snapshot metadata
+        """
+        matrix = normalize_rows(embeddings)
+        if matrix.ndim != 2 or matrix.shape[0] != len(ids):
+            raise ValueError(f"Expected ({len(ids)}, dim) embeddings, got {matrix.shape}")
+        docs = DocStore.from_columns(ids, texts, regions, types)
+        return cls(matrix, docs, {"model": model, "dim": int(matrix.shape[1])})
+
+    @classmethod
+    def load(cls, path: Union[str, Path], verify: bool = False,
+             mode: Optional[str] = None) -> "VectorIndex":
+        """
+        Memory-map an index snapshot (constant time regardless of corpus size).
+
+        Args:
+            path: Snapshot file
+            verify: Recompute the payload checksum (reads the whole file)
+            mode: Search mode; defaults to the mode stored in the snapshot
+        """
+        snap = Snapshot(path, verify=verify)
+        if snap.meta.get("kind") != INDEX_KIND:
+            raise ValueError(f"{path} is not a vector index snapshot")
+        index = cls(snap["embeddings"], DocStore.from_snapshot(snap), snap.meta)
+        index.snapshot = snap
+        index.int8_codes = snap.get("int8_codes")
+        index.int8_scale = snap.get("int8_scale")
+        index.binary_codes = snap.get("binary_codes")
+        index.reducer = Reducer.from_snapshot(snap)
+        if index.reducer is not None:
+            index.reduced_embeddings = snap["reduced_embeddings"]
+            index.rerank_full = snap.meta["reduction"].get("rerank_full", True)
+        index.mode = mode or snap.meta.get("search_mode", "float32")
+        return index
+
+    def sections(self) -> tuple:
+        """Arrays and metadata written to the snapshot (extended by index options)"""
+        arrays = {"embeddings": np.asarray(self.embeddings, dtype=np.float32)}
+        doc_arrays, doc_meta = self.docs.sections()
+        arrays.update(doc_arrays)
+        if self.int8_codes is not None:
+            arrays["int8_codes"] = np.asarray(self.int8_codes)
+            arrays["int8_scale"] = np.asarray(self.int8_scale)
+        if self.binary_codes is not None:
+            arrays["binary_codes"] = np.asarray(self.binary_codes)
+        meta = dict(self.meta)
+        meta.pop("reduction", None)
+        if self.reducer is not None:
+            reducer_arrays, reducer_meta = self.reducer.sections()
+            arrays.update(reducer_arrays)
+            arrays["reduced_embeddings"] = np.asarray(self.reduced_embeddings)
+            reducer_meta["reduction"]["rerank_full"] = self.rerank_full
+            meta.update(reducer_meta)
+        meta.update(doc_meta)
+        meta.update({"kind": INDEX_KIND, "count": len(self), "dim": self.dim,
+                     "search_mode": self.mode})
+        return arrays, meta
+
+    def save(self, path: Union[str, Path]) -> Path:
+        arrays, meta = self.sections()
+        return write_snapshot(path, arrays, meta)
+
+    def __len__(self) -> int:
+        return int(self.embeddings.shape[0])
+
+    @property
+    def dim(self) -> int:
+        return int(self.embeddings.shape[1])
+
+    def search(self, query, k: int = 3, mode: Optional[str] = None) -> tuple:
+        """
+        Top-k search for one query vector.
+
+        Args:
+            query: Query embedding
+            k: Number of results
+            mode: Override the index search mode for this call
+
+        Returns:
+            (row indices, cosine scores), best first
+        """
+        q = normalize_rows(query)
+        mode = mode or self.mode
+        if mode == "float32":
+            if self.reducer is None:
+                return top_k(self.embeddings @ q, k)
+            reduced_q = self.reducer.transform(q)
+            if not self.rerank_full:
+                return top_k(self.reduced_embeddings @ reduced_q, k)
+            candidates, _ = top_k(self.reduced_embeddings @ reduced_q, k * quantization.RESCORE_FACTOR)
+            candidates = np.sort(candidates)
+            rows, scores = top_k(np.asarray(self.embeddings[candidates]) @ q, k)
+            return candidates[rows], scores
+
+        self.ensure_quantized()
+        n_candidates = k * quantization.RESCORE_FACTOR
+        if mode == "int8":
+            approx = quantization.int8_scores(q, self.int8_codes, self.int8_scale)
+        else:
+            query_code = quantization.binary_codes(q)
+            approx = -quantization.hamming_distances(query_code, self.binary_codes)
+        candidates = np.sort(quantization.candidate_rows(approx, n_candidates))
+        # Rescore only the candidate rows against the float32 vectors
+        rows, scores = top_k(np.asarray(self.embeddings[candidates]) @ q, k)
+        return candidates[rows], scores
+
+    def search_batch(self, queries, k: int = 3) -> tuple:
+        """
+        Top-k search for many queries (exact mode uses one matrix-matrix product).
+
+        Returns:
+            ((n_queries, k) row indices, (n_queries, k) scores)
+        """
+        q = normalize_rows(queries)
+        if self.mode != "float32" or self.reducer is not None:
+            results = [self.search(row, k) for row in q]
+            return np.stack([r[0] for r in results]), np.stack([r[1] for r in results])
+        return top_k(q @ self.embeddings.T, k)
+
+    def query(self, query, k: int = 3) -> list[dict]:
+        """Search and hydrate results (same shape as rag_system.search_food_items)"""
+        rows, scores = self.search(query, k)
+        return [self.docs.result(int(r), float(s)) for r, s in zip(rows, scores)]
@@ -0,0 +1,147 @@
+"""
+Startup Warm-up
+Pay connection setup and model load time before the first question.
+
+The first query after a cold start otherwise pays TLS handshakes to
+Upstash and Groq, Ollama model load time (models are loaded lazily and
+unloaded after a few idle minutes) and page faults on the memory-mapped
+index. Warm-up runs all of these concurrently at startup:
+
+- a tiny Upstash query (opens the pooled connection, exercises embedding)
+- a one-token Groq completion (opens the pooled connection)
+- a tiny Ollama embed and an empty Ollama generate with keep_alive set,
+  so both models are loaded and stay resident
+- Snapshot.touch() on every memory-mapped index
+
+Readiness should be reported only after warm_up() returns.
+
+Configuration (environment):
+    WARMUP              "0" disables warm-up (default on)
+    WARMUP_TIMEOUT      seconds to wait for all tasks (default 120)
+    OLLAMA_KEEP_ALIVE   how long Ollama keeps models loaded (default "30m")
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable
+
+WARMUP_ENABLED = os.getenv("WARMUP", "1") != "0"
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "120"))
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+WARMUP_TEXT = "warm up"
+
+
+@dataclass
+class WarmupReport:
+    tasks: dict = field(default_factory=dict)   # name -> {"ok", "ms", "error"}
+    total_ms: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return all(task["ok"] for task in self.tasks.values())
+
+    def failures(self) -> dict:
+        return {name: task["error"] for name, task in self.tasks.items() if not task["ok"]}
+
+    def summary(self) -> dict:
+        return {"ok": self.ok, "total_ms": round(self.total_ms, 2), "tasks": self.tasks}
+
+
+def _timed(task: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    task()
+    return (time.perf_counter() - start) * 1000
+
+
+def warm_up(tasks: dict, timeout: float = WARMUP_TIMEOUT) -> WarmupReport:
+    """
+    Run warm-up tasks concurrently and wait for all of them.
+
+    A failing task is reported, never raised: the service still starts,
+    it just starts cold for that backend.
+
+    Args:
+        tasks: {name: Function()} (see the task factories below)
+        timeout: Seconds to wait for all tasks; unfinished tasks count as failed
+
+    Returns:
+        Per-task outcome and the wall time of the whole warm-up
+    """
+    report = WarmupReport()
+    if not tasks:
+        return report
+    start = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="warmup")
+    futures = {name: pool.submit(_timed, task) for name, task in tasks.items()}
+    wait(futures.values(), timeout=timeout)
+    for name, future in futures.items():
+        if not future.done():
+            report.tasks[name] = {"ok": False, "ms": None, "error": f"timed out after {timeout:.0f}s"}
+        elif future.exception() is not None:
+            report.tasks[name] = {"ok": False, "ms": None, "error": str(future.exception())}
+        else:
+            report.tasks[name] = {"ok": True, "ms": round(future.result(), 2), "error": None}
+    # Don't wait for stuck tasks; they finish (or fail) in the background
+    pool.shutdown(wait=False)
+    report.total_ms = (time.perf_counter() - start) * 1000
+    return report
+
+
+def print_report(report: WarmupReport) -> None:
+    for name, task in report.tasks.items():
+        status = f"{task['ms']:.0f} ms" if task["ok"] else f"failed ({task['error']})"
+        print(f"   • {name}: {status}")
+
+
+# ============================================
+# Task factories
+# ============================================
+
+def upstash_task(index) -> Callable[[], object]:
+    """Tiny query: TLS handshake on the client's pooled connection plus one server-side embed"""
+    return lambda: index.query(data=WARMUP_TEXT, top_k=1)
+
+
+def groq_task(client, model: str) -> Callable[[], object]:
+    """One-token completion: TLS handshake on the client's pooled connection"""
+    return lambda: client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": WARMUP_TEXT}],
+        max_tokens=1,
+    )
+
+
+def ollama_embed_task(session, url: str, model: str, keep_alive: str = OLLAMA_KEEP_ALIVE) -> Callable[[], object]:
+    """Load the embedding model and keep it resident"""
+    def task():
+        response = session.post(f"{url}/api/embed", json={
+            "model": model,
+            "input": WARMUP_TEXT,
+            "keep_alive": keep_alive
+        })
+        response.raise_for_status()
+    return task
+
+
+def ollama_generate_task(session, url: str, model: str, keep_alive: str = OLLAMA_KEEP_ALIVE) -> Callable[[], object]:
+    """Load the LLM and keep it resident (an empty prompt loads the model without generating)"""
+    def task():
+        response = session.post(f"{url}/api/generate", json={
+            "model": model,
+            "prompt": "",
+            "stream": False,
+            "keep_alive": keep_alive
+        })
+        response.raise_for_status()
+    return task
+
+
+def touch_task(index) -> Callable[[], object]:
+    """Fault the pages of a memory-mapped index (VectorIndex or ShardedIndex) into the page cache"""
+    def task():
+        indexes = [shard.index for shard in index.shards] if hasattr(index, "shards") else [index]
+        return sum(i.snapshot.touch() for i in indexes if getattr(i, "snapshot", None) is not None)
+    return task